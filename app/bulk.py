@@ -0,0 +1,167 @@
+"""Bulk suggest/refine runs over many repositories and refs.
+
+Diffs are gathered with bounded parallel git. Requests the response cache
+already answers are finished at once; the rest go out as one Batch API request
+file (see ``app.llm.batch``). Results pass through the same normalizers and
+cache as interactive requests.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+import asyncio
+import os
+import tempfile
+
+from app.diff_exclusions import DiffExclusions
+from app.git_diff_getter import DiffResult, EmptyDiffError, GitDiffError, get_repo_diff_async
+from app.llm.backends import OpenAIBackend
+from app.llm.batch import LocalBatchRunner, OpenAIBatchRunner, write_requests
+from app.llm.budget import PromptBudget
+from app.llm.client import LLMClient, LLMClientError, PreparedRequest
+
+
+@dataclass(frozen=True)
+class BulkTarget:
+    repo: str
+    ref: str | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "BulkTarget":
+        """``PATH`` for a working tree, ``PATH@REF`` for the commits on a ref.
+
+        The split is at the first ``@`` that follows an existing directory, so
+        refs may contain ``@`` themselves (``HEAD@{1}``, ``main@{upstream}``).
+        """
+        spec = spec.strip()
+        if os.path.isdir(spec):
+            return cls(repo=spec)
+        separators = [index for index, char in enumerate(spec) if char == "@" and index > 0]
+        split = next((index for index in separators if os.path.isdir(spec[:index])), None)
+        if split is None:
+            if not separators:
+                return cls(repo=spec)
+            # No such directory: report the path up to the first "@" as the repo.
+            split = separators[0]
+        return cls(repo=spec[:split], ref=spec[split + 1 :] or None)
+
+    @property
+    def label(self) -> str:
+        return f"{self.repo}@{self.ref}" if self.ref else self.repo
+
+
+@dataclass
+class BulkItem:
+    target: BulkTarget
+    # pending, then one of: ok, cached, empty, error (git or prompt), failed (model).
+    status: str = "pending"
+    output: str = ""
+    error: str = ""
+    issues: list[str] = field(default_factory=list)
+
+    def to_json(self) -> dict:
+        return {
+            "repo": self.target.repo,
+            "ref": self.target.ref,
+            "status": self.status,
+            "output": self.output,
+            "error": self.error,
+            "issues": self.issues,
+        }
+
+
+async def run_bulk(
+    targets: list[BulkTarget],
+    client: LLMClient,
+    budget: PromptBudget,
+    *,
+    mode: str = "suggest",
+    last_prompt: str = "",
+    base: str = "HEAD",
+    exclusions: DiffExclusions | None = None,
+    local: bool = False,
+    concurrency: int = 8,
+    poll_seconds: float = 30.0,
+    requests_path: Path | None = None,
+    report: Callable[[BulkItem], None] = lambda item: None,
+    progress: Callable[[str], None] = lambda message: None,
+) -> list[BulkItem]:
+    """Produce one output per target; ``report`` is called as each item reaches its final status."""
+    items = [BulkItem(target) for target in targets]
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def diff_for(item: BulkItem) -> DiffResult | None:
+        async with semaphore:
+            try:
+                return await get_repo_diff_async(
+                    item.target.repo,
+                    max_diff_chars=budget.diff_chars,
+                    exclusions=exclusions,
+                    ref=item.target.ref,
+                    base=base,
+                )
+            except EmptyDiffError as exc:
+                _finish(item, "empty", report, error=str(exc))
+            except GitDiffError as exc:
+                _finish(item, "error", report, error=str(exc))
+            return None
+
+    diffs = await asyncio.gather(*map(diff_for, items))
+    progress(f"Collected {sum(diff is not None for diff in diffs)} of {len(items)} diffs.")
+
+    pending: dict[str, tuple[BulkItem, PreparedRequest]] = {}
+    for index, (item, diff_result) in enumerate(zip(items, diffs)):
+        if diff_result is None:
+            continue
+        try:
+            prepared = client.prepare_request(
+                mode,
+                diff_result.diff_text,
+                last_prompt=last_prompt,
+                budget=budget,
+                diff_truncated=diff_result.was_truncated,
+            )
+        except LLMClientError as exc:
+            _finish(item, "error", report, error=str(exc))
+            continue
+        if prepared.cached is not None:
+            _finish(item, "cached", report, output=prepared.cached)
+        else:
+            pending[f"item-{index}"] = (item, prepared)
+    if not pending:
+        return items
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = requests_path or Path(temp_dir) / "requests.jsonl"
+        write_requests(path, ((custom_id, prepared.body) for custom_id, (_item, prepared) in pending.items()))
+        progress(f"Wrote {len(pending)} requests to {path}.")
+        backend = client.backend
+        if isinstance(backend, OpenAIBackend) and not local:
+            runner = OpenAIBatchRunner(backend.api_key, base_url=backend.base_url, poll_seconds=poll_seconds)
+        else:
+            # Only OpenAI(-compatible) APIs run batches; other backends are sent directly.
+            runner = LocalBatchRunner(client.send_request_async, concurrency=concurrency)
+        results = await runner.run(path, progress)
+
+    for custom_id, (item, prepared) in pending.items():
+        result = results.get(custom_id)
+        if result is None or result.error is not None:
+            _finish(item, "failed", report, error=result.error if result is not None else "No result returned.")
+            continue
+        try:
+            output, issues = client.finish_prepared(prepared, result.text or "")
+        except LLMClientError as exc:
+            _finish(item, "failed", report, error=str(exc))
+            continue
+        item.issues = issues
+        _finish(item, "ok", report, output=output)
+    return items
+
+
+def _finish(item: BulkItem, status: str, report: Callable[[BulkItem], None], output: str = "", error: str = "") -> None:
+    item.status = status
+    item.output = output
+    item.error = error
+    report(item)
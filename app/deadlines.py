@@ -0,0 +1,94 @@
+"""End-to-end request deadlines and cancellation accounting.
+
+Every API request gets a deadline: the ``X-Request-Timeout`` header in
+seconds, capped by the server default. The time left bounds git (through its
+timeout) and the model call (through the retry deadline). When the deadline
+passes or the client disconnects, the request's work is cancelled: asyncio
+cancellation kills running git processes and closes upstream completions and
+streams. ``cancellation_metrics`` counts what was cancelled and why.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import math
+import os
+import threading
+import time
+
+
+DEADLINE_HEADER = "X-Request-Timeout"
+REQUEST_TIMEOUT_ENV_VAR = "SPEC_PROMPT_REQUEST_TIMEOUT_SECONDS"
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 120.0
+
+
+class RequestTimeoutError(TimeoutError):
+    """Raised when a request's work does not finish before its deadline."""
+
+
+class ClientDisconnectedError(RuntimeError):
+    """Raised when the client went away before its request finished."""
+
+
+@dataclass(frozen=True)
+class RequestDeadline:
+    timeout_seconds: float
+    # ``time.monotonic()`` value at which the request's work is cancelled.
+    expires_at: float
+
+    @classmethod
+    def start(cls, timeout_seconds: float) -> "RequestDeadline":
+        return cls(timeout_seconds=timeout_seconds, expires_at=time.monotonic() + timeout_seconds)
+
+    @classmethod
+    def from_header(cls, value: str | None) -> "RequestDeadline":
+        """Deadline for a request with this header value; the header may shorten the server default, not extend it."""
+        default = server_timeout_seconds()
+        if value is None or not value.strip():
+            return cls.start(default)
+        try:
+            requested = float(value)
+        except ValueError:
+            requested = math.nan
+        if not math.isfinite(requested) or requested <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} must be a positive number of seconds, got '{value}'.")
+        return cls.start(min(requested, default))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def bound(self, timeout_seconds: float) -> float:
+        """``timeout_seconds``, shortened to the time left."""
+        return min(timeout_seconds, self.remaining())
+
+
+class CancellationMetrics:
+    """Process-wide counts of requests cut short and the work cancelled with them."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {
+            "deadline_exceeded": 0,
+            "client_disconnects": 0,
+            "git_processes_killed": 0,
+        }
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+cancellation_metrics = CancellationMetrics()
+
+
+def server_timeout_seconds() -> float:
+    raw = os.getenv(REQUEST_TIMEOUT_ENV_VAR, "").strip()
+    try:
+        value = float(raw) if raw else DEFAULT_REQUEST_TIMEOUT_SECONDS
+    except ValueError:
+        return DEFAULT_REQUEST_TIMEOUT_SECONDS
+    return value if math.isfinite(value) and value > 0 else DEFAULT_REQUEST_TIMEOUT_SECONDS
@@ -0,0 +1,133 @@
+"""Path exclusions applied to every git diff invocation.
+
+Exclusions are passed to git as ``:(exclude)`` pathspecs, so excluded files
+are never diffed or read at all rather than being stripped afterwards.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import os
+
+
+EXCLUDES_ENV_VAR = "SPEC_PROMPT_DIFF_EXCLUDES"
+
+VENDORED_PATTERNS = (
+    "**/site-packages/**",
+    "**/node_modules/**",
+    "**/bower_components/**",
+    "**/__pycache__/**",
+    "**/pyvenv.cfg",
+    "**/bin/activate",
+    "**/bin/activate.*",
+    "**/bin/Activate.ps1",
+)
+
+LOCKFILE_PATTERNS = (
+    "**/package-lock.json",
+    "**/npm-shrinkwrap.json",
+    "**/yarn.lock",
+    "**/pnpm-lock.yaml",
+    "**/bun.lockb",
+    "**/poetry.lock",
+    "**/Pipfile.lock",
+    "**/uv.lock",
+    "**/pdm.lock",
+    "**/Cargo.lock",
+    "**/Gemfile.lock",
+    "**/composer.lock",
+    "**/go.sum",
+)
+
+MINIFIED_PATTERNS = (
+    "**/*.min.js",
+    "**/*.min.css",
+    "**/*.js.map",
+    "**/*.css.map",
+)
+
+BINARY_EXTENSIONS = (
+    "png", "jpg", "jpeg", "gif", "bmp", "ico", "webp", "pdf",
+    "zip", "gz", "tgz", "bz2", "xz", "7z", "tar", "jar", "whl", "egg",
+    "so", "dylib", "dll", "exe", "o", "a", "pyc", "pyo", "class",
+    "woff", "woff2", "ttf", "otf", "eot", "mp3", "mp4", "mov", "wav",
+    "sqlite", "sqlite3", "db",
+)
+
+DEFAULT_EXCLUDE_PATTERNS = (
+    *VENDORED_PATTERNS,
+    *LOCKFILE_PATTERNS,
+    *MINIFIED_PATTERNS,
+    *(f"**/*.{extension}" for extension in BINARY_EXTENSIONS),
+)
+
+# Files marked generated/vendored for GitHub linguist or with diff disabled in
+# .gitattributes; git resolves these itself through attr pathspec magic.
+DEFAULT_EXCLUDE_ATTRIBUTES = (
+    "linguist-generated",
+    "linguist-generated=true",
+    "linguist-vendored",
+    "linguist-vendored=true",
+    "-diff",
+)
+
+
+def env_exclude_patterns() -> tuple[str, ...]:
+    """The comma-separated ``SPEC_PROMPT_DIFF_EXCLUDES`` patterns, normalized."""
+    return _normalize_patterns(os.getenv(EXCLUDES_ENV_VAR, "").split(","))
+
+
+@dataclass(frozen=True)
+class DiffExclusions:
+    """Glob patterns and gitattributes that keep paths out of the diff.
+
+    ``env_patterns`` come from ``SPEC_PROMPT_DIFF_EXCLUDES`` when the instance
+    is created. They are kept apart from the built-in defaults, so turning the
+    defaults off still honours the operator's patterns.
+    """
+
+    patterns: tuple[str, ...] = DEFAULT_EXCLUDE_PATTERNS
+    attributes: tuple[str, ...] = DEFAULT_EXCLUDE_ATTRIBUTES
+    env_patterns: tuple[str, ...] = field(default_factory=env_exclude_patterns)
+
+    @classmethod
+    def build(cls, extra_patterns: list[str] | tuple[str, ...] = (), use_defaults: bool = True) -> "DiffExclusions":
+        """Combine defaults, ``SPEC_PROMPT_DIFF_EXCLUDES`` and per-request patterns."""
+        request_patterns = _normalize_patterns(extra_patterns)
+        if not use_defaults:
+            return cls(patterns=request_patterns, attributes=())
+        return cls(patterns=(*DEFAULT_EXCLUDE_PATTERNS, *request_patterns))
+
+    def pathspecs(self) -> list[str]:
+        """Exclude pathspecs, anchored at the repository root."""
+        return [
+            *(f":(exclude,top,glob){pattern}" for pattern in (*self.patterns, *self.env_patterns)),
+            *(f":(exclude,top,attr:{attribute})" for attribute in self.attributes),
+        ]
+
+
+NO_EXCLUSIONS = DiffExclusions(patterns=(), attributes=(), env_patterns=())
+
+
+def _normalize_patterns(patterns: list[str] | tuple[str, ...]) -> tuple[str, ...]:
+    """Translate gitignore-style patterns into root-anchored glob pathspecs.
+
+    ``name`` and ``dir/`` match at any depth (and everything below them),
+    ``/name`` is anchored at the root, and patterns containing ``/`` are kept.
+    """
+    normalized: list[str] = []
+    for raw in patterns:
+        pattern = raw.strip()
+        if not pattern:
+            continue
+        if pattern.startswith("/"):
+            normalized.append(pattern.lstrip("/"))
+            continue
+        if pattern.endswith("/"):
+            normalized.append(f"**/{pattern.rstrip('/')}/**")
+            continue
+        if "/" in pattern:
+            normalized.append(pattern)
+            continue
+        normalized.extend((f"**/{pattern}", f"**/{pattern}/**"))
+    return tuple(normalized)
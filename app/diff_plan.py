@@ -0,0 +1,237 @@
+"""Budget planning over ``git diff --numstat`` output.
+
+The planner decides which changed paths fit the diff budget before any patch
+text is produced, so oversized files (lockfiles, fixtures) are summarized in
+one line instead of crowding everything else out of the prompt. Line counts
+only bound a patch's size, so once the planned patches are fetched the plan is
+redone with estimates scaled to their real size (``rescaled_plan``) to fill the
+budget the first estimate left unused.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import math
+
+
+ESTIMATED_CHARS_PER_CHANGED_LINE = 60
+FILE_HEADER_OVERHEAD_CHARS = 120
+BINARY_PATCH_CHARS = 80
+SUMMARY_RESERVE_CHARS = 400
+MIN_PARTIAL_DIFF_CHARS = 500
+MAX_SUMMARY_PATHS = 20
+MAX_PATHSPECS = 1_000
+# Headroom on the observed patch-size to estimate ratio when planning again.
+RESCALE_HEADROOM = 1.1
+
+PARTIAL_DIFF_MARKER = "... (diff truncated to fit the budget)"
+
+
+@dataclass(frozen=True)
+class NumstatEntry:
+    """One changed path (or rename pair) from ``git diff --numstat -z``."""
+
+    paths: tuple[str, ...]
+    added: int | None
+    deleted: int | None
+
+    @property
+    def is_binary(self) -> bool:
+        return self.added is None
+
+    @property
+    def label(self) -> str:
+        return " => ".join(self.paths)
+
+    @property
+    def estimated_chars(self) -> int:
+        overhead = FILE_HEADER_OVERHEAD_CHARS + 2 * sum(len(path) for path in self.paths)
+        if self.is_binary:
+            return overhead + BINARY_PATCH_CHARS
+        changed = (self.added or 0) + (self.deleted or 0)
+        return overhead + changed * ESTIMATED_CHARS_PER_CHANGED_LINE
+
+    def describe(self) -> str:
+        if self.is_binary:
+            return f"{self.label} (binary)"
+        return f"{self.label} (+{self.added} -{self.deleted})"
+
+
+@dataclass(frozen=True)
+class SectionPlan:
+    """What to fetch for one diff section (unstaged or staged)."""
+
+    included: tuple[NumstatEntry, ...]
+    partial: NumstatEntry | None
+    omitted: tuple[NumstatEntry, ...]
+
+    def patch_pathspecs(self) -> list[str]:
+        """Pathspecs selecting ``included``; empty means the whole section."""
+        excluded = [*self.omitted, *([self.partial] if self.partial else [])]
+        include_count = sum(len(entry.paths) for entry in self.included)
+        exclude_count = sum(len(entry.paths) for entry in excluded)
+        if exclude_count == 0:
+            return []
+        if include_count <= exclude_count:
+            return [f":(top,literal){path}" for entry in self.included for path in entry.paths]
+        return [f":(exclude,top,literal){path}" for entry in excluded for path in entry.paths]
+
+    def partial_pathspecs(self) -> list[str]:
+        if self.partial is None:
+            return []
+        return [f":(top,literal){path}" for path in self.partial.paths]
+
+    def summary_line(self) -> str:
+        if not self.omitted:
+            return ""
+        listed = ", ".join(entry.describe() for entry in self.omitted[:MAX_SUMMARY_PATHS])
+        remainder = len(self.omitted) - MAX_SUMMARY_PATHS
+        if remainder > 0:
+            listed += f", and {remainder} more"
+        count = len(self.omitted)
+        noun = "file" if count == 1 else "files"
+        return f"Omitted to fit the diff budget ({count} {noun}): {listed}"
+
+
+@dataclass(frozen=True)
+class DiffPlan:
+    sections: tuple[SectionPlan, ...]
+    partial_limit: int
+    # Characters the included patches may take: the budget less headers and summary lines.
+    patch_budget: int
+
+    @property
+    def omitted_paths(self) -> tuple[str, ...]:
+        return tuple(path for section in self.sections for entry in section.omitted for path in entry.paths)
+
+    @property
+    def drops_content(self) -> bool:
+        return any(section.omitted or section.partial for section in self.sections)
+
+    @property
+    def included(self) -> tuple[NumstatEntry, ...]:
+        return tuple(entry for section in self.sections for entry in section.included)
+
+
+def parse_numstat(output: str) -> list[NumstatEntry]:
+    """Parse ``git diff --numstat -z`` output, including rename records."""
+    tokens = output.split("\0")
+    entries: list[NumstatEntry] = []
+    index = 0
+    while index < len(tokens):
+        record = tokens[index]
+        index += 1
+        if not record:
+            continue
+        added, deleted, path = record.split("\t", 2)
+        if path:
+            paths: tuple[str, ...] = (path,)
+        else:
+            paths = (tokens[index], tokens[index + 1])
+            index += 2
+        entries.append(
+            NumstatEntry(
+                paths=paths,
+                added=None if added == "-" else int(added),
+                deleted=None if deleted == "-" else int(deleted),
+            )
+        )
+    return entries
+
+
+def plan_sections(
+    section_entries: list[list[NumstatEntry]],
+    budget: int,
+    overhead: int,
+    scale: float = 1.0,
+) -> DiffPlan | None:
+    """Fit whole files into ``budget`` smallest-first across all sections.
+
+    Each file costs its estimate times ``scale``. At most one file that does
+    not fit is kept as a partial diff when enough budget remains. Returns
+    ``None`` when the plan would need more pathspecs than a single git
+    invocation should carry.
+    """
+    reserve = sum(SUMMARY_RESERVE_CHARS for entries in section_entries if entries)
+    patch_budget = budget - overhead - reserve
+    remaining = patch_budget
+
+    ranked = sorted(
+        ((entry.estimated_chars, section_index, position, entry)
+         for section_index, entries in enumerate(section_entries)
+         for position, entry in enumerate(entries)),
+        key=lambda item: item[:3],
+    )
+    included: set[tuple[int, int]] = set()
+    omitted: list[tuple[int, int]] = []
+    for estimate, section_index, position, _entry in ranked:
+        estimate = math.ceil(estimate * scale)
+        if estimate <= remaining:
+            included.add((section_index, position))
+            remaining -= estimate
+        else:
+            omitted.append((section_index, position))
+
+    partial_key = None
+    if omitted and remaining >= MIN_PARTIAL_DIFF_CHARS:
+        partial_key = omitted.pop(0)
+
+    plans: list[SectionPlan] = []
+    omitted_keys = set(omitted)
+    for section_index, entries in enumerate(section_entries):
+        keyed = list(enumerate(entries))
+        plan = SectionPlan(
+            included=tuple(entry for position, entry in keyed if (section_index, position) in included),
+            partial=next(
+                (entry for position, entry in keyed if (section_index, position) == partial_key),
+                None,
+            ),
+            omitted=tuple(entry for position, entry in keyed if (section_index, position) in omitted_keys),
+        )
+        if len(plan.patch_pathspecs()) > MAX_PATHSPECS:
+            return None
+        plans.append(plan)
+
+    return DiffPlan(sections=tuple(plans), partial_limit=max(remaining, 0), patch_budget=patch_budget)
+
+
+def rescaled_plan(
+    section_entries: list[list[NumstatEntry]],
+    plan: DiffPlan,
+    budget: int,
+    overhead: int,
+    patch_chars: int,
+) -> DiffPlan | None:
+    """Plan again with estimates scaled to the ``patch_chars`` fetched for ``plan``'s files.
+
+    Scaling keeps the smallest-first order, so the new plan includes every
+    file ``plan`` did and more. Returns ``None`` when it would add nothing.
+    """
+    estimated = sum(entry.estimated_chars for entry in plan.included)
+    if not plan.drops_content or not estimated:
+        return None
+    scale = patch_chars / estimated * RESCALE_HEADROOM
+    if scale >= 1.0:
+        return None
+    rescaled = plan_sections(section_entries, budget, overhead, scale)
+    if rescaled is None or len(rescaled.included) <= len(plan.included):
+        return None
+    return rescaled
+
+
+def compose_section(plan: SectionPlan, patch: str, partial: str, partial_limit: int) -> str:
+    """Join a section's summary line, fetched patch and partial patch.
+
+    The summary goes first so the final character cut never removes it.
+    """
+    parts = []
+    summary = plan.summary_line()
+    if summary:
+        parts.append(summary)
+    if patch:
+        parts.append(patch)
+    if partial:
+        if len(partial) > partial_limit:
+            partial = partial[:partial_limit].rstrip() + "\n" + PARTIAL_DIFF_MARKER
+        parts.append(partial)
+    return "\n".join(parts)
@@ -2,12 +2,46 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
 from pathlib import Path
+from typing import Hashable
+import asyncio
+import codecs
+import io
+import locale
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+
+from app.deadlines import cancellation_metrics
+from app.diff_exclusions import DiffExclusions
+from app.diff_plan import DiffPlan, compose_section, parse_numstat, plan_sections, rescaled_plan
 
 
 DEFAULT_MAX_DIFF_CHARS = 120_000
+DEFAULT_GIT_TIMEOUT_SECONDS = 30.0
+READ_CHUNK_CHARS = 64 * 1024
+
+UNSTAGED_HEADER = "### UNSTAGED CHANGES\n"
+STAGED_HEADER = "### STAGED CHANGES\n"
+SECTION_SEPARATOR = "\n\n"
+SINCE_LAST_HEADER = "### CHANGES SINCE LAST PROMPT\n"
+REF_HEADER = "### CHANGES ON {ref} SINCE {base}\n"
+DIFF_SECTIONS = ((UNSTAGED_HEADER, ("diff",)), (STAGED_HEADER, ("diff", "--cached")))
+
+# Per-worktree ref holding the tree of the working copy as of the last prompt.
+SNAPSHOT_REF = "refs/worktree/spec-prompt/last"
+
+DEFAULT_FINGERPRINT_TTL_SECONDS = 15.0
+DEFAULT_MAX_CACHED_REPOS = 32
+MAX_CACHED_OUTPUTS_PER_REPO = 16
+# Spellings of a repo path (subdirectories, symlinks) remembered per cached repo.
+MAX_CACHED_PATHS_PER_REPO = 4
+RACY_MTIME_WINDOW_NS = 1_000_000_000
 
 
 class GitDiffError(RuntimeError):
@@ -22,6 +56,10 @@ class EmptyDiffError(GitDiffError):
     """Raised when no staged/unstaged changes are present."""
 
 
+class GitTimeoutError(GitDiffError):
+    """Raised when git does not finish within the allowed time."""
+
+
 @dataclass(frozen=True)
 class DiffResult:
     """Normalized git diff payload consumed by CLI and API layers."""
@@ -29,62 +67,831 @@ class DiffResult:
     diff_text: str
     was_truncated: bool
     warning: str
+    omitted_paths: tuple[str, ...] = ()
+    snapshot: str = ""
+
+
+def get_repo_diff(
+    repo_path: str,
+    max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+    plan: bool = True,
+    exclusions: DiffExclusions | None = None,
+    since_last: bool = False,
+    ref: str | None = None,
+    base: str = "HEAD",
+) -> DiffResult:
+    """Return staged + unstaged diff text from the given git repository path.
+
+    Git output is read incrementally and each git process is killed as soon as
+    the character budget is known to be exceeded, so a huge dirty tree costs
+    roughly ``max_diff_chars`` of reading instead of the full diff. The staged
+    diff is only spawned when the unstaged diff left budget to spare.
+
+    When the diff does not fit and ``plan`` is set, a ``--numstat`` pass picks
+    the files that fit the budget and only their patches are fetched; the rest
+    are listed in a summary line (see ``app.diff_plan``).
+
+    Paths matched by ``exclusions`` (vendored trees, lockfiles, binaries and
+    generated files by default) are excluded through git pathspecs.
 
+    With ``since_last`` the diff is taken against the snapshot recorded by
+    ``record_diff_snapshot`` instead of HEAD, falling back to the full diff
+    when no snapshot exists yet. ``DiffResult.snapshot`` then holds the tree to
+    record once the prompt has been sent. It is empty when the delta was
+    truncated or files were omitted, so the unsent changes come back next time.
 
-def get_repo_diff(repo_path: str, max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS) -> DiffResult:
-    """Return staged + unstaged diff text from the given git repository path."""
+    With ``ref`` the diff is the committed changes on ``ref`` since it forked
+    from ``base`` (``git diff base...ref``) instead of the working tree.
+    """
     repo = _validate_repo_path(repo_path)
+    exclusions = DiffExclusions() if exclusions is None else exclusions
+    if ref is not None:
+        return _repo_diff(repo, max_diff_chars, plan, exclusions, _ref_sections(ref, base))
+    if not since_last:
+        return _repo_diff(repo, max_diff_chars, plan, exclusions, DIFF_SECTIONS)
 
-    unstaged = _run_git(repo, ["diff"])
-    staged = _run_git(repo, ["diff", "--cached"])
+    current = _snapshot_tree(repo)
+    diff_sections = _since_last_sections(repo, _last_snapshot(repo), current)
+    return _with_snapshot(_repo_diff(repo, max_diff_chars, plan, exclusions, diff_sections), current)
 
+
+def record_diff_snapshot(repo_path: str, snapshot: str) -> None:
+    """Remember ``snapshot`` as the base for the next ``since_last`` diff."""
+    repo = _validate_repo_path(repo_path)
+    _run_git(repo, ["update-ref", "-m", "spec-prompt: record prompt snapshot", SNAPSHOT_REF, snapshot])
+
+
+def _repo_diff(
+    repo: Path,
+    max_diff_chars: int,
+    plan: bool,
+    exclusions: DiffExclusions,
+    diff_sections: tuple,
+) -> DiffResult:
     sections: list[str] = []
-    if unstaged.strip():
-        sections.append("### UNSTAGED CHANGES\n" + unstaged.strip())
-    if staged.strip():
-        sections.append("### STAGED CHANGES\n" + staged.strip())
+    used = 0
+    for header, args in diff_sections:
+        if used > max_diff_chars:
+            break
+        separator = len(SECTION_SEPARATOR) if sections else 0
+        limit = max(max_diff_chars - used - separator - len(header), 0)
+        content = _read_git_bounded(repo, _diff_args(args, exclusions), limit=limit)
+        if content:
+            sections.append(header + content)
+            used += separator + len(header) + len(content)
+
+    result = _build_diff_result(sections, max_diff_chars)
+    if not plan or not result.was_truncated:
+        return result
+    return _planned_repo_diff(repo, max_diff_chars, exclusions, diff_sections) or result
+
+
+def _planned_repo_diff(
+    repo: Path,
+    max_diff_chars: int,
+    exclusions: DiffExclusions,
+    diff_sections: tuple,
+) -> DiffResult | None:
+    section_stats = [
+        parse_numstat(_run_git(repo, _diff_args((*args, "--numstat", "-z"), exclusions)))
+        for _header, args in diff_sections
+    ]
+    overhead = _sections_overhead(diff_sections, section_stats)
+    diff_plan = plan_sections(section_stats, max_diff_chars, overhead=overhead)
+    if diff_plan is None:
+        return None
+
+    def fetch_patches(plan: DiffPlan) -> list[str]:
+        return [
+            _read_git_bounded(repo, _diff_args(args, exclusions, section.patch_pathspecs()), limit=max_diff_chars)
+            if section.included
+            else ""
+            for (_header, args), section in zip(diff_sections, plan.sections)
+        ]
+
+    patches = fetch_patches(diff_plan)
+    rescaled = rescaled_plan(section_stats, diff_plan, max_diff_chars, overhead, sum(map(len, patches)))
+    if rescaled is not None:
+        rescaled_patches = fetch_patches(rescaled)
+        if sum(map(len, rescaled_patches)) <= rescaled.patch_budget:
+            diff_plan, patches = rescaled, rescaled_patches
+
+    contents: list[str] = []
+    for (_header, args), section, patch in zip(diff_sections, diff_plan.sections, patches):
+        partial = ""
+        if section.partial is not None:
+            partial_args = _diff_args(args, exclusions, section.partial_pathspecs())
+            partial = _read_git_bounded(repo, partial_args, limit=diff_plan.partial_limit)
+        contents.append(compose_section(section, patch, partial, diff_plan.partial_limit))
+    return _build_planned_result(diff_sections, diff_plan, contents, max_diff_chars)
+
+
+async def get_repo_diff_async(
+    repo_path: str,
+    max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+    timeout_seconds: float | None = DEFAULT_GIT_TIMEOUT_SECONDS,
+    plan: bool = True,
+    exclusions: DiffExclusions | None = None,
+    since_last: bool = False,
+    ref: str | None = None,
+    base: str = "HEAD",
+) -> DiffResult:
+    """Asyncio variant of ``get_repo_diff`` for use inside the event loop.
+
+    The unstaged and staged diffs run concurrently. Cancelling the caller or
+    exceeding ``timeout_seconds`` kills any git process still running.
+    """
+    exclusions = DiffExclusions() if exclusions is None else exclusions
+    try:
+        collect = _collect_repo_diff_async(repo_path, max_diff_chars, plan, exclusions, since_last, ref, base)
+        return await asyncio.wait_for(collect, timeout_seconds)
+    except asyncio.TimeoutError as exc:
+        raise GitTimeoutError(f"Git did not finish within {timeout_seconds:g} seconds.") from exc
+
+
+async def record_diff_snapshot_async(repo_path: str, snapshot: str) -> None:
+    """Asyncio variant of ``record_diff_snapshot``."""
+    repo = await _validate_repo_path_async(repo_path)
+    await _run_git_async(repo, ["update-ref", "-m", "spec-prompt: record prompt snapshot", SNAPSHOT_REF, snapshot])
+
+
+async def _collect_repo_diff_async(
+    repo_path: str,
+    max_diff_chars: int,
+    plan: bool,
+    exclusions: DiffExclusions,
+    since_last: bool,
+    ref: str | None,
+    base: str,
+) -> DiffResult:
+    repo = await _validate_repo_path_async(repo_path)
+    if ref is not None:
+        return await _repo_diff_async(repo, max_diff_chars, plan, exclusions, _ref_sections(ref, base))
+    if not since_last:
+        return await _repo_diff_async(repo, max_diff_chars, plan, exclusions, DIFF_SECTIONS)
+
+    current, base = await asyncio.gather(_snapshot_tree_async(repo), _last_snapshot_async(repo))
+    diff_sections = _since_last_sections(repo, base, current)
+    result = await _repo_diff_async(repo, max_diff_chars, plan, exclusions, diff_sections)
+    return _with_snapshot(result, current)
+
+
+async def _repo_diff_async(
+    repo: Path,
+    max_diff_chars: int,
+    plan: bool,
+    exclusions: DiffExclusions,
+    diff_sections: tuple,
+) -> DiffResult:
+    # Each section is bounded as if it were the only one; the exact cut is
+    # applied by _build_diff_result once all are known.
+    limits = [max(max_diff_chars - len(header), 0) for header, _args in diff_sections]
+    tasks = [
+        asyncio.ensure_future(_read_git_bounded_async(repo, _diff_args(args, exclusions), limit=limit))
+        for (_header, args), limit in zip(diff_sections, limits)
+    ]
+    contents: list[str] = []
+    try:
+        for task, limit in zip(tasks, limits):
+            content = await task
+            contents.append(content)
+            if len(content) > limit:
+                break
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    sections = [header + content for (header, _args), content in zip(diff_sections, contents) if content]
+    result = _build_diff_result(sections, max_diff_chars)
+    if not plan or not result.was_truncated:
+        return result
+    return await _planned_repo_diff_async(repo, max_diff_chars, exclusions, diff_sections) or result
+
+
+async def _planned_repo_diff_async(
+    repo: Path,
+    max_diff_chars: int,
+    exclusions: DiffExclusions,
+    diff_sections: tuple,
+) -> DiffResult | None:
+    numstat_outputs = await asyncio.gather(
+        *(_run_git_async(repo, _diff_args((*args, "--numstat", "-z"), exclusions)) for _header, args in diff_sections)
+    )
+    section_stats = [parse_numstat(output) for output in numstat_outputs]
+    overhead = _sections_overhead(diff_sections, section_stats)
+    diff_plan = plan_sections(section_stats, max_diff_chars, overhead=overhead)
+    if diff_plan is None:
+        return None
+
+    async def fetch(args: tuple[str, ...], pathspecs: list[str], limit: int, wanted: bool) -> str:
+        if not wanted:
+            return ""
+        return await _read_git_bounded_async(repo, _diff_args(args, exclusions, pathspecs), limit=limit)
+
+    async def fetch_patches(plan: DiffPlan) -> list[str]:
+        return await asyncio.gather(
+            *(
+                fetch(args, section.patch_pathspecs(), max_diff_chars, bool(section.included))
+                for (_header, args), section in zip(diff_sections, plan.sections)
+            )
+        )
+
+    patches = await fetch_patches(diff_plan)
+    rescaled = rescaled_plan(section_stats, diff_plan, max_diff_chars, overhead, sum(map(len, patches)))
+    if rescaled is not None:
+        rescaled_patches = await fetch_patches(rescaled)
+        if sum(map(len, rescaled_patches)) <= rescaled.patch_budget:
+            diff_plan, patches = rescaled, rescaled_patches
 
+    partials = await asyncio.gather(
+        *(
+            fetch(args, section.partial_pathspecs(), diff_plan.partial_limit, section.partial is not None)
+            for (_header, args), section in zip(diff_sections, diff_plan.sections)
+        )
+    )
+    contents = [
+        compose_section(section, patch, partial, diff_plan.partial_limit)
+        for section, patch, partial in zip(diff_plan.sections, patches, partials)
+    ]
+    return _build_planned_result(diff_sections, diff_plan, contents, max_diff_chars)
+
+
+def _sections_overhead(diff_sections: tuple, section_stats: list[list]) -> int:
+    present = [header for (header, _args), stats in zip(diff_sections, section_stats) if stats]
+    return sum(len(header) for header in present) + len(SECTION_SEPARATOR) * max(len(present) - 1, 0)
+
+
+def _diff_args(args: tuple[str, ...], exclusions: DiffExclusions, pathspecs: list[str] = ()) -> list[str]:
+    specs = [*pathspecs, *exclusions.pathspecs()]
+    if not specs:
+        return list(args)
+    if all(spec.startswith(":(exclude") for spec in specs):
+        specs.insert(0, ":(top)")
+    return [*args, "--", *specs]
+
+
+def _build_planned_result(
+    diff_sections: tuple,
+    diff_plan: DiffPlan,
+    contents: list[str],
+    max_diff_chars: int,
+) -> DiffResult:
+    sections = [
+        header + content
+        for (header, _args), content in zip(diff_sections, contents)
+        if content
+    ]
+    return _build_diff_result(
+        sections,
+        max_diff_chars,
+        omitted_paths=diff_plan.omitted_paths,
+        dropped_content=diff_plan.drops_content,
+    )
+
+
+def _build_diff_result(
+    sections: list[str],
+    max_diff_chars: int,
+    omitted_paths: tuple[str, ...] = (),
+    dropped_content: bool = False,
+) -> DiffResult:
     if not sections:
         raise EmptyDiffError("No staged or unstaged changes found in the repository.")
 
-    full_diff = "\n\n".join(sections).strip()
-    if len(full_diff) <= max_diff_chars:
-        return DiffResult(diff_text=full_diff, was_truncated=False, warning="")
-
-    truncated = full_diff[:max_diff_chars].rstrip()
+    full_diff = SECTION_SEPARATOR.join(sections).strip()
     warning = (
         f"Warning: git diff exceeded {max_diff_chars} characters and was truncated "
         "before sending to the model."
     )
-    return DiffResult(diff_text=truncated, was_truncated=True, warning=warning)
+    if len(full_diff) <= max_diff_chars:
+        if dropped_content:
+            return DiffResult(diff_text=full_diff, was_truncated=True, warning=warning, omitted_paths=omitted_paths)
+        return DiffResult(diff_text=full_diff, was_truncated=False, warning="")
+
+    truncated = full_diff[:max_diff_chars].rstrip()
+    return DiffResult(diff_text=truncated, was_truncated=True, warning=warning, omitted_paths=omitted_paths)
 
 
 def _validate_repo_path(repo_path: str) -> Path:
-    path = Path(repo_path).expanduser().resolve()
-    if not path.exists() or not path.is_dir():
-        raise InvalidRepoPathError(f"Invalid repo path: '{repo_path}' does not exist.")
+    path = _existing_dir(repo_path)
+    # Plain work trees are recognized without forking git; anything unusual
+    # (bare repos, GIT_DIR overrides, paths inside .git) goes through rev-parse.
+    if _has_git_marker(path):
+        return path
 
     try:
         check = _run_git(path, ["rev-parse", "--is-inside-work-tree"])
     except GitDiffError as exc:
         raise InvalidRepoPathError(f"Path is not a git repository: '{repo_path}'.") from exc
+    return _checked_work_tree(repo_path, path, check)
+
+
+async def _validate_repo_path_async(repo_path: str) -> Path:
+    path = _existing_dir(repo_path)
+    if _has_git_marker(path):
+        return path
+
+    try:
+        check = await _run_git_async(path, ["rev-parse", "--is-inside-work-tree"])
+    except GitDiffError as exc:
+        raise InvalidRepoPathError(f"Path is not a git repository: '{repo_path}'.") from exc
+    return _checked_work_tree(repo_path, path, check)
+
+
+def _existing_dir(repo_path: str) -> Path:
+    path = Path(repo_path).expanduser().resolve()
+    if not path.exists() or not path.is_dir():
+        raise InvalidRepoPathError(f"Invalid repo path: '{repo_path}' does not exist.")
+    return path
 
+
+def _checked_work_tree(repo_path: str, path: Path, check: str) -> Path:
     if check.strip().lower() != "true":
         raise InvalidRepoPathError(f"Path is not a git repository: '{repo_path}'.")
     return path
 
 
-def _run_git(repo_path: Path, args: list[str]) -> str:
+def _has_git_marker(path: Path) -> bool:
+    return _find_worktree_root(path) is not None
+
+
+def _find_worktree_root(path: Path) -> Path | None:
+    if ".git" in path.parts:
+        return None
+    for candidate in (path, *path.parents):
+        if (candidate / ".git").exists():
+            return candidate
+    return None
+
+
+def _git_command(repo_path: Path, args: list[str]) -> list[str]:
+    return ["git", "-C", str(repo_path), *args]
+
+
+def _git_failure(args: list[str], stderr: str) -> GitDiffError:
+    message = stderr.strip() or "Unknown git command failure."
+    return GitDiffError(f"Git command failed ({' '.join(args)}): {message}")
+
+
+def _run_git(repo_path: Path, args: list[str], env: dict[str, str] | None = None) -> str:
     try:
         completed = subprocess.run(
-            ["git", "-C", str(repo_path), *args],
+            _git_command(repo_path, args),
             check=True,
             capture_output=True,
             text=True,
+            env=env,
         )
     except subprocess.CalledProcessError as exc:
-        stderr = (exc.stderr or "").strip()
-        message = stderr or "Unknown git command failure."
-        raise GitDiffError(f"Git command failed ({' '.join(args)}): {message}") from exc
+        raise _git_failure(args, exc.stderr or "") from exc
 
     return completed.stdout
+
+
+def _read_git_bounded(repo_path: Path, args: list[str], limit: int) -> str:
+    """Stream git stdout and return its stripped text, stopping past ``limit``.
+
+    The result is exact when it is at most ``limit`` characters long. A longer
+    result is an exact prefix of the stripped output; git has already been
+    killed at that point and the rest of its output is never produced.
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            _git_command(repo_path, args),
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+        assert process.stdout is not None
+        reader = io.TextIOWrapper(process.stdout, errors="replace")
+        chunks: list[str] = []
+        size = 0
+        reached_eof = False
+        try:
+            while True:
+                chunk = reader.read(READ_CHUNK_CHARS)
+                if not chunk:
+                    reached_eof = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > limit:
+                    buffered = "".join(chunks).lstrip()
+                    if len(buffered.rstrip()) > limit:
+                        return buffered.rstrip()
+                    chunks = [buffered]
+                    size = len(buffered)
+        finally:
+            if not reached_eof:
+                process.kill()
+            reader.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr_file.seek(0)
+            raise _git_failure(args, stderr_file.read().decode(errors="replace"))
+
+    return "".join(chunks).strip()
+
+
+async def _run_git_async(repo_path: Path, args: list[str], env: dict[str, str] | None = None) -> str:
+    process = await asyncio.create_subprocess_exec(
+        *_git_command(repo_path, args),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        _count_killed(process)
+        raise
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0:
+        raise _git_failure(args, stderr.decode(errors="replace"))
+    return stdout.decode(locale.getpreferredencoding(False), errors="replace")
+
+
+async def _read_git_bounded_async(repo_path: Path, args: list[str], limit: int) -> str:
+    """Asyncio counterpart of ``_read_git_bounded`` with the same result contract."""
+    process = await asyncio.create_subprocess_exec(
+        *_git_command(repo_path, args),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stdout is not None and process.stderr is not None
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    # Same decoding as the text-mode pipe used by the sync reader.
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace"),
+        translate=True,
+    )
+    chunks: list[str] = []
+    size = 0
+    reached_eof = False
+    try:
+        while True:
+            data = await process.stdout.read(READ_CHUNK_CHARS)
+            chunk = decoder.decode(data, final=not data)
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+            if not data:
+                reached_eof = True
+                break
+            if size > limit:
+                buffered = "".join(chunks).lstrip()
+                if len(buffered.rstrip()) > limit:
+                    return buffered.rstrip()
+                chunks = [buffered]
+                size = len(buffered)
+    except asyncio.CancelledError:
+        _count_killed(process)
+        raise
+    finally:
+        if not reached_eof and process.returncode is None:
+            process.kill()
+        returncode = await process.wait()
+        stderr = await stderr_task
+
+    if returncode != 0:
+        raise _git_failure(args, stderr.decode(errors="replace"))
+    return "".join(chunks).strip()
+
+
+def _count_killed(process: asyncio.subprocess.Process) -> None:
+    # A cancelled request (deadline or disconnect) kills the git it was waiting on.
+    if process.returncode is None:
+        cancellation_metrics.add("git_processes_killed")
+
+
+def _with_snapshot(result: DiffResult, current: str) -> DiffResult:
+    # Recording a snapshot marks every change up to it as seen; only do that
+    # when the whole delta was sent.
+    if result.was_truncated or result.omitted_paths:
+        return result
+    return replace(result, snapshot=current)
+
+
+def _since_last_sections(repo: Path, base: str | None, current: str) -> tuple:
+    if base is None:
+        return DIFF_SECTIONS
+    if base == current:
+        raise EmptyDiffError(f"No changes since the last prompt in {repo}.")
+    return ((SINCE_LAST_HEADER, ("diff", base, current)),)
+
+
+def _ref_sections(ref: str, base: str) -> tuple:
+    for name in (ref, base):
+        # A leading dash would be read by git as an option.
+        if not name or name.startswith("-"):
+            raise GitDiffError(f"Invalid git ref: '{name}'.")
+    return ((REF_HEADER.format(ref=ref, base=base), ("diff", f"{base}...{ref}")),)
+
+
+def _snapshot_tree(repo: Path) -> str:
+    """Write the tracked working-tree content as a tree object and return its id.
+
+    ``git add -u`` runs against a throwaway copy of the index, so the real
+    index is untouched; only blob and tree objects are added to the object
+    store. Untracked files are left out, matching the staged + unstaged diff.
+    """
+    index_path = _run_git(repo, ["rev-parse", "--path-format=absolute", "--git-path", "index"]).strip()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = _snapshot_env(index_path, temp_dir)
+        _run_git(repo, ["add", "--update"], env=env)
+        return _run_git(repo, ["write-tree"], env=env).strip()
+
+
+async def _snapshot_tree_async(repo: Path) -> str:
+    index_path = (await _run_git_async(repo, ["rev-parse", "--path-format=absolute", "--git-path", "index"])).strip()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = _snapshot_env(index_path, temp_dir)
+        await _run_git_async(repo, ["add", "--update"], env=env)
+        return (await _run_git_async(repo, ["write-tree"], env=env)).strip()
+
+
+def _snapshot_env(index_path: str, temp_dir: str) -> dict[str, str]:
+    temp_index = os.path.join(temp_dir, "index")
+    if os.path.exists(index_path):
+        # Keep the index mtime: git rechecks the content of files modified in
+        # the same second as the index, and a fresh mtime would hide those edits.
+        shutil.copy2(index_path, temp_index)
+    return {**os.environ, "GIT_INDEX_FILE": temp_index}
+
+
+def _last_snapshot(repo: Path) -> str | None:
+    try:
+        return _run_git(repo, ["rev-parse", "--quiet", "--verify", f"{SNAPSHOT_REF}^{{tree}}"]).strip()
+    except GitDiffError:
+        return None
+
+
+async def _last_snapshot_async(repo: Path) -> str | None:
+    try:
+        return (await _run_git_async(repo, ["rev-parse", "--quiet", "--verify", f"{SNAPSHOT_REF}^{{tree}}"])).strip()
+    except GitDiffError:
+        return None
+
+
+@dataclass(frozen=True)
+class _GitDirs:
+    toplevel: str
+    git_dir: str
+    common_dir: str
+
+
+@dataclass
+class _WorktreeEntry:
+    fingerprint: tuple
+    tracked_paths: tuple[str, ...]
+    created_at: float
+    diffs: dict[tuple, DiffResult] = field(default_factory=dict)
+    outputs: OrderedDict = field(default_factory=OrderedDict)
+
+
+class WorktreeCache:
+    """In-process cache of diffs and model outputs keyed by working-tree state.
+
+    Validity is decided by ``get_worktree_fingerprint`` without forking git.
+    The fingerprint covers HEAD, the refs, the index and the stat data of every
+    tracked file (the diff never includes untracked ones), so any edit that
+    could change the diff drops the entry. Files changed within a second of
+    the read are not trusted, as in git's racy-clean check, and entries still
+    expire after ``ttl_seconds``.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_FINGERPRINT_TTL_SECONDS,
+        max_repos: int = DEFAULT_MAX_CACHED_REPOS,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_repos = max_repos
+        self._entries: OrderedDict[str, _WorktreeEntry] = OrderedDict()
+        # LRU of requested repo paths to their git dirs, bounded like ``_entries``.
+        self._dirs_by_path: OrderedDict[str, _GitDirs] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_diff(
+        self,
+        repo_path: str,
+        max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+        exclusions: DiffExclusions | None = None,
+    ) -> DiffResult:
+        """Return ``get_repo_diff`` output, reusing it while the tree is unchanged."""
+        repo = _validate_repo_path(repo_path)
+        dirs, entry = self._lookup(repo_path, repo)
+        if dirs is None:
+            return get_repo_diff(str(repo), max_diff_chars=max_diff_chars, exclusions=exclusions)
+        diff_key = (max_diff_chars, exclusions)
+        if entry is not None and diff_key in entry.diffs:
+            return entry.diffs[diff_key]
+
+        started_ns = time.time_ns()
+        before = _repo_state(dirs)
+        diff_result = get_repo_diff(str(repo), max_diff_chars=max_diff_chars, exclusions=exclusions)
+        tracked_paths = None
+        if entry is None:
+            tracked_paths = _split_z(_run_git(repo, ["ls-files", "-z"]))
+        self._store(dirs, entry, diff_key, diff_result, started_ns, before, tracked_paths)
+        return diff_result
+
+    async def get_diff_async(
+        self,
+        repo_path: str,
+        max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+        timeout_seconds: float | None = DEFAULT_GIT_TIMEOUT_SECONDS,
+        exclusions: DiffExclusions | None = None,
+    ) -> DiffResult:
+        """Asyncio variant of ``get_diff`` built on ``get_repo_diff_async``."""
+        repo = await _validate_repo_path_async(repo_path)
+        dirs, entry = self._lookup(repo_path, repo)
+        if dirs is None:
+            return await get_repo_diff_async(str(repo), max_diff_chars, timeout_seconds, exclusions=exclusions)
+        diff_key = (max_diff_chars, exclusions)
+        if entry is not None and diff_key in entry.diffs:
+            return entry.diffs[diff_key]
+
+        started_ns = time.time_ns()
+        before = _repo_state(dirs)
+        diff_result = await get_repo_diff_async(str(repo), max_diff_chars, timeout_seconds, exclusions=exclusions)
+        tracked_paths = None
+        if entry is None:
+            tracked_paths = _split_z(await _run_git_async(repo, ["ls-files", "-z"]))
+        self._store(dirs, entry, diff_key, diff_result, started_ns, before, tracked_paths)
+        return diff_result
+
+    def get_output(self, repo_path: str, key: Hashable) -> str | None:
+        """Return a cached model output for ``key`` if the tree is unchanged."""
+        dirs = self._known_dirs(repo_path)
+        entry = self._current_entry(dirs) if dirs is not None else None
+        if entry is None:
+            return None
+        with self._lock:
+            output = entry.outputs.get(key)
+            if output is not None:
+                entry.outputs.move_to_end(key)
+            return output
+
+    def put_output(self, repo_path: str, key: Hashable, diff_result: DiffResult, output: str) -> None:
+        """Attach ``output`` to the entry that produced ``diff_result``, if still current."""
+        dirs = self._known_dirs(repo_path)
+        entry = self._current_entry(dirs) if dirs is not None else None
+        if entry is None or not any(cached is diff_result for cached in entry.diffs.values()):
+            return
+        with self._lock:
+            entry.outputs[key] = output
+            entry.outputs.move_to_end(key)
+            while len(entry.outputs) > MAX_CACHED_OUTPUTS_PER_REPO:
+                entry.outputs.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirs_by_path.clear()
+
+    def _lookup(self, repo_path: str, repo: Path) -> tuple[_GitDirs | None, _WorktreeEntry | None]:
+        dirs = _locate_git_dirs(repo)
+        if dirs is None:
+            return None, None
+        with self._lock:
+            self._dirs_by_path[repo_path] = dirs
+            self._dirs_by_path.move_to_end(repo_path)
+            while len(self._dirs_by_path) > self.max_repos * MAX_CACHED_PATHS_PER_REPO:
+                self._dirs_by_path.popitem(last=False)
+        return dirs, self._current_entry(dirs)
+
+    def _known_dirs(self, repo_path: str) -> _GitDirs | None:
+        with self._lock:
+            dirs = self._dirs_by_path.get(repo_path)
+            if dirs is not None:
+                self._dirs_by_path.move_to_end(repo_path)
+            return dirs
+
+    def _store(
+        self,
+        dirs: _GitDirs,
+        entry: _WorktreeEntry | None,
+        diff_key: tuple,
+        diff_result: DiffResult,
+        started_ns: int,
+        before: tuple,
+        tracked_paths: tuple[str, ...] | None,
+    ) -> None:
+        if entry is None:
+            assert tracked_paths is not None
+            fingerprint = _fingerprint(dirs, tracked_paths)
+            if fingerprint[0] != before or _is_racy(fingerprint, started_ns):
+                return
+            entry = _WorktreeEntry(fingerprint=fingerprint, tracked_paths=tracked_paths, created_at=time.monotonic())
+        elif _fingerprint(dirs, entry.tracked_paths) != entry.fingerprint:
+            return
+
+        with self._lock:
+            entry.diffs[diff_key] = diff_result
+            self._entries[dirs.toplevel] = entry
+            self._entries.move_to_end(dirs.toplevel)
+            while len(self._entries) > self.max_repos:
+                self._entries.popitem(last=False)
+
+    def _current_entry(self, dirs: _GitDirs) -> _WorktreeEntry | None:
+        with self._lock:
+            entry = self._entries.get(dirs.toplevel)
+        if entry is None:
+            return None
+        expired = time.monotonic() - entry.created_at > self.ttl_seconds
+        if expired or _fingerprint(dirs, entry.tracked_paths) != entry.fingerprint:
+            with self._lock:
+                if self._entries.get(dirs.toplevel) is entry:
+                    del self._entries[dirs.toplevel]
+            return None
+        return entry
+
+
+def get_worktree_fingerprint(repo_path: str, paths: tuple[str, ...] = ()) -> tuple | None:
+    """Return a stat-based fingerprint of HEAD, the index and the work-tree ``paths``.
+
+    Only reads files under ``.git`` and stats the given paths, so it costs one
+    ``stat`` per path and no git process. Returns ``None`` for layouts it
+    cannot read directly (bare repos, ``GIT_DIR`` overrides).
+    """
+    dirs = _locate_git_dirs(Path(repo_path).expanduser().resolve())
+    if dirs is None:
+        return None
+    return _fingerprint(dirs, paths)
+
+
+def _split_z(output: str) -> tuple[str, ...]:
+    return tuple(output.split("\0")[:-1])
+
+
+def _fingerprint(dirs: _GitDirs, paths: tuple[str, ...]) -> tuple:
+    toplevel = dirs.toplevel
+    return (
+        _repo_state(dirs),
+        tuple(_stat_key(os.path.join(toplevel, path)) for path in paths),
+    )
+
+
+def _repo_state(dirs: _GitDirs) -> tuple:
+    try:
+        with open(os.path.join(dirs.git_dir, "HEAD"), encoding="utf-8") as head_file:
+            head = head_file.read().strip()
+    except OSError:
+        head = ""
+    ref_stat = None
+    if head.startswith("ref:"):
+        ref_stat = _stat_key(os.path.join(dirs.common_dir, head[4:].strip()))
+    return (
+        head,
+        ref_stat,
+        _stat_key(os.path.join(dirs.common_dir, "packed-refs")),
+        _stat_key(os.path.join(dirs.git_dir, "index")),
+    )
+
+
+def _stat_key(path: str) -> tuple[int, int, int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size, stat.st_ino)
+
+
+def _is_racy(fingerprint: tuple, started_ns: int) -> bool:
+    """True when a fingerprinted file changed too close to the read to trust its stat."""
+    repo_state, path_stats = fingerprint
+    stats = [repo_state[3], *path_stats]
+    return any(stat is not None and stat[0] >= started_ns - RACY_MTIME_WINDOW_NS for stat in stats)
+
+
+def _locate_git_dirs(path: Path) -> _GitDirs | None:
+    if os.environ.get("GIT_DIR") or os.environ.get("GIT_INDEX_FILE"):
+        return None
+    toplevel = _find_worktree_root(path)
+    if toplevel is None:
+        return None
+
+    marker = toplevel / ".git"
+    if marker.is_dir():
+        git_dir = marker
+    else:
+        try:
+            content = marker.read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+        if not content.startswith("gitdir:"):
+            return None
+        git_dir = (toplevel / content[len("gitdir:"):].strip()).resolve()
+
+    common_dir = git_dir
+    try:
+        common_dir = (git_dir / (git_dir / "commondir").read_text(encoding="utf-8").strip()).resolve()
+    except OSError:
+        pass
+    return _GitDirs(toplevel=str(toplevel), git_dir=str(git_dir), common_dir=str(common_dir))
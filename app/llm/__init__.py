@@ -1,12 +1,16 @@
 """LLM helpers for suggest/refine flows."""
 
+from .backends import ChatBackend, LocalBackend, OpenAIBackend
 from .client import LLMClient, LLMClientError, MissingAPIKeyError
 from .prompt_builder import build_refine_prompt, build_suggest_prompt
 
 __all__ = [
+    "ChatBackend",
     "LLMClient",
     "LLMClientError",
+    "LocalBackend",
     "MissingAPIKeyError",
+    "OpenAIBackend",
     "build_refine_prompt",
     "build_suggest_prompt",
 ]
@@ -0,0 +1,163 @@
+"""OpenAI Batch API request and result files.
+
+Bulk runs write one ``/v1/chat/completions`` request per line in the Batch
+API's JSONL input format, hand the file to a runner and read the results back
+from the Batch API's output format. ``OpenAIBatchRunner`` submits the file to
+the Batch API (half the price of direct requests, results within the
+completion window). ``LocalBatchRunner`` is a stand-in that sends the same
+requests directly with bounded concurrency and writes an output file in the
+same format.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable
+import asyncio
+import json
+
+from app.llm.pool import get_client_registry
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Uploading a large request file can take longer than one completion.
+FILE_TIMEOUT_SECONDS = 300.0
+# Consecutive failed polls before giving up; the batch keeps running upstream.
+MAX_POLL_FAILURES = 5
+
+
+class BatchError(RuntimeError):
+    """Raised when a batch cannot be submitted or ends without results."""
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    custom_id: str
+    text: str | None = None
+    error: str | None = None
+
+
+def write_requests(path: Path, requests: Iterable[tuple[str, dict]]) -> int:
+    """Write ``(custom_id, body)`` pairs as Batch API input lines; returns how many."""
+    count = 0
+    with path.open("w", encoding="utf-8") as handle:
+        for custom_id, body in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_results(lines: Iterable[str]) -> dict[str, BatchResult]:
+    """Parse Batch API output or error file lines, keyed by ``custom_id``."""
+    results: dict[str, BatchResult] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id", "")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error"):
+            results[custom_id] = BatchResult(custom_id, error=_error_message(record["error"]))
+        elif response.get("status_code") != 200:
+            message = _error_message(body.get("error")) or f"HTTP {response.get('status_code')}"
+            results[custom_id] = BatchResult(custom_id, error=message)
+        elif not body.get("choices"):
+            results[custom_id] = BatchResult(custom_id, error="OpenAI returned no completion choices.")
+        else:
+            results[custom_id] = BatchResult(custom_id, text=body["choices"][0]["message"].get("content") or "")
+    return results
+
+
+class OpenAIBatchRunner:
+    """Submits a request file to the Batch API and polls until it finishes."""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str | None = None,
+        poll_seconds: float = 30.0,
+        completion_window: str = COMPLETION_WINDOW,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = base_url
+        self.poll_seconds = poll_seconds
+        self.completion_window = completion_window
+
+    async def run(self, requests_path: Path, progress: Callable[[str], None]) -> dict[str, BatchResult]:
+        client = get_client_registry().get_async(self.api_key, FILE_TIMEOUT_SECONDS, self.base_url)
+        try:
+            with requests_path.open("rb") as handle:
+                uploaded = await client.files.create(file=handle, purpose="batch")
+            batch = await client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=self.completion_window,
+            )
+        except Exception as exc:  # pragma: no cover - external SDK behavior
+            raise BatchError(f"Could not submit the batch: {exc}") from exc
+        progress(f"Submitted batch {batch.id}.")
+
+        failures = 0
+        while batch.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                batch = await client.batches.retrieve(batch.id)
+            except Exception as exc:  # pragma: no cover - external SDK behavior
+                # Polling is idempotent; try again on the next tick.
+                failures += 1
+                progress(f"Polling batch {batch.id} failed: {exc}")
+                if failures >= MAX_POLL_FAILURES:
+                    raise BatchError(f"Gave up polling batch {batch.id} after {failures} failures.") from exc
+                continue
+            failures = 0
+            counts = batch.request_counts
+            if counts is not None:
+                progress(
+                    f"Batch {batch.id}: {batch.status}, {counts.completed}/{counts.total} done, {counts.failed} failed."
+                )
+
+        results: dict[str, BatchResult] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await client.files.content(file_id)
+                results.update(read_results(content.text.splitlines()))
+        if not results and batch.status != "completed":
+            raise BatchError(f"Batch {batch.id} ended as {batch.status} without results.")
+        return results
+
+
+class LocalBatchRunner:
+    """Runs a request file by sending each request directly; for local runs and small jobs."""
+
+    def __init__(self, send: Callable[[dict], Awaitable[dict]], concurrency: int = 8) -> None:
+        self.send = send
+        self.concurrency = max(concurrency, 1)
+
+    async def run(self, requests_path: Path, progress: Callable[[str], None]) -> dict[str, BatchResult]:
+        requests = [json.loads(line) for line in requests_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(request: dict) -> dict:
+            async with semaphore:
+                try:
+                    body = await self.send(request["body"])
+                except Exception as exc:
+                    return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(exc)}}
+            return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+
+        progress(f"Sending {len(requests)} requests directly.")
+        lines = [json.dumps(record, ensure_ascii=False) for record in await asyncio.gather(*map(one, requests))]
+        output_path = requests_path.with_name(f"{requests_path.stem}.output.jsonl")
+        output_path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+        return read_results(lines)
+
+
+def _error_message(error) -> str:
+    if isinstance(error, dict):
+        return str(error.get("message") or error.get("code") or error)
+    return str(error) if error else ""
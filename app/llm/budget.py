@@ -0,0 +1,127 @@
+"""Token budget for one suggest/refine request, keyed by model.
+
+The model's context window is divided between the prompt template, the
+previous prompt (refine mode), the diff and the completion. The diff share is
+also turned into a character bound so git never reads much more than the
+prompt can carry.
+
+Once the prompt is built, ``adaptive_output_tokens`` narrows the completion to
+what the mode and request size call for, so small requests do not reserve
+(and pay latency for) room they will not use.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ModelLimits:
+    context_tokens: int
+    max_output_tokens: int
+
+
+DEFAULT_MODEL_LIMITS = ModelLimits(context_tokens=128_000, max_output_tokens=4_096)
+
+# Matched by longest prefix, so dated snapshots share their family's limits.
+MODEL_LIMITS = {
+    "gpt-5": ModelLimits(context_tokens=400_000, max_output_tokens=128_000),
+    "gpt-4.1": ModelLimits(context_tokens=1_047_576, max_output_tokens=32_768),
+    "gpt-4o": ModelLimits(context_tokens=128_000, max_output_tokens=16_384),
+    "gpt-4-turbo": ModelLimits(context_tokens=128_000, max_output_tokens=4_096),
+    "gpt-4-32k": ModelLimits(context_tokens=32_768, max_output_tokens=4_096),
+    "gpt-4": ModelLimits(context_tokens=8_192, max_output_tokens=4_096),
+    "gpt-3.5-turbo": ModelLimits(context_tokens=16_385, max_output_tokens=4_096),
+    "o1": ModelLimits(context_tokens=200_000, max_output_tokens=100_000),
+    "o3": ModelLimits(context_tokens=200_000, max_output_tokens=100_000),
+    "o4-mini": ModelLimits(context_tokens=200_000, max_output_tokens=100_000),
+}
+
+# Upper bound on characters per token for diff text (long runs of spaces and
+# repeated punctuation compress best); used to bound how much git output to read.
+MAX_DIFF_CHARS_PER_TOKEN = 8
+# Share of the input room the previous prompt may take when the diff needs it.
+LAST_PROMPT_SHARE = 0.25
+# Headroom for the truncation note and counting error.
+PROMPT_SLACK_TOKENS = 64
+# Completion tokens per mode by request size: (input tokens up to, output
+# tokens). No tier is below the old fixed 1,200, so answers are not cut off
+# mid-section; refine rewrites the whole previous prompt, so it gets more.
+OUTPUT_TOKEN_TIERS = {
+    "suggest": ((1_000, 1_200), (4_000, 1_400), (None, 1_600)),
+    "refine": ((1_000, 1_300), (4_000, 1_500), (None, 1_600)),
+}
+
+
+class BudgetError(ValueError):
+    """Raised when a model's context window cannot hold the prompt template."""
+
+
+@dataclass(frozen=True)
+class PromptBudget:
+    model: str
+    limits: ModelLimits
+    output_tokens: int
+    overhead_tokens: int
+    last_prompt_tokens: int
+    diff_tokens: int
+
+    @property
+    def diff_chars(self) -> int:
+        """Most diff characters worth reading to fill ``diff_tokens``."""
+        return self.diff_tokens * MAX_DIFF_CHARS_PER_TOKEN
+
+
+def model_limits(model: str) -> ModelLimits:
+    name = model.strip().lower()
+    for prefix in sorted(MODEL_LIMITS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_LIMITS[prefix]
+    return DEFAULT_MODEL_LIMITS
+
+
+def plan_budget(
+    model: str,
+    *,
+    max_output_tokens: int,
+    max_diff_tokens: int,
+    overhead_tokens: int,
+    last_prompt_tokens: int = 0,
+) -> PromptBudget:
+    """Split ``model``'s context window between template, last prompt, diff and output.
+
+    ``max_diff_tokens`` caps the diff even when the window has more room, to
+    keep requests fast and cheap. The previous prompt keeps up to
+    ``LAST_PROMPT_SHARE`` of the input room, or more when the diff does not
+    need the rest.
+    """
+    limits = model_limits(model)
+    output_tokens = max(min(max_output_tokens, limits.max_output_tokens), 1)
+    room = limits.context_tokens - output_tokens - overhead_tokens - PROMPT_SLACK_TOKENS
+    if room <= 0:
+        raise BudgetError(
+            f"Model '{model}' has a {limits.context_tokens}-token context window, which cannot hold "
+            f"the prompt template and {output_tokens} output tokens."
+        )
+
+    last_prompt_room = max(int(room * LAST_PROMPT_SHARE), room - max_diff_tokens)
+    last_prompt_budget = min(last_prompt_tokens, last_prompt_room)
+    return PromptBudget(
+        model=model,
+        limits=limits,
+        output_tokens=output_tokens,
+        overhead_tokens=overhead_tokens,
+        last_prompt_tokens=last_prompt_budget,
+        diff_tokens=max(min(max_diff_tokens, room - last_prompt_budget), 0),
+    )
+
+
+def adaptive_output_tokens(mode: str, input_tokens: int, max_output_tokens: int) -> int:
+    """Completion budget for a ``mode`` request with ``input_tokens`` of diff and previous prompt.
+
+    Never more than ``max_output_tokens``, the room the budget was planned with.
+    """
+    for limit, output_tokens in OUTPUT_TOKEN_TIERS.get(mode, ()):
+        if limit is None or input_tokens <= limit:
+            return max(min(output_tokens, max_output_tokens), 1)
+    return max_output_tokens
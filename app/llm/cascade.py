@@ -0,0 +1,48 @@
+"""Per-tier metrics for the model cascade.
+
+With ``OPENAI_MODEL_CASCADE`` set, each request tries the listed models in
+order and keeps the first answer that passes the output quality check. Every
+tier records its latency and what happened to its answer: accepted, escalated
+to the next tier because of quality issues, failed (lower tiers then escalate
+too), or, for the last tier, returned despite issues.
+"""
+
+from __future__ import annotations
+
+import threading
+
+from app.llm.resilience import LatencyWindow
+
+
+OUTCOMES = ("accepted", "escalated", "errors", "unresolved")
+
+
+class CascadeMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tiers: dict[str, tuple[dict[str, int], LatencyWindow]] = {}
+
+    def record(self, model: str, seconds: float, outcome: str) -> None:
+        with self._lock:
+            tier = self._tiers.get(model)
+            if tier is None:
+                tier = self._tiers[model] = (dict.fromkeys(OUTCOMES, 0), LatencyWindow())
+            tier[0][outcome] += 1
+        tier[1].record(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tiers = {model: (dict(counters), window) for model, (counters, window) in self._tiers.items()}
+        stats = {}
+        for model, (counters, window) in tiers.items():
+            calls = sum(counters.values())
+            stats[model] = {
+                "calls": calls,
+                **counters,
+                "escalation_rate": round(counters["escalated"] / calls, 4) if calls else 0.0,
+                "latency_seconds": {"p50": window.percentile(50), "p95": window.percentile(95)},
+            }
+        return stats
+
+
+cascade_metrics = CascadeMetrics()
@@ -2,17 +2,46 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from contextlib import closing
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+import asyncio
 import os
+import time
 
-from openai import OpenAI
+import openai
 
+from app.llm.backends import (
+    BACKEND_ENV_VAR,
+    BACKENDS,
+    BASE_URL_ENV_VAR,
+    ChatBackend,
+    LocalBackend,
+    OpenAIBackend,
+)
+from app.llm.budget import PromptBudget, adaptive_output_tokens, plan_budget
+from app.llm.cascade import cascade_metrics
 from app.llm.prompt_builder import (
+    DEFAULT_MAX_DIFF_TOKENS,
+    NORMALIZER_VERSION,
+    PromptPackage,
     build_refine_prompt,
     build_suggest_prompt,
+    SectionNormalizer,
     normalize_refine_output,
     normalize_suggest_output,
+    refine_output_issues,
+    refine_output_normalizer,
+    suggest_output_issues,
+    suggest_output_normalizer,
 )
+from app.llm.rate_limit import RateLimitWaitError, get_rate_limiter
+from app.llm.resilience import RetryPolicy, call_with_retries, call_with_retries_async, upstream_metrics
+from app.llm.response_cache import get_response_cache, response_key
+from app.llm.similarity_cache import get_similarity_cache
+from app.llm.single_flight import request_flights
+from app.llm.tokens import get_token_counter
 
 
 DEFAULT_MODEL = "gpt-4o-mini"
@@ -26,72 +55,880 @@ class MissingAPIKeyError(LLMClientError):
     """Raised when OPENAI_API_KEY is missing."""
 
 
+class UpstreamTimeoutError(LLMClientError):
+    """Raised when the model backend does not answer within the request deadline."""
+
+
+class RateLimitedError(LLMClientError):
+    """Raised when the client-side rate limiter cannot admit a request in time."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 @dataclass(frozen=True)
 class LLMConfig:
     model: str = DEFAULT_MODEL
     temperature: float = 0.2
-    max_tokens: int = 1200
+    # Ceiling on completion tokens; with ``adaptive_output`` each request uses
+    # the share its mode and size call for (``app.llm.budget.OUTPUT_TOKEN_TIERS``).
+    max_tokens: int = 1600
     timeout_seconds: float = 30.0
+    max_diff_tokens: int = DEFAULT_MAX_DIFF_TOKENS
+    retry: RetryPolicy = RetryPolicy()
+    # Models to try cheapest first; later ones only see requests the earlier ones answered poorly.
+    cascade: tuple[str, ...] = ()
+    # "openai" (OpenAI or the OpenAI-compatible API at ``base_url``) or "local".
+    backend: str = "openai"
+    base_url: str | None = None
+    adaptive_output: bool = True
 
     @classmethod
     def from_env(cls) -> "LLMConfig":
         model = os.getenv("OPENAI_MODEL", DEFAULT_MODEL).strip() or DEFAULT_MODEL
-        return cls(model=model)
+        cascade = tuple(name.strip() for name in os.getenv("OPENAI_MODEL_CASCADE", "").split(",") if name.strip())
+        return cls(
+            model=cascade[0] if cascade else model,
+            cascade=cascade if len(cascade) > 1 else (),
+            max_tokens=_int_env("OPENAI_MAX_OUTPUT_TOKENS", cls.max_tokens),
+            max_diff_tokens=_int_env("SPEC_PROMPT_MAX_DIFF_TOKENS", cls.max_diff_tokens),
+            retry=RetryPolicy.from_env(),
+            backend=os.getenv(BACKEND_ENV_VAR, "").strip().lower() or cls.backend,
+            base_url=os.getenv(BASE_URL_ENV_VAR, "").strip() or None,
+            adaptive_output=os.getenv("SPEC_PROMPT_ADAPTIVE_OUTPUT", "").strip().lower()
+            not in {"0", "false", "no", "off"},
+        )
+
+    @property
+    def models(self) -> tuple[str, ...]:
+        return self.cascade or (self.model,)
+
+
+def plan_request_budget(config: LLMConfig, mode: str, last_prompt: str = "") -> PromptBudget:
+    """Token budget for one ``suggest`` or ``refine`` request with ``config``.
+
+    Callers fetch the diff with ``budget.diff_chars`` and pass the budget on to
+    ``LLMClient`` so the diff is read, truncated and sent against one plan.
+    """
+    plans = []
+    for model in config.models:
+        last_prompt_tokens = get_token_counter(model).count(last_prompt.strip()) if last_prompt else 0
+        plans.append(
+            plan_budget(
+                model,
+                max_output_tokens=config.max_tokens,
+                max_diff_tokens=config.max_diff_tokens,
+                overhead_tokens=_template_tokens(mode, model),
+                last_prompt_tokens=last_prompt_tokens,
+            )
+        )
+    # A cascade sends the same prompt to every tier, so the tightest plan must hold.
+    return min(plans, key=lambda plan: (plan.diff_tokens, plan.output_tokens))
+
+
+def plan_analysis_budgets(config: LLMConfig, last_prompt: str) -> tuple[PromptBudget, PromptBudget]:
+    """Suggest and refine budgets for an ``analyze`` request over one diff.
+
+    Read the diff once with the larger ``diff_chars`` of the two; each prompt
+    then trims it to its own budget.
+    """
+    return plan_request_budget(config, "suggest"), plan_request_budget(config, "refine", last_prompt)
 
 
 class LLMClient:
-    """Small wrapper around OpenAI chat completions for this app."""
+    """Small wrapper around chat completions for this app."""
 
-    def __init__(self, api_key: str | None = None, config: LLMConfig | None = None) -> None:
-        resolved_key = (api_key or os.getenv("OPENAI_API_KEY", "")).strip()
-        if not resolved_key:
-            raise MissingAPIKeyError("Missing OPENAI_API_KEY in environment.")
+    def __init__(
+        self,
+        api_key: str | None = None,
+        config: LLMConfig | None = None,
+        use_cache: bool = True,
+        backend: ChatBackend | None = None,
+        deadline: float | None = None,
+    ) -> None:
+        """``use_cache=False`` skips cached responses but still stores the fresh one.
 
+        ``backend`` overrides the one ``config.backend`` selects. ``deadline`` is
+        the ``time.monotonic()`` value the caller's request ends at; retries stop
+        there even when ``config.retry`` would allow more time.
+        """
         self.config = config or LLMConfig.from_env()
-        self._client = OpenAI(api_key=resolved_key, timeout=self.config.timeout_seconds)
+        self.deadline = deadline
+        self.backend = backend or _create_backend(self.config, api_key)
+        self._use_cache = use_cache
+        self._cache = get_response_cache()
+        self._similar = get_similarity_cache()
+        self._limiter = get_rate_limiter()
 
-    def suggest_from_diff(self, diff_text: str) -> str:
-        package = build_suggest_prompt(diff_text)
-        model_output = self._complete(
-            system_prompt=package.system_prompt,
-            user_prompt=package.user_prompt,
+    def suggest_from_diff(
+        self,
+        diff_text: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> str:
+        """Suggest the next prompt; ``diff_truncated`` marks a diff already cut while reading."""
+        package, budget = self._suggest_package(diff_text, budget)
+        normalized = self._generate(package, budget, _SUGGEST_OUTPUT)
+        return _prepend_truncation_warning(normalized, _truncation_warning(budget, package, diff_truncated))
+
+    async def suggest_from_diff_async(
+        self,
+        diff_text: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> str:
+        """Like ``suggest_from_diff`` without blocking the event loop during generation."""
+        package, budget = self._suggest_package(diff_text, budget)
+        normalized = await self._generate_async(package, budget, _SUGGEST_OUTPUT)
+        return _prepend_truncation_warning(normalized, _truncation_warning(budget, package, diff_truncated))
+
+    def refine_from_diff(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> str:
+        package, budget = self._refine_package(diff_text, last_prompt, budget)
+        normalized = self._generate(package, budget, _REFINE_OUTPUT)
+        return _prepend_truncation_warning(normalized, _truncation_warning(budget, package, diff_truncated))
+
+    async def refine_from_diff_async(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> str:
+        """Like ``refine_from_diff`` without blocking the event loop during generation."""
+        package, budget = self._refine_package(diff_text, last_prompt, budget)
+        normalized = await self._generate_async(package, budget, _REFINE_OUTPUT)
+        return _prepend_truncation_warning(normalized, _truncation_warning(budget, package, diff_truncated))
+
+    def stream_suggest_from_diff(
+        self,
+        diff_text: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> Iterator[str]:
+        """Yield the normalized suggestion as the model produces it, truncation warning first.
+
+        The pieces join to exactly what ``suggest_from_diff`` returns.
+        """
+        package, budget = self._suggest_package(diff_text, budget)
+        yield from _with_leading_warning(_truncation_warning(budget, package, diff_truncated))
+        yield from self._generate_stream(package, budget, _SUGGEST_OUTPUT)
+
+    async def stream_suggest_from_diff_async(
+        self,
+        diff_text: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> AsyncIterator[str]:
+        package, budget = self._suggest_package(diff_text, budget)
+        for piece in _with_leading_warning(_truncation_warning(budget, package, diff_truncated)):
+            yield piece
+        async for piece in self._generate_stream_async(package, budget, _SUGGEST_OUTPUT):
+            yield piece
+
+    def stream_refine_from_diff(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> Iterator[str]:
+        """Yield the normalized critique and rewrite as the model produces it, truncation warning first."""
+        package, budget = self._refine_package(diff_text, last_prompt, budget)
+        yield from _with_leading_warning(_truncation_warning(budget, package, diff_truncated))
+        yield from self._generate_stream(package, budget, _REFINE_OUTPUT)
+
+    async def stream_refine_from_diff_async(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> AsyncIterator[str]:
+        package, budget = self._refine_package(diff_text, last_prompt, budget)
+        for piece in _with_leading_warning(_truncation_warning(budget, package, diff_truncated)):
+            yield piece
+        async for piece in self._generate_stream_async(package, budget, _REFINE_OUTPUT):
+            yield piece
+
+    async def analyze_from_diff_async(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        suggest_budget: PromptBudget | None = None,
+        refine_budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> "Analysis":
+        """Suggest and refine from one diff, running both completions concurrently.
+
+        The two outputs carry no truncation warning; ``Analysis.warning`` holds
+        the shared one.
+        """
+        suggest_package, suggest_budget = self._suggest_package(diff_text, suggest_budget)
+        refine_package, refine_budget = self._refine_package(diff_text, last_prompt, refine_budget)
+        suggestion, refinement = await _gather_all(
+            self._generate_async(suggest_package, suggest_budget, _SUGGEST_OUTPUT),
+            self._generate_async(refine_package, refine_budget, _REFINE_OUTPUT),
         )
-        normalized = normalize_suggest_output(model_output)
-        return _prepend_truncation_warning(normalized, package.truncation_note)
+        warning = _shared_truncation_warning(
+            diff_truncated,
+            (suggest_budget, suggest_package),
+            (refine_budget, refine_package),
+        )
+        return Analysis(suggest=suggestion, refine=refinement, warning=warning)
+
+    async def stream_analyze_from_diff_async(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        suggest_budget: PromptBudget | None = None,
+        refine_budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> AsyncIterator[tuple[str, str]]:
+        """Yield ``(mode, piece)`` as either completion produces output, interleaved.
+
+        A ``("warning", text)`` comes first when the diff was truncated. The
+        pieces of each mode join to what ``analyze_from_diff_async`` returns
+        for it.
+        """
+        suggest_package, suggest_budget = self._suggest_package(diff_text, suggest_budget)
+        refine_package, refine_budget = self._refine_package(diff_text, last_prompt, refine_budget)
+        warning = _shared_truncation_warning(
+            diff_truncated,
+            (suggest_budget, suggest_package),
+            (refine_budget, refine_package),
+        )
+        if warning:
+            yield "warning", warning
+        streams = {
+            "suggest": self._generate_stream_async(suggest_package, suggest_budget, _SUGGEST_OUTPUT),
+            "refine": self._generate_stream_async(refine_package, refine_budget, _REFINE_OUTPUT),
+        }
+        async for item in _merged(streams):
+            yield item
+
+    def prepare_request(
+        self,
+        mode: str,
+        diff_text: str,
+        last_prompt: str = "",
+        budget: PromptBudget | None = None,
+        diff_truncated: bool = False,
+    ) -> "PreparedRequest":
+        """Build a request for ``mode`` without sending it, for bulk submission.
 
-    def refine_from_diff(self, diff_text: str, last_prompt: str) -> str:
+        Bulk requests go to ``config.model`` only; a cascade's quality check is
+        reported by ``finish_prepared`` instead of escalating.
+        """
+        if mode == "refine":
+            package, budget = self._refine_package(diff_text, last_prompt, budget)
+            output = _REFINE_OUTPUT
+        else:
+            package, budget = self._suggest_package(diff_text, budget)
+            output = _SUGGEST_OUTPUT
+        slot = self._cache_slot(package, budget)
+        warning = _truncation_warning(budget, package, diff_truncated)
+        cached = self._cached(slot)
+        return PreparedRequest(
+            body=self._request_args(package, budget, self.config.model),
+            prompt_tokens=package.prompt_tokens,
+            cached=None if cached is None else _prepend_truncation_warning(cached, warning),
+            warning=warning,
+            slot=slot,
+            output=output,
+        )
+
+    def finish_prepared(self, prepared: "PreparedRequest", model_output: str) -> tuple[str, list[str]]:
+        """Normalize a bulk result as the interactive methods would; returns it and its quality issues.
+
+        Results with issues are not cached when a cascade would have escalated them.
+        """
+        if not model_output.strip():
+            raise LLMClientError(f"{self.backend.label} returned an empty completion.")
+        normalized = prepared.output.normalize(model_output.strip())
+        issues = prepared.output.issues(normalized)
+        if not (issues and self.config.cascade):
+            self._store(prepared.slot, normalized)
+        return _prepend_truncation_warning(normalized, prepared.warning), issues
+
+    async def send_request_async(self, body: dict) -> dict:
+        """Send one chat completion request body, with retries and rate limiting; returns the response JSON."""
+        messages = [message.get("content") or "" for message in body.get("messages", [])]
+        prompt_tokens = get_token_counter(body.get("model", self.config.model)).count_chat(*messages)
+        try:
+            text = await call_with_retries_async(
+                lambda remaining: self._attempt_async(self.backend.complete_async, body, prompt_tokens, remaining),
+                self._retry_policy(),
+            )
+        except asyncio.CancelledError:
+            upstream_metrics.add("cancelled")
+            raise
+        except Exception as exc:  # pragma: no cover - external SDK behavior
+            raise _client_error(exc, self.backend.label) from exc
+        return {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        }
+
+    def _suggest_package(self, diff_text: str, budget: PromptBudget | None) -> tuple[PromptPackage, PromptBudget]:
+        budget = budget or plan_request_budget(self.config, "suggest")
+        package = build_suggest_prompt(
+            diff_text,
+            max_diff_tokens=budget.diff_tokens,
+            model=self.config.model,
+        )
+        return package, self._output_budget("suggest", package, budget)
+
+    def _refine_package(
+        self,
+        diff_text: str,
+        last_prompt: str,
+        budget: PromptBudget | None,
+    ) -> tuple[PromptPackage, PromptBudget]:
         if not last_prompt or not last_prompt.strip():
             raise LLMClientError("Refine mode requires a non-empty last prompt.")
 
-        package = build_refine_prompt(diff_text=diff_text, last_prompt=last_prompt)
-        model_output = self._complete(
-            system_prompt=package.system_prompt,
-            user_prompt=package.user_prompt,
+        budget = budget or plan_request_budget(self.config, "refine", last_prompt)
+        package = build_refine_prompt(
+            diff_text=diff_text,
+            last_prompt=last_prompt,
+            max_diff_tokens=budget.diff_tokens,
+            model=self.config.model,
+            max_last_prompt_tokens=budget.last_prompt_tokens,
+        )
+        return package, self._output_budget("refine", package, budget)
+
+    def _output_budget(self, mode: str, package: PromptPackage, budget: PromptBudget) -> PromptBudget:
+        """Narrow the completion budget to this request's mode and size."""
+        if not self.config.adaptive_output:
+            return budget
+        input_tokens = max(package.prompt_tokens - _template_tokens(mode, self.config.model), 0)
+        return replace(budget, output_tokens=adaptive_output_tokens(mode, input_tokens, budget.output_tokens))
+
+    def _generate(self, package: PromptPackage, budget: PromptBudget, output: "_OutputFormat") -> str:
+        slot = self._cache_slot(package, budget)
+        cached = self._cached(slot)
+        if cached is not None:
+            return cached
+        *lower, last = self.config.models
+        deadline = self._retry_deadline()
+        for model in lower:
+            started = time.monotonic()
+            try:
+                normalized = output.normalize(self._complete(package, budget, model, deadline))
+            except LLMClientError as exc:
+                self._tier_failed(model, started, exc)
+                continue
+            if self._tier_accepts(model, started, normalized, output):
+                break
+        else:
+            started = time.monotonic()
+            try:
+                normalized = output.normalize(self._complete(package, budget, last, deadline))
+            except LLMClientError as exc:
+                if lower:
+                    self._tier_failed(last, started, exc, final=True)
+                raise
+            if lower:
+                self._tier_accepts(last, started, normalized, output, final=True)
+        self._store(slot, normalized)
+        return normalized
+
+    async def _generate_async(
+        self,
+        package: PromptPackage,
+        budget: PromptBudget,
+        output: "_OutputFormat",
+    ) -> str:
+        slot = self._cache_slot(package, budget)
+        cached = await self._cached_async(slot)
+        if cached is not None:
+            return cached
+
+        async def produce() -> AsyncIterator[str]:
+            *lower, last = self.config.models
+            deadline = self._retry_deadline()
+            for model in lower:
+                started = time.monotonic()
+                try:
+                    normalized = output.normalize(await self._complete_async(package, budget, model, deadline))
+                except LLMClientError as exc:
+                    self._tier_failed(model, started, exc)
+                    continue
+                if self._tier_accepts(model, started, normalized, output):
+                    break
+            else:
+                started = time.monotonic()
+                try:
+                    normalized = output.normalize(await self._complete_async(package, budget, last, deadline))
+                except LLMClientError as exc:
+                    if lower:
+                        self._tier_failed(last, started, exc, final=True)
+                    raise
+                if lower:
+                    self._tier_accepts(last, started, normalized, output, final=True)
+            await self._store_async(slot, normalized)
+            yield normalized
+
+        # Concurrent identical requests share one completion (and a stream's, if one is running).
+        return "".join([piece async for piece in request_flights.stream(slot.key, produce)])
+
+    def _generate_stream(
+        self,
+        package: PromptPackage,
+        budget: PromptBudget,
+        output: "_OutputFormat",
+    ) -> Iterator[str]:
+        slot = self._cache_slot(package, budget)
+        cached = self._cached(slot)
+        if cached is not None:
+            yield cached
+            return
+        # Lower cascade tiers are checked before anything is shown; only the last one streams.
+        *lower, last = self.config.models
+        deadline = self._retry_deadline()
+        for model in lower:
+            started = time.monotonic()
+            try:
+                normalized = output.normalize(self._complete(package, budget, model, deadline))
+            except LLMClientError as exc:
+                self._tier_failed(model, started, exc)
+                continue
+            if self._tier_accepts(model, started, normalized, output):
+                self._store(slot, normalized)
+                yield normalized
+                return
+        started = time.monotonic()
+        normalizer = output.normalizer()
+        try:
+            for piece in _normalized(self._stream(package, budget, last, deadline), normalizer):
+                yield piece
+        except LLMClientError as exc:
+            if lower:
+                self._tier_failed(last, started, exc, final=True)
+            raise
+        # The batch form of what was streamed; differs only if the model reopened a closed section.
+        normalized = normalizer.text
+        if lower:
+            self._tier_accepts(last, started, normalized, output, final=True)
+        self._store(slot, normalized)
+
+    async def _generate_stream_async(
+        self,
+        package: PromptPackage,
+        budget: PromptBudget,
+        output: "_OutputFormat",
+    ) -> AsyncIterator[str]:
+        slot = self._cache_slot(package, budget)
+        cached = await self._cached_async(slot)
+        if cached is not None:
+            yield cached
+            return
+
+        async def produce() -> AsyncIterator[str]:
+            *lower, last = self.config.models
+            deadline = self._retry_deadline()
+            for model in lower:
+                started = time.monotonic()
+                try:
+                    normalized = output.normalize(await self._complete_async(package, budget, model, deadline))
+                except LLMClientError as exc:
+                    self._tier_failed(model, started, exc)
+                    continue
+                if self._tier_accepts(model, started, normalized, output):
+                    await self._store_async(slot, normalized)
+                    yield normalized
+                    return
+            started = time.monotonic()
+            normalizer = output.normalizer()
+            try:
+                async for piece in _normalized_async(self._stream_async(package, budget, last, deadline), normalizer):
+                    yield piece
+            except LLMClientError as exc:
+                if lower:
+                    self._tier_failed(last, started, exc, final=True)
+                raise
+            normalized = normalizer.text
+            if lower:
+                self._tier_accepts(last, started, normalized, output, final=True)
+            await self._store_async(slot, normalized)
+
+        async for piece in request_flights.stream(slot.key, produce):
+            yield piece
+
+    def _tier_accepts(
+        self,
+        model: str,
+        started: float,
+        normalized: str,
+        output: "_OutputFormat",
+        final: bool = False,
+    ) -> bool:
+        """Record one cascade tier's answer; whether it passes the quality check."""
+        passed = not output.issues(normalized)
+        outcome = "accepted" if passed else ("unresolved" if final else "escalated")
+        cascade_metrics.record(model, time.monotonic() - started, outcome)
+        return passed
+
+    def _tier_failed(self, model: str, started: float, exc: LLMClientError, final: bool = False) -> None:
+        """Record one cascade tier's failure; a lower tier's rate limit or timeout is raised, not escalated."""
+        cascade_metrics.record(model, time.monotonic() - started, "errors")
+        if not final and isinstance(exc, (RateLimitedError, UpstreamTimeoutError)):
+            # Our own queue or the deadline is exhausted; another tier would not fare better.
+            raise exc
+
+    def _cache_slot(self, package: PromptPackage, budget: PromptBudget) -> "_CacheSlot":
+        key_args = {
+            "model": ">".join(self.config.models),
+            "temperature": self.config.temperature,
+            "max_tokens": budget.output_tokens,
+            "system_prompt": package.system_prompt,
+            "normalizer_version": NORMALIZER_VERSION,
+        }
+        slot = _CacheSlot(key=response_key(user_prompt=package.user_prompt, **key_args))
+        if self._similar is not None:
+            # Near-duplicates must agree on everything except the diff itself.
+            slot.scope = response_key(user_prompt=package.user_prompt.replace(package.diff_text, ""), **key_args)
+            slot.signature = self._similar.sketch(package.diff_text)
+        return slot
+
+    def _cached(self, slot: "_CacheSlot") -> str | None:
+        if not self._use_cache:
+            return None
+        cached = self._cache.get(slot.key) if self._cache is not None else None
+        return cached if cached is not None else self._similar_cached(slot)
+
+    async def _cached_async(self, slot: "_CacheSlot") -> str | None:
+        # The disk tier is read off the event loop.
+        if not self._use_cache:
+            return None
+        cached = await self._cache.get_async(slot.key) if self._cache is not None else None
+        return cached if cached is not None else self._similar_cached(slot)
+
+    def _similar_cached(self, slot: "_CacheSlot") -> str | None:
+        match = self._similar.get(slot.scope, slot.signature) if self._similar is not None else None
+        if match is None:
+            return None
+        note = (
+            f"Note: reused the response to a near-identical earlier diff "
+            f"(~{match.similarity:.0%} similar); disable caching for a fresh one."
         )
-        normalized = normalize_refine_output(model_output)
-        return _prepend_truncation_warning(normalized, package.truncation_note)
+        return f"{note}\n\n{match.value}"
 
-    def _complete(self, system_prompt: str, user_prompt: str) -> str:
+    def _store(self, slot: "_CacheSlot", normalized: str) -> None:
+        if self._cache is not None:
+            self._cache.put(slot.key, normalized)
+        if self._similar is not None:
+            self._similar.put(slot.scope, slot.signature, normalized)
+
+    async def _store_async(self, slot: "_CacheSlot", normalized: str) -> None:
+        if self._cache is not None:
+            await self._cache.put_async(slot.key, normalized)
+        if self._similar is not None:
+            self._similar.put(slot.scope, slot.signature, normalized)
+
+    def _complete(
+        self, package: PromptPackage, budget: PromptBudget, model: str, deadline: float | None = None
+    ) -> str:
+        args = self._request_args(package, budget, model)
         try:
-            response = self._client.chat.completions.create(
-                model=self.config.model,
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
+            text = call_with_retries(
+                lambda remaining: self._attempt(self.backend.complete, args, package.prompt_tokens, remaining),
+                self._retry_policy(deadline),
             )
         except Exception as exc:  # pragma: no cover - external SDK behavior
-            raise LLMClientError(f"OpenAI request failed: {exc}") from exc
+            raise _client_error(exc, self.backend.label) from exc
+        return _completion_text(text, self.backend.label)
+
+    async def _complete_async(
+        self, package: PromptPackage, budget: PromptBudget, model: str, deadline: float | None = None
+    ) -> str:
+        args = self._request_args(package, budget, model)
+        try:
+            text = await call_with_retries_async(
+                lambda remaining: self._attempt_async(
+                    self.backend.complete_async, args, package.prompt_tokens, remaining
+                ),
+                self._retry_policy(deadline),
+                latency_key=model,
+            )
+        except asyncio.CancelledError:
+            upstream_metrics.add("cancelled")
+            raise
+        except Exception as exc:  # pragma: no cover - external SDK behavior
+            raise _client_error(exc, self.backend.label) from exc
+        return _completion_text(text, self.backend.label)
+
+    def _stream(
+        self, package: PromptPackage, budget: PromptBudget, model: str, deadline: float | None = None
+    ) -> Iterator[str]:
+        args = self._request_args(package, budget, model)
+        produced = False
+        try:
+            # Only opening the stream is retried; output already sent cannot be taken back.
+            stream = call_with_retries(
+                lambda remaining: self._attempt(self.backend.open_stream, args, package.prompt_tokens, remaining),
+                self._retry_policy(deadline),
+            )
+            with closing(stream):
+                for piece in stream:
+                    produced = produced or bool(piece.strip())
+                    yield piece
+        except Exception as exc:  # pragma: no cover - external SDK behavior
+            raise _client_error(exc, self.backend.label) from exc
+        if not produced:
+            raise LLMClientError(f"{self.backend.label} returned an empty completion.")
+
+    async def _stream_async(
+        self, package: PromptPackage, budget: PromptBudget, model: str, deadline: float | None = None
+    ) -> AsyncIterator[str]:
+        args = self._request_args(package, budget, model)
+        produced = False
+        try:
+            stream = await call_with_retries_async(
+                lambda remaining: self._attempt_async(
+                    self.backend.open_stream_async, args, package.prompt_tokens, remaining
+                ),
+                self._retry_policy(deadline),
+            )
+            try:
+                async for piece in stream:
+                    produced = produced or bool(piece.strip())
+                    yield piece
+            finally:
+                # Ends the upstream request when the consumer stops early.
+                await stream.aclose()
+        except asyncio.CancelledError:
+            upstream_metrics.add("cancelled")
+            raise
+        except Exception as exc:  # pragma: no cover - external SDK behavior
+            raise _client_error(exc, self.backend.label) from exc
+        if not produced:
+            raise LLMClientError(f"{self.backend.label} returned an empty completion.")
+
+    def _retry_deadline(self) -> float:
+        """When retries must stop; one value is shared by every tier of a cascade."""
+        deadline = time.monotonic() + self.config.retry.deadline_seconds
+        return deadline if self.deadline is None else min(deadline, self.deadline)
+
+    def _retry_policy(self, deadline: float | None = None) -> RetryPolicy:
+        remaining = max((deadline or self._retry_deadline()) - time.monotonic(), 0.0)
+        return replace(self.config.retry, deadline_seconds=min(self.config.retry.deadline_seconds, remaining))
+
+    def _attempt(self, send: Callable, args: dict, prompt_tokens: int, remaining: float):
+        """One backend call: wait for rate-limit capacity, then send with the time left."""
+        deadline = time.monotonic() + remaining
+        if self._limiter is not None:
+            # OpenAI counts ``max_tokens`` against the token limit up front.
+            self._limiter.acquire(prompt_tokens + args["max_tokens"], max_wait=remaining)
+        return send(args, self._attempt_timeout(deadline))
+
+    async def _attempt_async(self, send: Callable, args: dict, prompt_tokens: int, remaining: float):
+        deadline = time.monotonic() + remaining
+        if self._limiter is not None:
+            await self._limiter.acquire_async(prompt_tokens + args["max_tokens"], max_wait=remaining)
+        return await send(args, self._attempt_timeout(deadline))
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        return max(min(self.config.timeout_seconds, deadline - time.monotonic()), 0.0)
+
+    def _request_args(self, package: PromptPackage, budget: PromptBudget, model: str) -> dict:
+        return {
+            "model": model,
+            "temperature": self.config.temperature,
+            "max_tokens": budget.output_tokens,
+            "messages": [
+                {"role": "system", "content": package.system_prompt},
+                {"role": "user", "content": package.user_prompt},
+            ],
+        }
+
+
+def _client_error(exc: Exception, upstream: str) -> LLMClientError:
+    if isinstance(exc, RateLimitWaitError):
+        return RateLimitedError(str(exc), retry_after=exc.retry_after)
+    if isinstance(exc, (TimeoutError, openai.APITimeoutError)):
+        # Includes ``DeadlineExceededError``; the SDK's timeout is not a ``TimeoutError``.
+        return UpstreamTimeoutError(f"{upstream} request failed: {exc}")
+    return LLMClientError(f"{upstream} request failed: {exc}")
+
+
+def _normalized(pieces: Iterator[str], normalizer: SectionNormalizer) -> Iterator[str]:
+    # Closing ``pieces`` ends the upstream stream once every section is complete.
+    with closing(pieces):
+        for piece in pieces:
+            text = normalizer.feed(piece)
+            if text:
+                yield text
+            if normalizer.complete:
+                upstream_metrics.add("early_stops")
+                break
+    yield normalizer.finish()
+
+
+async def _normalized_async(pieces: AsyncIterator[str], normalizer: SectionNormalizer) -> AsyncIterator[str]:
+    try:
+        async for piece in pieces:
+            text = normalizer.feed(piece)
+            if text:
+                yield text
+            if normalizer.complete:
+                upstream_metrics.add("early_stops")
+                break
+    finally:
+        await pieces.aclose()
+    yield normalizer.finish()
+
+
+async def _gather_all(*awaitables: Awaitable) -> list:
+    """Like ``asyncio.gather``, but a failure cancels the others instead of leaving them running."""
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _merged(streams: dict[str, AsyncIterator[str]]) -> AsyncIterator[tuple[str, str]]:
+    """Interleave named streams as they produce; the first failure ends (and cancels) all of them."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(name: str, pieces: AsyncIterator[str]) -> None:
+        try:
+            async for piece in pieces:
+                await queue.put((name, piece, None))
+        except Exception as exc:
+            await queue.put((name, None, exc))
+        else:
+            await queue.put((name, None, None))
+
+    tasks = [asyncio.ensure_future(pump(name, pieces)) for name, pieces in streams.items()]
+    try:
+        running = len(tasks)
+        while running:
+            name, piece, exc = await queue.get()
+            if exc is not None:
+                raise exc
+            if piece is None:
+                running -= 1
+            else:
+                yield name, piece
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _with_leading_warning(truncation_note: str) -> Iterator[str]:
+    if truncation_note:
+        yield f"{truncation_note}\n\n"
+
+
+def _completion_text(text: str, upstream: str) -> str:
+    if not text.strip():
+        raise LLMClientError(f"{upstream} returned an empty completion.")
+    return text.strip()
+
+
+@dataclass(frozen=True)
+class _OutputFormat:
+    """How one mode's output is normalized, incrementally or at once, and checked."""
+
+    normalize: Callable[[str], str]
+    normalizer: Callable[[], SectionNormalizer]
+    issues: Callable[[str], list[str]]
+
+
+_SUGGEST_OUTPUT = _OutputFormat(normalize_suggest_output, suggest_output_normalizer, suggest_output_issues)
+_REFINE_OUTPUT = _OutputFormat(normalize_refine_output, refine_output_normalizer, refine_output_issues)
+
+
+@dataclass(frozen=True)
+class Analysis:
+    """Suggest and refine outputs for one diff, and their shared truncation warning."""
+
+    suggest: str
+    refine: str
+    warning: str = ""
+
+    def to_json(self) -> dict:
+        return {"suggest": self.suggest, "refine": self.refine, "warning": self.warning}
+
+
+@dataclass(frozen=True)
+class PreparedRequest:
+    """Chat completion body of one unsent request, and what is needed to finish it."""
+
+    body: dict
+    prompt_tokens: int
+    # Final output when the response cache already has it.
+    cached: str | None
+    warning: str
+    slot: "_CacheSlot"
+    output: _OutputFormat
+
+
+@dataclass
+class _CacheSlot:
+    """Exact key, plus near-duplicate scope and signature, of one request."""
+
+    key: str
+    scope: str = ""
+    signature: tuple[int, ...] | None = None
+
+
+@lru_cache(maxsize=None)
+def _template_tokens(mode: str, model: str) -> int:
+    """Prompt tokens of the ``mode`` template with an empty diff and previous prompt."""
+    if mode == "refine":
+        return build_refine_prompt(diff_text="", last_prompt="", model=model).prompt_tokens
+    return build_suggest_prompt("", model=model).prompt_tokens
+
+
+def _truncation_warning(budget: PromptBudget, package: PromptPackage, diff_truncated: bool) -> str:
+    if not (diff_truncated or package.was_diff_truncated):
+        return ""
+    return (
+        f"Warning: git diff exceeded the {budget.diff_tokens}-token budget for {budget.model} "
+        "and was truncated before sending to the model."
+    )
+
+
+def _create_backend(config: LLMConfig, api_key: str | None) -> ChatBackend:
+    if config.backend == "local":
+        return LocalBackend.from_env()
+    if config.backend != "openai":
+        raise LLMClientError(f"Unknown LLM backend '{config.backend}'; expected one of: {', '.join(BACKENDS)}.")
+    resolved_key = (api_key or os.getenv("OPENAI_API_KEY", "")).strip()
+    if not resolved_key:
+        raise MissingAPIKeyError("Missing OPENAI_API_KEY in environment.")
+    return OpenAIBackend(resolved_key, config.timeout_seconds, config.base_url)
+
+
+def _shared_truncation_warning(diff_truncated: bool, *requests: tuple[PromptBudget, PromptPackage]) -> str:
+    """One warning for prompts built from the same diff, naming the tightest budget that cut it."""
+    truncated = [(budget, package) for budget, package in requests if diff_truncated or package.was_diff_truncated]
+    if not truncated:
+        return ""
+    budget, package = min(truncated, key=lambda request: request[0].diff_tokens)
+    return _truncation_warning(budget, package, diff_truncated)
 
-        if not response.choices:
-            raise LLMClientError("OpenAI returned no completion choices.")
 
-        text = response.choices[0].message.content or ""
-        if not text.strip():
-            raise LLMClientError("OpenAI returned an empty completion.")
-        return text.strip()
+def _int_env(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    try:
+        return int(raw) if raw else default
+    except ValueError:
+        return default
 
 
 def _prepend_truncation_warning(output_text: str, truncation_note: str) -> str:
@@ -0,0 +1,240 @@
+"""Process-wide OpenAI client registry over pooled HTTP connections.
+
+Building ``OpenAI(...)`` per request creates a fresh httpx pool and a new TLS
+handshake each time. The registry keeps one keep-alive pool per process for
+blocking clients, and one per event loop for ``AsyncOpenAI`` clients (async
+connections cannot move between loops), and hands out cached clients that
+share them, so connections are reused across requests and threads.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from app.llm.rate_limit import get_rate_limiter
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: no cover - optional in local environments
+    h2 = None
+
+
+MAX_CONNECTIONS_ENV_VAR = "SPEC_PROMPT_HTTP_MAX_CONNECTIONS"
+MAX_KEEPALIVE_ENV_VAR = "SPEC_PROMPT_HTTP_MAX_KEEPALIVE"
+KEEPALIVE_EXPIRY_ENV_VAR = "SPEC_PROMPT_HTTP_KEEPALIVE_SECONDS"
+POOL_TIMEOUT_ENV_VAR = "SPEC_PROMPT_HTTP_POOL_TIMEOUT_SECONDS"
+HTTP2_ENV_VAR = "SPEC_PROMPT_HTTP2"
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    # The OpenAI SDK's own limits: one shared pool must carry every in-flight
+    # completion of the process (or event loop).
+    max_connections: int = 1000
+    max_keepalive_connections: int = 100
+    keepalive_expiry: float = 30.0
+    # Longest wait for a free connection when the pool is exhausted.
+    pool_timeout: float = 10.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        return cls(
+            max_connections=_number_env(MAX_CONNECTIONS_ENV_VAR, cls.max_connections, int),
+            max_keepalive_connections=_number_env(MAX_KEEPALIVE_ENV_VAR, cls.max_keepalive_connections, int),
+            keepalive_expiry=_number_env(KEEPALIVE_EXPIRY_ENV_VAR, cls.keepalive_expiry, float),
+            pool_timeout=_number_env(POOL_TIMEOUT_ENV_VAR, cls.pool_timeout, float),
+            http2=os.getenv(HTTP2_ENV_VAR, "").strip().lower() in {"1", "true", "yes", "on"},
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self, seconds: float) -> httpx.Timeout:
+        """Request timeout of ``seconds``, waiting at most ``pool_timeout`` of it for a connection."""
+        return httpx.Timeout(seconds, pool=min(seconds, self.pool_timeout))
+
+
+class ClientRegistry:
+    """Thread-safe cache of OpenAI clients sharing pooled HTTP clients."""
+
+    def __init__(self, config: PoolConfig | None = None) -> None:
+        self.config = config or PoolConfig.from_env()
+        # HTTP/2 needs the optional ``h2`` package; without it stay on HTTP/1.1.
+        self.http2 = self.config.http2 and h2 is not None
+        self._lock = threading.Lock()
+        self._clients: dict[tuple[str, float, str | None], OpenAI] = {}
+        self._http_client: httpx.Client | None = None
+        self._async_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[httpx.AsyncClient, dict[tuple[str, float, str | None], AsyncOpenAI]]
+        ] = weakref.WeakKeyDictionary()
+        self._requests = 0
+
+    def get(self, api_key: str, timeout_seconds: float, base_url: str | None = None) -> OpenAI:
+        """Return the shared client for this key, timeout and API base URL, creating it once.
+
+        ``base_url=None`` means the SDK default (``OPENAI_BASE_URL`` or OpenAI itself).
+        """
+        key = (api_key, timeout_seconds, base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # Retries are handled by ``app.llm.resilience`` within the request deadline.
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=self.config.timeout(timeout_seconds),
+                    max_retries=0,
+                    http_client=self._http(),
+                )
+                self._clients[key] = client
+            return client
+
+    def get_async(self, api_key: str, timeout_seconds: float, base_url: str | None = None) -> AsyncOpenAI:
+        """Async counterpart of ``get``, pooled per running event loop."""
+        loop = asyncio.get_running_loop()
+        key = (api_key, timeout_seconds, base_url)
+        with self._lock:
+            entry = self._async_clients.get(loop)
+            if entry is None:
+                entry = (self._async_http(), {})
+                self._async_clients[loop] = entry
+            http_client, clients = entry
+            client = clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=self.config.timeout(timeout_seconds),
+                    max_retries=0,
+                    http_client=http_client,
+                )
+                clients[key] = client
+            return client
+
+    def stats(self) -> dict:
+        """Pool configuration, request count and current connection usage."""
+        with self._lock:
+            connections = _pool_connections(self._http_client)
+            clients = len(self._clients)
+            for http_client, async_clients in self._async_clients.values():
+                connections.extend(_pool_connections(http_client))
+                clients += len(async_clients)
+            return {
+                "config": asdict(self.config),
+                "http2": self.http2,
+                "clients": clients,
+                "requests": self._requests,
+                "connections": len(connections),
+                "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            }
+
+    def close(self) -> None:
+        """Close the blocking pool; async pools are closed by ``aclose``."""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._clients.clear()
+
+    async def aclose(self) -> None:
+        """Close every pool, including the running loop's async pool."""
+        self.close()
+        with self._lock:
+            entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+    def _http(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = DefaultHttpxClient(
+                limits=self.config.limits(),
+                http2=self.http2,
+                event_hooks={"request": [self._count_request], "response": [_observe_rate_limits]},
+            )
+        return self._http_client
+
+    def _async_http(self) -> httpx.AsyncClient:
+        return DefaultAsyncHttpxClient(
+            limits=self.config.limits(),
+            http2=self.http2,
+            event_hooks={"request": [self._count_request_async], "response": [_observe_rate_limits_async]},
+        )
+
+    def _count_request(self, _request: httpx.Request) -> None:
+        with self._lock:
+            self._requests += 1
+
+    async def _count_request_async(self, request: httpx.Request) -> None:
+        self._count_request(request)
+
+
+def _observe_rate_limits(response: httpx.Response) -> None:
+    # Every response, including 429s, carries the organization's remaining quota.
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        limiter.observe(response.status_code, response.headers)
+
+
+async def _observe_rate_limits_async(response: httpx.Response) -> None:
+    _observe_rate_limits(response)
+
+
+_registry: ClientRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """Return the process-wide registry, creating it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+
+def close_client_registry() -> None:
+    """Close pooled connections; the next ``get_client_registry`` starts a new pool."""
+    registry = _take_registry()
+    if registry is not None:
+        registry.close()
+
+
+async def close_client_registry_async() -> None:
+    """Like ``close_client_registry``, also closing the running loop's async pool."""
+    registry = _take_registry()
+    if registry is not None:
+        await registry.aclose()
+
+
+def _take_registry() -> ClientRegistry | None:
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    return registry
+
+
+def _pool_connections(http_client: httpx.Client | None) -> list:
+    # httpx does not expose pool state publicly; read the httpcore pool if present.
+    transport = getattr(http_client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    return list(getattr(pool, "connections", ()))
+
+
+def _number_env(name: str, default, kind):
+    raw = os.getenv(name, "").strip()
+    try:
+        return kind(raw) if raw else default
+    except ValueError:
+        return default
@@ -3,10 +3,18 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import Callable
 import re
 
+from app.llm.tokens import get_token_counter
+from app.llm.truncation import truncate_diff, truncate_text
+
 
 DEFAULT_MAX_DIFF_CHARS = 24_000
+DEFAULT_MAX_DIFF_TOKENS = 6_000
+LAST_PROMPT_TRUNCATION_MARKER = "... (previous prompt truncated)"
+# Part of response cache keys; bump when normalized output changes.
+NORMALIZER_VERSION = 4
 
 SUGGEST_SECTION_ORDER = [
     "Project Understanding",
@@ -21,6 +29,53 @@ REFINE_SECTION_ORDER = [
     "Assumptions To Confirm",
     "Edge-Case Checklist",
 ]
+# Shortest section bodies, in characters, that pass the output quality check.
+SUGGEST_SECTION_MIN_CHARS = {
+    "Project Understanding": 40,
+    "Recommended Next Prompt": 120,
+    "Alternate Prompt Options": 40,
+    "Edge-Case Checklist": 40,
+}
+
+REFINE_SECTION_MIN_CHARS = {
+    "Why Previous Prompt Is Underspecified": 40,
+    "Rewritten Spec-Driven Prompt": 120,
+    "Assumptions To Confirm": 20,
+    "Edge-Case Checklist": 40,
+}
+
+# Length, in characters, at which a stream stops generating the last section.
+# The line in progress is finished and SECTION_CUT_MARKER is added after it.
+# Batch normalization never shortens output.
+LAST_SECTION_SOFT_CAP_CHARS = 1_500
+SECTION_CUT_MARKER = "... (cut at the section length limit)"
+
+# Characters ``str.splitlines`` breaks on.
+_LINE_BREAKS = ("\n", "\r", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+# A heading at or above the level of the canonical "## " section headings.
+_TOP_HEADING = re.compile(r"#{1,2}\s")
+
+SUGGEST_SECTION_ALIASES = {
+    "Project Understanding": ("project understanding", "context summary", "understanding"),
+    "Recommended Next Prompt": ("recommended next prompt", "next prompt", "primary prompt"),
+    "Alternate Prompt Options": ("alternate prompt options", "alternates", "alternative prompts"),
+    "Edge-Case Checklist": ("edge-case checklist", "edge cases", "failure modes"),
+}
+
+REFINE_SECTION_ALIASES = {
+    "Why Previous Prompt Is Underspecified": (
+        "why previous prompt is underspecified",
+        "underspecification",
+        "gaps",
+    ),
+    "Rewritten Spec-Driven Prompt": (
+        "rewritten spec-driven prompt",
+        "rewritten prompt",
+        "improved prompt",
+    ),
+    "Assumptions To Confirm": ("assumptions to confirm", "assumptions", "open questions"),
+    "Edge-Case Checklist": ("edge-case checklist", "edge cases", "failure modes"),
+}
 
 
 @dataclass(frozen=True)
@@ -29,15 +84,28 @@ class PromptPackage:
     user_prompt: str
     was_diff_truncated: bool
     truncation_note: str
+    prompt_tokens: int = 0
+    tokens_exact: bool = False
+    diff_text: str = ""
 
 
-def build_suggest_prompt(diff_text: str, max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS) -> PromptPackage:
-    """Build the mode-specific prompt package for suggest mode."""
-    bounded_diff, was_truncated = _truncate_diff(diff_text, max_diff_chars=max_diff_chars)
-    truncation_note = (
-        f"Warning: git diff exceeded {max_diff_chars} characters and was truncated."
-        if was_truncated
-        else ""
+def build_suggest_prompt(
+    diff_text: str,
+    max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+    max_diff_tokens: int | None = None,
+    model: str | None = None,
+) -> PromptPackage:
+    """Build the mode-specific prompt package for suggest mode.
+
+    With ``max_diff_tokens`` the diff budget is counted in ``model`` tokens
+    instead of ``max_diff_chars`` characters.
+    """
+    counter = get_token_counter(model or "")
+    bounded_diff, was_truncated, truncation_note = _truncate_diff(
+        diff_text,
+        max_diff_chars=max_diff_chars,
+        max_diff_tokens=max_diff_tokens,
+        count_tokens=counter.count,
     )
 
     system_prompt = (
@@ -68,6 +136,9 @@ def build_suggest_prompt(diff_text: str, max_diff_chars: int = DEFAULT_MAX_DIFF_
         user_prompt=user_prompt,
         was_diff_truncated=was_truncated,
         truncation_note=truncation_note,
+        prompt_tokens=counter.count_chat(system_prompt, user_prompt),
+        tokens_exact=counter.is_exact,
+        diff_text=bounded_diff,
     )
 
 
@@ -75,14 +146,31 @@ def build_refine_prompt(
     diff_text: str,
     last_prompt: str,
     max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+    max_diff_tokens: int | None = None,
+    model: str | None = None,
+    max_last_prompt_tokens: int | None = None,
 ) -> PromptPackage:
-    """Build the mode-specific prompt package for refine mode."""
-    bounded_diff, was_truncated = _truncate_diff(diff_text, max_diff_chars=max_diff_chars)
-    truncation_note = (
-        f"Warning: git diff exceeded {max_diff_chars} characters and was truncated."
-        if was_truncated
-        else ""
+    """Build the mode-specific prompt package for refine mode.
+
+    ``max_last_prompt_tokens`` bounds the previous prompt, which is otherwise
+    included in full.
+    """
+    counter = get_token_counter(model or "")
+    bounded_diff, was_truncated, truncation_note = _truncate_diff(
+        diff_text,
+        max_diff_chars=max_diff_chars,
+        max_diff_tokens=max_diff_tokens,
+        count_tokens=counter.count,
     )
+    if max_last_prompt_tokens is not None:
+        marker_tokens = counter.count(LAST_PROMPT_TRUNCATION_MARKER) + 1
+        bounded_prompt, prompt_truncated = truncate_text(
+            last_prompt,
+            max(max_last_prompt_tokens - marker_tokens, 0),
+            measure=counter.count,
+        )
+        if prompt_truncated:
+            last_prompt = f"{bounded_prompt}\n{LAST_PROMPT_TRUNCATION_MARKER}"
 
     system_prompt = (
         "You are a principal engineer and prompt quality reviewer. "
@@ -116,44 +204,265 @@ def build_refine_prompt(
         user_prompt=user_prompt,
         was_diff_truncated=was_truncated,
         truncation_note=truncation_note,
+        prompt_tokens=counter.count_chat(system_prompt, user_prompt),
+        tokens_exact=counter.is_exact,
+        diff_text=bounded_diff,
     )
 
 
 def normalize_suggest_output(raw_text: str) -> str:
     """Normalize suggest output to deterministic section order."""
-    alias_map = {
-        "Project Understanding": ("project understanding", "context summary", "understanding"),
-        "Recommended Next Prompt": ("recommended next prompt", "next prompt", "primary prompt"),
-        "Alternate Prompt Options": ("alternate prompt options", "alternates", "alternative prompts"),
-        "Edge-Case Checklist": ("edge-case checklist", "edge cases", "failure modes"),
-    }
-    return _normalize_sections(raw_text, SUGGEST_SECTION_ORDER, alias_map)
+    return _normalize_sections(raw_text, SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES)
 
 
 def normalize_refine_output(raw_text: str) -> str:
     """Normalize refine output to deterministic section order."""
-    alias_map = {
-        "Why Previous Prompt Is Underspecified": (
-            "why previous prompt is underspecified",
-            "underspecification",
-            "gaps",
-        ),
-        "Rewritten Spec-Driven Prompt": (
-            "rewritten spec-driven prompt",
-            "rewritten prompt",
-            "improved prompt",
-        ),
-        "Assumptions To Confirm": ("assumptions to confirm", "assumptions", "open questions"),
-        "Edge-Case Checklist": ("edge-case checklist", "edge cases", "failure modes"),
-    }
-    return _normalize_sections(raw_text, REFINE_SECTION_ORDER, alias_map)
-
-
-def _truncate_diff(diff_text: str, max_diff_chars: int) -> tuple[str, bool]:
-    clean = diff_text.strip()
-    if len(clean) <= max_diff_chars:
-        return clean, False
-    return clean[:max_diff_chars], True
+    return _normalize_sections(raw_text, REFINE_SECTION_ORDER, REFINE_SECTION_ALIASES)
+
+
+def suggest_output_issues(normalized_text: str) -> list[str]:
+    """Quality problems in normalized suggest output; empty when it is usable as is."""
+    return _section_issues(normalized_text, SUGGEST_SECTION_ORDER, SUGGEST_SECTION_MIN_CHARS)
+
+
+def refine_output_issues(normalized_text: str) -> list[str]:
+    """Quality problems in normalized refine output; empty when it is usable as is."""
+    return _section_issues(normalized_text, REFINE_SECTION_ORDER, REFINE_SECTION_MIN_CHARS)
+
+
+def suggest_output_normalizer() -> "SectionNormalizer":
+    """Streaming counterpart of ``normalize_suggest_output``."""
+    return SectionNormalizer(SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES, LAST_SECTION_SOFT_CAP_CHARS)
+
+
+def refine_output_normalizer() -> "SectionNormalizer":
+    """Streaming counterpart of ``normalize_refine_output``."""
+    return SectionNormalizer(REFINE_SECTION_ORDER, REFINE_SECTION_ALIASES, LAST_SECTION_SOFT_CAP_CHARS)
+
+
+class SectionNormalizer:
+    """Incrementally reorders streamed model output into the canonical sections.
+
+    ``feed`` takes raw chunks and returns normalized text that is safe to emit
+    now; ``finish`` returns the rest. ``text`` is then the batch normalization
+    of everything consumed, which is what the stream added up to.
+
+    Sections are emitted in canonical order. The live section passes through
+    as it arrives, down to partial lines once they can no longer turn into a
+    heading. A later section's heading closes it only once its own heading
+    has arrived; until then later sections are held, so a model that writes
+    them out of order is reordered as in batch mode. Held sections are placed as
+    soon as every section before them is closed.
+
+    A heading for a section that was already closed cannot be honoured
+    without taking back emitted text. Its content stays in the live section
+    and ``diverged`` is set; ``text`` still has the batch result.
+
+    Once the last section has content, a ``#`` or ``##`` heading that is
+    not a canonical one (the model moving on to notes or a sign-off) ends the
+    answer, as does the last section reaching ``stop_after_chars`` (the line
+    in progress is finished and ``SECTION_CUT_MARKER`` added). ``complete``
+    then reports that further input is ignored, so a stream can be stopped.
+    The output matches the batch normalization of the input consumed up to
+    that point.
+    """
+
+    def __init__(
+        self,
+        ordered_sections: list[str],
+        alias_map: dict[str, tuple[str, ...]],
+        stop_after_chars: int | None = None,
+    ) -> None:
+        self._order = ordered_sections
+        self._alias_map = alias_map
+        self._stop_after_chars = stop_after_chars
+        self._index = {name: position for position, name in enumerate(ordered_sections)}
+        # Section being emitted, and the one receiving lines (it may be a later,
+        # held section).
+        self._live = 0
+        self._current = 0
+        # Sections whose heading has arrived; only these can be closed.
+        self._seen = [False] * len(ordered_sections)
+        self._held: dict[int, list[str]] = {}
+        # Every line consumed, for ``text``.
+        self._lines: list[str] = []
+        self._pending = ""
+        self._started = False
+        # Emitter state for the live section: blank lines seen since the last
+        # emitted content, and how much of the pending partial line is out.
+        self._has_content = False
+        self._blank_lines = 0
+        self._partial_emitted = 0
+        # Characters emitted in the live section.
+        self._chars = 0
+        # Whether the answer has ended, and whether it ended at the soft cap.
+        self._stopped = False
+        self._cut = False
+        self._done = False
+        self._text: str | None = None
+        self.diverged = False
+
+    @property
+    def complete(self) -> bool:
+        """Whether the answer has ended, so further input cannot change the output."""
+        return self._stopped
+
+    @property
+    def text(self) -> str:
+        """Batch normalization of the consumed input; available after ``finish``."""
+        if self._text is None:
+            raise RuntimeError("SectionNormalizer.text read before finish.")
+        return self._text
+
+    def feed(self, chunk: str) -> str:
+        if self._done:
+            raise RuntimeError("SectionNormalizer.feed called after finish.")
+        out: list[str] = []
+        if not self._started:
+            self._started = True
+            out.append(f"## {self._order[0]}\n")
+
+        self._pending += chunk
+        lines = self._pending.splitlines(keepends=True)
+        # Keep an unfinished last line, and a trailing "\r" that may start "\r\n".
+        if lines and (not lines[-1].endswith(_LINE_BREAKS) or lines[-1].endswith("\r")):
+            self._pending = lines.pop()
+        else:
+            self._pending = ""
+        for line in lines:
+            self._line(line, out)
+        self._partial(out)
+        return "".join(out)
+
+    def finish(self) -> str:
+        out: list[str] = [] if self._started else [f"## {self._order[0]}\n"]
+        self._started = self._done = True
+        for line in self._pending.splitlines():
+            self._line(line, out)
+        self._pending = ""
+        self._close_live(out)
+        for position in range(self._live + 1, len(self._order)):
+            self._open(position, out)
+            self._close_live(out)
+        text = _normalize_sections("\n".join(self._lines), self._order, self._alias_map)
+        if self._cut:
+            out.append(f"\n{SECTION_CUT_MARKER}")
+            text = f"{text[:-1]}\n{SECTION_CUT_MARKER}\n"
+        out.append("\n")
+        self._text = text
+        return "".join(out)
+
+    def _line(self, raw_line: str, out: list[str]) -> None:
+        # Line breaks are whitespace, so this also drops them.
+        line = raw_line.rstrip()
+        if self._stopped:
+            return
+        if self._partial_emitted:
+            # Already known to be content of the live section and partly emitted.
+            self._lines.append(line)
+            out.append(line[self._partial_emitted:])
+            self._chars += len(line) - self._partial_emitted
+            self._partial_emitted = 0
+            self._check_cap()
+            return
+        heading = _match_canonical_heading(line, self._order, self._alias_map)
+        if heading is not None:
+            self._lines.append(line)
+            self._heading(self._index[heading], out)
+        elif self._in_last_section() and self._has_content and _TOP_HEADING.match(line.lstrip()):
+            self._stopped = True
+        elif self._current == self._live:
+            self._lines.append(line)
+            self._emit(line, out)
+            self._check_cap()
+        else:
+            self._lines.append(line)
+            self._held.setdefault(self._current, []).append(line)
+
+    def _heading(self, position: int, out: list[str]) -> None:
+        if position < self._live:
+            self.diverged = True
+            self._current = self._live
+            return
+        self._seen[position] = True
+        self._current = position
+        # Close sections that have been seen and place the held ones after them.
+        while self._live < self._current and self._seen[self._live]:
+            self._close_live(out)
+            self._open(self._live + 1, out)
+
+    def _open(self, position: int, out: list[str]) -> None:
+        self._live = position
+        self._has_content = False
+        self._blank_lines = 0
+        self._chars = 0
+        out.append(f"\n\n## {self._order[position]}\n")
+        for line in self._held.pop(position, []):
+            self._emit(line, out)
+        self._check_cap()
+
+    def _close_live(self, out: list[str]) -> None:
+        if not self._has_content:
+            out.append("Not provided.")
+
+    def _emit(self, line: str, out: list[str]) -> None:
+        """Emit one rstripped line of the live section, as ``str.strip`` on the joined section would."""
+        if not line:
+            if self._has_content:
+                self._blank_lines += 1
+            return
+        if self._has_content:
+            out.append("\n" * (self._blank_lines + 1) + line)
+            self._chars += self._blank_lines + 1 + len(line)
+        else:
+            out.append(line.lstrip())
+            self._chars += len(line.lstrip())
+            self._has_content = True
+        self._blank_lines = 0
+
+    def _in_last_section(self) -> bool:
+        return self._current == self._live == len(self._order) - 1
+
+    def _check_cap(self) -> None:
+        """Stop after a whole line once the last section reaches its soft cap."""
+        if self._stop_after_chars is not None and self._live == len(self._order) - 1:
+            if self._chars >= self._stop_after_chars:
+                self._stopped = self._cut = True
+
+    def _partial(self, out: list[str]) -> None:
+        """Emit the unfinished last line early once it cannot become a heading."""
+        if self._stopped or self._current != self._live or not self._pending.strip():
+            return
+        if not self._partial_emitted and (
+            _could_be_heading(self._pending, self._order, self._alias_map)
+            # Could still become a heading that ends the last section.
+            or (self._in_last_section() and self._has_content and re.match(r"#{1,2}(\s|$)", self._pending.lstrip()))
+        ):
+            return
+        visible = self._pending.rstrip()
+        if self._partial_emitted:
+            out.append(visible[self._partial_emitted:])
+            self._chars += len(visible) - self._partial_emitted
+        else:
+            self._emit(visible, out)
+        self._partial_emitted = len(visible)
+
+
+def _truncate_diff(
+    diff_text: str,
+    max_diff_chars: int,
+    max_diff_tokens: int | None,
+    count_tokens: Callable[[str], int],
+) -> tuple[str, bool, str]:
+    if max_diff_tokens is None:
+        truncated = truncate_diff(diff_text, max_diff_chars)
+        limit = f"{max_diff_chars} characters"
+    else:
+        truncated = truncate_diff(diff_text, max_diff_tokens, measure=count_tokens)
+        limit = f"{max_diff_tokens} tokens"
+    if not truncated.was_truncated:
+        return truncated.text, False, ""
+    return truncated.text, True, f"Warning: git diff exceeded {limit} and was truncated."
 
 
 def _normalize_sections(raw_text: str, ordered_sections: list[str], alias_map: dict[str, tuple[str, ...]]) -> str:
@@ -177,16 +486,34 @@ def _normalize_sections(raw_text: str, ordered_sections: list[str], alias_map: d
     return "\n\n".join(rendered).strip() + "\n"
 
 
+def _section_issues(normalized_text: str, ordered_sections: list[str], min_chars: dict[str, int]) -> list[str]:
+    issues: list[str] = []
+    # Normalized output is each "## <section>" heading, in order, followed by its body.
+    headings = [f"## {name}\n" for name in ordered_sections]
+    position = 0
+    for index, name in enumerate(ordered_sections):
+        start = normalized_text.find(headings[index], position)
+        if start < 0:
+            issues.append(f"{name}: missing")
+            continue
+        start += len(headings[index])
+        end = normalized_text.find(f"\n\n{headings[index + 1]}", start) if index + 1 < len(headings) else -1
+        body = normalized_text[start:end if end >= 0 else len(normalized_text)].strip()
+        position = start
+        if body == "Not provided.":
+            issues.append(f"{name}: missing")
+        elif len(body) < min_chars.get(name, 0):
+            issues.append(f"{name}: {len(body)} characters, expected at least {min_chars[name]}")
+    return issues
+
+
 def _match_canonical_heading(
     line: str,
     ordered_sections: list[str],
     alias_map: dict[str, tuple[str, ...]],
 ) -> str | None:
     """Try to match a heading-like line to a canonical section name."""
-    stripped = line.strip().lower()
-    stripped = re.sub(r"^#{1,6}\s*", "", stripped)
-    stripped = re.sub(r"^\d+[\)\.\-:\s]+", "", stripped)
-    stripped = stripped.strip(" :-")
+    stripped = _heading_key(line.strip()).strip(" :-")
 
     for canonical in ordered_sections:
         aliases = alias_map.get(canonical, ())
@@ -195,3 +522,23 @@ def _match_canonical_heading(
             if stripped == alias:
                 return canonical
     return None
+
+
+def _could_be_heading(partial_line: str, ordered_sections: list[str], alias_map: dict[str, tuple[str, ...]]) -> bool:
+    """Whether more text could still complete ``partial_line`` into a heading."""
+    key = _heading_key(partial_line.lstrip())
+    if key.isdigit():
+        return True  # e.g. "2" before ") Next prompt"
+    key = key.lstrip(" :-")
+    for canonical in ordered_sections:
+        for alias in (canonical.lower(), *alias_map.get(canonical, ())):
+            if alias.startswith(key) or (key.startswith(alias) and not key[len(alias):].strip(" :-").strip()):
+                return True
+    return False
+
+
+def _heading_key(text: str) -> str:
+    key = text.lower()
+    key = re.sub(r"^#{1,6}\s*", "", key)
+    return re.sub(r"^\d+[\)\.\-:\s]+", "", key)
+
@@ -0,0 +1,218 @@
+"""Client-side rate limiting of OpenAI requests and tokens.
+
+Two buckets, requests and tokens per minute, refill continuously. A caller
+reserves one request and its estimated tokens up front, so callers queue in
+arrival order; it then waits until its reservation is covered, or fails at
+once when that would take longer than it may wait.
+
+Limits adapt to OpenAI's ``x-ratelimit-*`` response headers (AIMD): they grow
+additively while the quota has headroom and shrink multiplicatively on a 429
+or when it runs low, never past the limit the headers report. A bucket never
+holds more than the headers say remains, so other services sharing the
+organization's quota are accounted for.
+"""
+
+from __future__ import annotations
+
+from typing import Mapping
+import asyncio
+import math
+import os
+import threading
+import time
+
+
+RATE_LIMIT_ENV_VAR = "SPEC_PROMPT_RATE_LIMIT"
+RATE_LIMIT_RPM_ENV_VAR = "SPEC_PROMPT_RATE_LIMIT_RPM"
+RATE_LIMIT_TPM_ENV_VAR = "SPEC_PROMPT_RATE_LIMIT_TPM"
+RATE_LIMIT_MAX_WAIT_ENV_VAR = "SPEC_PROMPT_RATE_LIMIT_MAX_WAIT_SECONDS"
+
+DEFAULT_MAX_WAIT_SECONDS = 10.0
+# Additive increase per successful response, as a share of the reported limit.
+INCREASE_FRACTION = 0.05
+# Multiplicative decrease on a 429, and a gentler one when headroom runs low.
+THROTTLED_FACTOR = 0.5
+LOW_HEADROOM_FACTOR = 0.8
+LOW_HEADROOM_FRACTION = 0.1
+# Never adapt below this share of the reported limit.
+MIN_FRACTION = 0.05
+
+
+class RateLimitWaitError(RuntimeError):
+    """Raised when a caller would have to wait longer than allowed for capacity."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    """Per-minute budget; an unknown ``rate`` (``None``) never makes callers wait."""
+
+    def __init__(self, rate: float | None) -> None:
+        self.rate = rate
+        self.ceiling: float | None = None
+        self.level = rate or 0.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.rate is not None:
+            self.level = min(self.level + (now - self.updated) * self.rate / 60, self.rate)
+        self.updated = now
+
+    def wait_for(self, cost: float) -> float:
+        if self.rate is None or cost <= self.level:
+            return 0.0
+        return (cost - self.level) * 60 / self.rate
+
+    def adapt(self, ceiling: float | None, remaining: float | None, throttled: bool) -> None:
+        if ceiling is not None and ceiling > 0:
+            self.ceiling = ceiling
+            if self.rate is None:
+                self.rate = self.level = ceiling
+        if self.rate is None:
+            return
+        ceiling = self.ceiling or self.rate
+        if throttled:
+            self.rate = max(self.rate * THROTTLED_FACTOR, ceiling * MIN_FRACTION)
+            self.level = min(self.level, 0.0)
+        elif remaining is not None and remaining < ceiling * LOW_HEADROOM_FRACTION:
+            self.rate = max(self.rate * LOW_HEADROOM_FACTOR, ceiling * MIN_FRACTION)
+        elif remaining is not None:
+            self.rate = min(self.rate + ceiling * INCREASE_FRACTION, ceiling)
+        if self.ceiling is not None:
+            self.rate = min(self.rate, self.ceiling)
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+        self.level = min(self.level, self.rate)
+
+    def stats(self) -> dict:
+        return {"rate_per_minute": self.rate, "reported_limit": self.ceiling, "available": self.level}
+
+
+class RateLimiter:
+    """Thread-safe request and token buckets shared by every client in the process."""
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+    ) -> None:
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._counters = {"acquired": 0, "delayed": 0, "rejected": 0, "throttled": 0}
+        self._wait_seconds = 0.0
+
+    def reserve(self, tokens: int, max_wait: float | None = None) -> float:
+        """Claim capacity for one request of ``tokens``; returns the seconds to wait before sending.
+
+        Raises ``RateLimitWaitError`` without claiming anything when the wait
+        would exceed ``max_wait`` (capped by ``max_wait_seconds``).
+        """
+        allowed = self.max_wait_seconds if max_wait is None else min(max_wait, self.max_wait_seconds)
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            delay = max(self._requests.wait_for(1), self._tokens.wait_for(tokens))
+            if delay > allowed:
+                self._counters["rejected"] += 1
+                raise RateLimitWaitError(
+                    f"OpenAI rate limit reached; capacity frees up in about {math.ceil(delay)}s.",
+                    retry_after=delay,
+                )
+            # Debiting now, possibly below zero, queues later callers behind this one.
+            self._requests.level -= 1
+            self._tokens.level -= tokens
+            self._counters["acquired"] += 1
+            if delay > 0:
+                self._counters["delayed"] += 1
+                self._wait_seconds += delay
+            return delay
+
+    def release(self, tokens: int) -> None:
+        """Return a reservation that was never sent."""
+        with self._lock:
+            self._requests.level += 1
+            self._tokens.level += tokens
+
+    def acquire(self, tokens: int, max_wait: float | None = None) -> None:
+        delay = self.reserve(tokens, max_wait)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int, max_wait: float | None = None) -> None:
+        delay = self.reserve(tokens, max_wait)
+        if delay <= 0:
+            return
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.release(tokens)
+            raise
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """Adapt the limits to one OpenAI response."""
+        throttled = status_code == 429
+        with self._lock:
+            now = time.monotonic()
+            for bucket, kind in ((self._requests, "requests"), (self._tokens, "tokens")):
+                bucket.refill(now)
+                bucket.adapt(
+                    _header_number(headers, f"x-ratelimit-limit-{kind}"),
+                    _header_number(headers, f"x-ratelimit-remaining-{kind}"),
+                    throttled,
+                )
+            if throttled:
+                self._counters["throttled"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "wait_seconds": round(self._wait_seconds, 3),
+                "max_wait_seconds": self.max_wait_seconds,
+                "requests": self._requests.stats(),
+                "tokens": self._tokens.stats(),
+            }
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Return the process-wide limiter, or ``None`` when ``SPEC_PROMPT_RATE_LIMIT=off``."""
+    global _limiter
+    if os.getenv(RATE_LIMIT_ENV_VAR, "").strip().lower() in {"0", "false", "no", "off"}:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=_number_env(RATE_LIMIT_RPM_ENV_VAR),
+                tokens_per_minute=_number_env(RATE_LIMIT_TPM_ENV_VAR),
+                max_wait_seconds=_number_env(RATE_LIMIT_MAX_WAIT_ENV_VAR) or DEFAULT_MAX_WAIT_SECONDS,
+            )
+        return _limiter
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> float | None:
+    raw = headers.get(name)
+    if raw is None:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def _number_env(name: str) -> float | None:
+    raw = os.getenv(name, "").strip()
+    try:
+        value = float(raw) if raw else None
+    except ValueError:
+        return None
+    return value if value is not None and value > 0 else None
@@ -0,0 +1,297 @@
+"""Retries, backoff and hedging for upstream model calls.
+
+Transient failures (rate limits, 5xx responses, dropped connections and
+timeouts) are retried with capped exponential backoff and full jitter, waiting
+at least as long as the server's ``Retry-After``. Async completions can also
+be hedged: when an attempt runs past a recent latency percentile, an identical
+second attempt starts and the first to succeed wins. Attempts and waits all
+fit inside one overall deadline.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import os
+import random
+import threading
+import time
+
+import openai
+
+
+RETRY_ATTEMPTS_ENV_VAR = "SPEC_PROMPT_RETRY_ATTEMPTS"
+RETRY_BASE_ENV_VAR = "SPEC_PROMPT_RETRY_BASE_SECONDS"
+RETRY_MAX_ENV_VAR = "SPEC_PROMPT_RETRY_MAX_SECONDS"
+DEADLINE_ENV_VAR = "SPEC_PROMPT_DEADLINE_SECONDS"
+HEDGE_PERCENTILE_ENV_VAR = "SPEC_PROMPT_HEDGE_PERCENTILE"
+
+LATENCY_WINDOW = 256
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when the overall deadline runs out before an attempt succeeds."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    deadline_seconds: float = 60.0
+    # Hedge after this percentile of recent latencies (e.g. 95); ``None`` disables hedging.
+    hedge_percentile: float | None = None
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        hedge = _number_env(HEDGE_PERCENTILE_ENV_VAR, 0.0)
+        return cls(
+            max_attempts=max(int(_number_env(RETRY_ATTEMPTS_ENV_VAR, cls.max_attempts)), 1),
+            base_delay=_number_env(RETRY_BASE_ENV_VAR, cls.base_delay),
+            max_delay=_number_env(RETRY_MAX_ENV_VAR, cls.max_delay),
+            deadline_seconds=_number_env(DEADLINE_ENV_VAR, cls.deadline_seconds),
+            hedge_percentile=min(hedge, 100.0) if hedge > 0 else None,
+        )
+
+    def backoff(self, retry: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number ``retry`` (0-based)."""
+        delay = random.random() * min(self.max_delay, self.base_delay * 2**retry)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful attempts."""
+
+    def __init__(self, size: int = LATENCY_WINDOW) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(int(len(samples) * percent / 100), len(samples) - 1)
+        return samples[index]
+
+
+class UpstreamMetrics:
+    """Process-wide counters for attempts, retries and hedges, plus latency windows per model."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {
+            "attempts": 0,
+            "retries": 0,
+            "retry_after_waits": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+            # Streams ended once every output section was complete.
+            "early_stops": 0,
+            # Completions and streams in flight when their request was cancelled.
+            "cancelled": 0,
+        }
+        self._latencies: dict[str, LatencyWindow] = {}
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def latencies(self, key: str) -> LatencyWindow:
+        with self._lock:
+            window = self._latencies.get(key)
+            if window is None:
+                window = self._latencies[key] = LatencyWindow()
+            return window
+
+    def stats(self) -> dict:
+        with self._lock:
+            windows = dict(self._latencies)
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "latency_seconds": {
+                key: {"p50": window.percentile(50), "p95": window.percentile(95)} for key, window in windows.items()
+            },
+        }
+
+
+upstream_metrics = UpstreamMetrics()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether ``exc`` is a transient upstream failure worth another attempt."""
+    if isinstance(exc, openai.APIConnectionError):
+        # Includes APITimeoutError.
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        if getattr(exc, "code", None) == "insufficient_quota":
+            # A 429 that waiting will not fix.
+            return False
+        return exc.status_code in {408, 409, 429} or exc.status_code >= 500
+    return False
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Seconds the server asked us to wait, from ``retry-after-ms`` or ``Retry-After``."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(float(raw_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(float(raw), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(raw).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(
+    attempt: Callable[[float], T],
+    policy: RetryPolicy,
+    metrics: UpstreamMetrics = upstream_metrics,
+) -> T:
+    """Run ``attempt(remaining_seconds)`` until it succeeds, retrying transient failures."""
+    deadline = time.monotonic() + policy.deadline_seconds
+    retry = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(policy, metrics)
+        metrics.add("attempts")
+        try:
+            return attempt(remaining)
+        except Exception as exc:
+            time.sleep(_retry_delay(exc, retry, policy, deadline, metrics))
+            retry += 1
+
+
+async def call_with_retries_async(
+    attempt: Callable[[float], Awaitable[T]],
+    policy: RetryPolicy,
+    latency_key: str | None = None,
+    metrics: UpstreamMetrics = upstream_metrics,
+) -> T:
+    """Async ``call_with_retries``; with ``latency_key`` attempts are timed and may be hedged.
+
+    Only pass a key for calls whose latency is comparable between requests
+    (whole completions, not stream openings).
+    """
+    deadline = time.monotonic() + policy.deadline_seconds
+    retry = 0
+    while True:
+        if deadline - time.monotonic() <= 0:
+            raise _deadline_exceeded(policy, metrics)
+        try:
+            return await _hedged_attempt(attempt, policy, deadline, latency_key, metrics)
+        except DeadlineExceededError:
+            raise
+        except Exception as exc:
+            await asyncio.sleep(_retry_delay(exc, retry, policy, deadline, metrics))
+            retry += 1
+
+
+async def _hedged_attempt(
+    attempt: Callable[[float], Awaitable[T]],
+    policy: RetryPolicy,
+    deadline: float,
+    latency_key: str | None,
+    metrics: UpstreamMetrics,
+) -> T:
+    window = metrics.latencies(latency_key) if latency_key is not None else None
+
+    async def timed() -> T:
+        metrics.add("attempts")
+        started = time.monotonic()
+        result = await attempt(deadline - started)
+        if window is not None:
+            window.record(time.monotonic() - started)
+        return result
+
+    hedge_after = None
+    if window is not None and policy.hedge_percentile is not None:
+        hedge_after = window.percentile(policy.hedge_percentile, policy.hedge_min_samples)
+
+    first = asyncio.ensure_future(timed())
+    tasks = [first]
+    try:
+        if hedge_after is not None and hedge_after < deadline - time.monotonic():
+            done, _pending = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                metrics.add("hedges")
+                tasks.append(asyncio.ensure_future(timed()))
+
+        error: BaseException | None = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(deadline - time.monotonic(), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                raise _deadline_exceeded(policy, metrics)
+            # Retrieve every exception so none is reported as unhandled.
+            results = [(task, task.exception()) for task in done]
+            for task, exc in results:
+                if exc is None:
+                    if task is not first:
+                        metrics.add("hedge_wins")
+                    return task.result()
+                error = error or exc
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _retry_delay(exc: Exception, retry: int, policy: RetryPolicy, deadline: float, metrics: UpstreamMetrics) -> float:
+    """Seconds to wait before retrying after ``exc``; re-raises when there is no retry left."""
+    if retry + 1 >= policy.max_attempts or not is_retryable(exc):
+        raise exc
+    wait = retry_after(exc)
+    delay = policy.backoff(retry, wait)
+    if delay >= deadline - time.monotonic():
+        raise _deadline_exceeded(policy, metrics) from exc
+    metrics.add("retries")
+    if wait is not None:
+        metrics.add("retry_after_waits")
+    return delay
+
+
+def _deadline_exceeded(policy: RetryPolicy, metrics: UpstreamMetrics) -> DeadlineExceededError:
+    metrics.add("deadline_exceeded")
+    return DeadlineExceededError(f"no successful response within the {policy.deadline_seconds:g}s deadline")
+
+
+def _number_env(name: str, default: float) -> float:
+    raw = os.getenv(name, "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
@@ -0,0 +1,285 @@
+"""Content-addressed cache of normalized model responses.
+
+Keys hash everything that determines a completion (model, sampling settings,
+prompts and normalizer version), with diff ``index`` lines dropped so the
+same change staged twice or in another clone collides. Entries live in a
+bounded in-memory LRU backed by a SQLite file that concurrent CLI runs and
+server workers share.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+CACHE_MODE_ENV_VAR = "SPEC_PROMPT_RESPONSE_CACHE"
+CACHE_DIR_ENV_VAR = "SPEC_PROMPT_CACHE_DIR"
+CACHE_TTL_ENV_VAR = "SPEC_PROMPT_RESPONSE_CACHE_TTL_SECONDS"
+CACHE_MAX_MB_ENV_VAR = "SPEC_PROMPT_RESPONSE_CACHE_MAX_MB"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "spec-prompt"
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_DISK_BYTES = 64 * 1024 * 1024
+# Expired entries are swept, and the table size recounted, once per this many puts.
+SWEEP_EVERY_PUTS = 256
+
+# "index <old>..<new> [mode]" lines name blob hashes that differ between
+# otherwise identical diffs.
+_INDEX_LINE_RE = re.compile(r"^index [0-9a-f]+\.\.[0-9a-f]+(?: [0-7]+)?\n", re.MULTILINE)
+
+
+def canonical_prompt(text: str) -> str:
+    """Prompt text with volatile diff metadata removed."""
+    return _INDEX_LINE_RE.sub("", text)
+
+
+def response_key(
+    *,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    system_prompt: str,
+    user_prompt: str,
+    normalizer_version: int,
+) -> str:
+    payload = json.dumps(
+        [model, temperature, max_tokens, system_prompt, canonical_prompt(user_prompt), normalizer_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Memory LRU over an optional SQLite tier, with TTL and size-based eviction.
+
+    The memory tier and counters sit behind a short lock that never covers I/O,
+    so the event loop can check them directly; SQLite calls hold their own lock
+    and run in a worker thread on async paths (``get_async``/``put_async``).
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ) -> None:
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._db_lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._disk_error = ""
+        # Table size as this process last saw it, kept up to date on each put
+        # and recounted every ``SWEEP_EVERY_PUTS`` puts to pick up other writers.
+        self._disk_bytes = 0
+        self._puts_since_sweep = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._remember_disk_row(key, self._disk_get(key, now))
+
+    async def get_async(self, key: str) -> str | None:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self._disk_get, key, now) if self._has_disk else None
+        return self._remember_disk_row(key, row)
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        self._memory_put(key, value, now)
+        self._disk_put(key, value, now)
+
+    async def put_async(self, key: str, value: str) -> None:
+        now = time.time()
+        self._memory_put(key, value, now)
+        if self._has_disk:
+            await asyncio.to_thread(self._disk_put, key, value, now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "disk_path": str(self.path) if self.path else None,
+                "disk_error": self._disk_error or None,
+            }
+
+    @property
+    def _has_disk(self) -> bool:
+        return self.path is not None and not self._disk_error
+
+    def _memory_get(self, key: str, now: float) -> str | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry[1]
+            self._memory.pop(key, None)
+            return None
+
+    def _memory_put(self, key: str, value: str, now: float) -> None:
+        with self._lock:
+            self._remember(key, now, value)
+            self._counters["stores"] += 1
+
+    def _remember_disk_row(self, key: str, row: tuple[float, str] | None) -> str | None:
+        with self._lock:
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            created, value = row
+            self._remember(key, created, value)
+            self._counters["disk_hits"] += 1
+            return value
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, str] | None:
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT created, value FROM responses WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row is not None:
+                    with db:
+                        db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                # Locked by another process past the timeout: treat as a miss.
+                return None
+            return row
+
+    def _disk_put(self, key: str, value: str, now: float) -> None:
+        size = len(value.encode("utf-8"))
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                with db:
+                    previous = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                    db.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                        (key, value, size, now, now),
+                    )
+                    self._disk_bytes += size - (previous[0] if previous else 0)
+                    self._puts_since_sweep += 1
+                    evicted = 0
+                    if self._puts_since_sweep >= SWEEP_EVERY_PUTS:
+                        evicted = self._sweep(db, now)
+                    evicted += self._evict_to_size(db)
+            except sqlite3.Error:
+                # The memory tier still has the entry; another process may store it.
+                # Recount on the next put rather than trust a half-applied total.
+                self._puts_since_sweep = SWEEP_EVERY_PUTS
+                return
+        if evicted:
+            with self._lock:
+                self._counters["evictions"] += evicted
+
+    def _sweep(self, db: sqlite3.Connection, now: float) -> int:
+        """Drop expired entries and recount the table size; the only full scans, run every few puts."""
+        evicted = max(db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount, 0)
+        self._disk_bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._puts_since_sweep = 0
+        return evicted
+
+    def _evict_to_size(self, db: sqlite3.Connection) -> int:
+        """Drop least recently used entries until the table fits ``max_disk_bytes``."""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return 0
+        evicted = 0
+        while self._disk_bytes > self.max_disk_bytes:
+            oldest = db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 32").fetchall()
+            if not oldest:
+                self._disk_bytes = 0
+                break
+            for key, size in oldest:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                evicted += 1
+        return evicted
+
+    def _connection(self) -> sqlite3.Connection | None:
+        if self.path is None or self._disk_error:
+            return None
+        if self._db is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+                # WAL lets concurrent CLI processes read while one writes.
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+                db.commit()
+                self._disk_bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            except (OSError, sqlite3.Error) as exc:
+                # A read-only cache directory must not fail requests; keep
+                # serving from memory.
+                self._disk_error = str(exc)
+                return None
+            self._db = db
+        return self._db
+
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Return the process-wide cache, or ``None`` when ``SPEC_PROMPT_RESPONSE_CACHE=off``."""
+    global _cache
+    mode = os.getenv(CACHE_MODE_ENV_VAR, "disk").strip().lower()
+    if mode == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            directory = Path(os.getenv(CACHE_DIR_ENV_VAR, "") or DEFAULT_CACHE_DIR)
+            _cache = ResponseCache(
+                path=None if mode == "memory" else directory / "responses.sqlite3",
+                ttl_seconds=_number_env(CACHE_TTL_ENV_VAR, DEFAULT_TTL_SECONDS),
+                max_disk_bytes=int(_number_env(CACHE_MAX_MB_ENV_VAR, DEFAULT_MAX_DISK_BYTES / 1024 / 1024) * 1024 * 1024),
+            )
+        return _cache
+
+
+def _number_env(name: str, default: float) -> float:
+    raw = os.getenv(name, "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
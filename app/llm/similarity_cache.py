@@ -0,0 +1,196 @@
+"""Near-duplicate response cache over MinHash sketches of diff hunks.
+
+A diff is reduced to the set of its changed lines (per file, whitespace
+collapsed) and sketched as a one-permutation MinHash signature (one hash per
+line, so sketching is linear in the diff); banded LSH buckets find
+earlier diffs whose estimated Jaccard similarity clears a threshold, so a
+re-run after a one-line fix can reuse the earlier response. Lookups only
+touch the few entries sharing a bucket, which keeps them well under a
+millisecond with tens of thousands of entries.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import os
+import threading
+import time
+
+from app.diff_model import parse_diff
+
+
+SIMILARITY_CACHE_ENV_VAR = "SPEC_PROMPT_SIMILARITY_CACHE"
+SIMILARITY_THRESHOLD_ENV_VAR = "SPEC_PROMPT_SIMILARITY_THRESHOLD"
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_TTL_SECONDS = 24 * 3600
+# 32 bands of 4 rows: pairs at 0.9 similarity share a bucket with
+# probability ~1.0, pairs at 0.5 with ~0.87 and pairs at 0.3 with ~0.23.
+NUM_BANDS = 32
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+# Diffs with fewer changed lines are too small for a meaningful estimate.
+MIN_SHINGLES = 20
+
+# Offset added per bin when an empty bin borrows its neighbour's value, so
+# borrowed values never equal genuine ones.
+_DENSIFY_OFFSET = 1 << 58
+
+
+@dataclass(frozen=True)
+class SimilarMatch:
+    value: str
+    similarity: float
+
+
+def diff_shingles(diff_text: str) -> set[int]:
+    """Hashes of the normalized added/removed lines of every hunk, keyed by file."""
+    parsed = parse_diff(diff_text)
+    text = parsed.text
+    shingles: set[int] = set()
+    for file in parsed.files:
+        path = file.path
+        for hunk in file.hunks:
+            for line in text[hunk.body_start:hunk.end].split("\n"):
+                if line[:1] in ("+", "-") and line[1:].strip():
+                    shingles.add(_hash(f"{path}\0{line[0]}{' '.join(line[1:].split())}"))
+    return shingles
+
+
+def minhash(shingles: set[int]) -> tuple[int, ...]:
+    """One-permutation MinHash: each hash lands in one bin, each bin keeps its minimum.
+
+    Empty bins take the value of the next non-empty bin (rotation
+    densification), which keeps the per-bin match rate an estimate of Jaccard.
+    """
+    bins: list[int | None] = [None] * NUM_PERMUTATIONS
+    for value in shingles:
+        index, rank = value % NUM_PERMUTATIONS, value // NUM_PERMUTATIONS
+        current = bins[index]
+        if current is None or rank < current:
+            bins[index] = rank
+    if not any(value is not None for value in bins):
+        return tuple(bins)
+    signature = list(bins)
+    for index in range(NUM_PERMUTATIONS):
+        distance = 1
+        while signature[index] is None:
+            borrowed = bins[(index + distance) % NUM_PERMUTATIONS]
+            if borrowed is not None:
+                signature[index] = borrowed + distance * _DENSIFY_OFFSET
+            distance += 1
+    return tuple(signature)
+
+
+class SimilarityCache:
+    """Bounded LRU of signatures and responses with an LSH index per scope."""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, tuple[str, tuple[int, ...], str, float]] = OrderedDict()
+        self._buckets: dict[tuple[str, int, tuple[int, ...]], set[int]] = {}
+        self._next_id = 0
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "skipped": 0}
+
+    def sketch(self, diff_text: str) -> tuple[int, ...] | None:
+        """Signature of ``diff_text``, or ``None`` when it is too small to compare."""
+        shingles = diff_shingles(diff_text)
+        if len(shingles) < MIN_SHINGLES:
+            return None
+        return minhash(shingles)
+
+    def get(self, scope: str, signature: tuple[int, ...] | None) -> SimilarMatch | None:
+        """Best entry in ``scope`` whose estimated similarity reaches the threshold."""
+        with self._lock:
+            if signature is None:
+                self._counters["skipped"] += 1
+                return None
+            now = time.time()
+            best: SimilarMatch | None = None
+            for entry_id in self._candidates(scope, signature):
+                _scope, stored, value, created = self._entries[entry_id]
+                if now - created > self.ttl_seconds:
+                    continue
+                similarity = sum(1 for x, y in zip(signature, stored) if x == y) / NUM_PERMUTATIONS
+                if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                    best = SimilarMatch(value=value, similarity=similarity)
+                    self._entries.move_to_end(entry_id)
+            self._counters["hits" if best is not None else "misses"] += 1
+            return best
+
+    def put(self, scope: str, signature: tuple[int, ...] | None, value: str) -> None:
+        if signature is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, signature, value, time.time())
+            for band in range(NUM_BANDS):
+                self._buckets.setdefault(_band_key(scope, signature, band), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+            self._counters["stores"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "threshold": self.threshold}
+
+    def _candidates(self, scope: str, signature: tuple[int, ...]) -> set[int]:
+        candidates: set[int] = set()
+        for band in range(NUM_BANDS):
+            candidates |= self._buckets.get(_band_key(scope, signature, band), set())
+        return candidates
+
+    def _evict(self, entry_id: int) -> None:
+        scope, signature, _value, _created = self._entries.pop(entry_id)
+        for band in range(NUM_BANDS):
+            key = _band_key(scope, signature, band)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+_cache: SimilarityCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_similarity_cache() -> SimilarityCache | None:
+    """Return the process-wide cache when ``SPEC_PROMPT_SIMILARITY_CACHE`` is on."""
+    global _cache
+    if os.getenv(SIMILARITY_CACHE_ENV_VAR, "").strip().lower() not in {"1", "true", "yes", "on"}:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SimilarityCache(threshold=_threshold_from_env())
+        return _cache
+
+
+def _band_key(scope: str, signature: tuple[int, ...], band: int) -> tuple[str, int, tuple[int, ...]]:
+    start = band * ROWS_PER_BAND
+    return scope, band, signature[start:start + ROWS_PER_BAND]
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _threshold_from_env() -> float:
+    raw = os.getenv(SIMILARITY_THRESHOLD_ENV_VAR, "").strip()
+    try:
+        value = float(raw) if raw else DEFAULT_THRESHOLD
+    except ValueError:
+        return DEFAULT_THRESHOLD
+    return min(max(value, 0.0), 1.0)
@@ -0,0 +1,91 @@
+"""Coalesces identical concurrent LLM requests onto one upstream call.
+
+The first caller for a key starts a producer task; later callers with the same
+key subscribe to it and receive every piece produced so far, then the rest as
+it arrives. Each subscriber can be cancelled on its own; the upstream call is
+cancelled only when its last subscriber leaves. Producer failures are raised
+in every subscriber.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterator, Callable, Hashable
+import asyncio
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.pieces: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        self.wakeup.set()
+        self.wakeup = asyncio.Event()
+
+
+class SingleFlight:
+    """In-flight request table shared by the async LLM client paths."""
+
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, _Flight] = {}
+        self._counters = {"started": 0, "joined": 0, "cancelled": 0}
+
+    async def stream(self, key: Hashable, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Yield the pieces of the in-flight call for ``key``, starting ``produce()`` if there is none."""
+        flight = self._flights.get(key)
+        if flight is None or flight.loop is not asyncio.get_running_loop():
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, produce()))
+            self._counters["started"] += 1
+        else:
+            self._counters["joined"] += 1
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.pieces):
+                    yield flight.pieces[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wakeup.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is waiting any more; stop paying for the completion.
+                self._forget(key, flight)
+                flight.task.cancel()
+                self._counters["cancelled"] += 1
+
+    def stats(self) -> dict:
+        return {**self._counters, "in_flight": len(self._flights)}
+
+    async def _run(self, key: Hashable, flight: _Flight, pieces: AsyncIterator[str]) -> None:
+        try:
+            async for piece in pieces:
+                flight.pieces.append(piece)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as exc:
+            flight.error = exc
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            flight.notify()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+request_flights = SingleFlight()
@@ -0,0 +1,176 @@
+"""Offline token counting for prompt budgets.
+
+Counts are estimates by default: a tokenizer-free estimate tuned for source
+code and diffs, built to stay above real BPE counts (see ``estimate_tokens``)
+so budgets planned on it fit the context window. No rank files ship with the app and nothing
+is ever downloaded, so exact counts need ``tiktoken`` plus the model's BPE rank
+file in the directory named by ``SPEC_PROMPT_TOKENIZER_DIR``; a file whose
+checksum does not match is ignored.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+import base64
+import hashlib
+import math
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional in local environments
+    tiktoken = None
+
+
+TOKENIZER_DIR_ENV_VAR = "SPEC_PROMPT_TOKENIZER_DIR"
+DEFAULT_ENCODING = "o200k_base"
+COUNT_CACHE_SIZE = 8_192
+
+# Per-message framing tokens of the chat format, plus the reply primer.
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_PRIMING_TOKENS = 3
+
+# Split patterns, special tokens and rank-file hashes of the encodings used by
+# OpenAI chat models, as published with tiktoken. The rank files themselves
+# (``<name>.tiktoken``) are supplied by the operator in the tokenizer directory.
+_ENCODING_SPECS = {
+    "o200k_base": {
+        "pat_str": "|".join(
+            [
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""\p{N}{1,3}""",
+                r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+                r"""\s*[\r\n]+""",
+                r"""\s+(?!\S)""",
+                r"""\s+""",
+            ]
+        ),
+        "special_tokens": {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+        "sha256": "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+    },
+    "cl100k_base": {
+        "pat_str": (
+            r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|"""
+            r"""\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+        ),
+        "special_tokens": {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+        "sha256": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+    },
+}
+
+# Headroom on top of the estimate, for text it still underrates.
+ESTIMATE_MARGIN = 1.1
+
+_ESTIMATE_PIECE_RE = re.compile(r"[A-Za-z_]+|[0-9]+|[ \t]+|\n+|[^A-Za-z0-9_\s]+")
+# Words inside an identifier: "getHTTPResponse_code" is get, HTTP, Response, _code.
+_ESTIMATE_WORD_RE = re.compile(r"_*(?:[A-Z]+(?![a-z])|[A-Z]?[a-z]+)|_+")
+
+
+class TokenCounter:
+    """Counts tokens for one encoding, memoizing recent texts.
+
+    Diff hunks are counted one by one while planning, so repeated planning
+    over the same diff only tokenizes each hunk once.
+    """
+
+    def __init__(self, encoding: "tiktoken.Encoding | None" = None) -> None:
+        self._encoding = encoding
+        self.count = lru_cache(maxsize=COUNT_CACHE_SIZE)(self._count)
+
+    @property
+    def is_exact(self) -> bool:
+        return self._encoding is not None
+
+    @property
+    def name(self) -> str:
+        return self._encoding.name if self._encoding is not None else "estimate"
+
+    def count_chat(self, *messages: str) -> int:
+        """Prompt tokens of a chat request whose messages have these contents."""
+        return sum(self.count(message) + MESSAGE_OVERHEAD_TOKENS for message in messages) + REPLY_PRIMING_TOKENS
+
+    def _count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """Return the shared counter for ``model``'s encoding."""
+    return _counter_for_encoding(_encoding_name(model))
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free estimate meant to stay above real BPE counts.
+
+    Each word of an identifier (split at case changes and underscores) costs
+    one token per six characters, digits one per three, punctuation one per
+    two and indentation one per four spaces; a single space is free because
+    BPE merges it into the following word. Runs with non-ASCII characters
+    cost one token per two UTF-8 bytes. Dense text BPE cannot merge (hashes,
+    base64, minified code) breaks into many short words and character-class
+    changes, so it is charged close to a token per two or three characters
+    rather than by length. The total gets ``ESTIMATE_MARGIN`` on top.
+    """
+    total = 0
+    for piece in _ESTIMATE_PIECE_RE.findall(text):
+        first = piece[0]
+        if not piece.isascii():
+            total += (len(piece.encode("utf-8")) + 1) // 2
+        elif first.isalpha() or first == "_":
+            total += sum((len(word) + 5) // 6 for word in _ESTIMATE_WORD_RE.findall(piece))
+        elif first.isdigit():
+            total += (len(piece) + 2) // 3
+        elif first in " \t":
+            total += (len(piece) + 2) // 4
+        elif first == "\n":
+            total += 1
+        else:
+            total += (len(piece) + 1) // 2
+    return math.ceil(total * ESTIMATE_MARGIN)
+
+
+def _encoding_name(model: str) -> str:
+    if tiktoken is None:
+        return DEFAULT_ENCODING
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        return DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def _counter_for_encoding(name: str) -> TokenCounter:
+    return TokenCounter(_load_encoding(name))
+
+
+def _load_encoding(name: str) -> "tiktoken.Encoding | None":
+    spec = _ENCODING_SPECS.get(name)
+    directory = os.getenv(TOKENIZER_DIR_ENV_VAR, "").strip()
+    if tiktoken is None or spec is None or not directory:
+        return None
+    rank_file = Path(directory) / f"{name}.tiktoken"
+    if not rank_file.is_file():
+        return None
+    contents = rank_file.read_bytes()
+    if hashlib.sha256(contents).hexdigest() != spec["sha256"]:
+        return None
+    mergeable_ranks = {
+        base64.b64decode(token): int(rank)
+        for token, rank in (line.split() for line in contents.splitlines() if line)
+    }
+    return tiktoken.Encoding(
+        name=name,
+        pat_str=spec["pat_str"],
+        mergeable_ranks=mergeable_ranks,
+        special_tokens=spec["special_tokens"],
+    )
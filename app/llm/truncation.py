@@ -0,0 +1,259 @@
+"""File- and hunk-aware diff truncation for prompt budgets.
+
+Instead of cutting the diff at a fixed character offset, every file header and
+``@@`` hunk header is kept and the remaining budget is shared between files,
+so one large file cannot push every later file out of the prompt. Hunks that
+do not fit are replaced by a one-line elision marker.
+
+Sizes are measured with a caller-supplied function: ``len`` for character
+budgets or a token counter for token budgets. Every piece (header, hunk body,
+marker) is measured on its own, so a memoizing counter makes re-planning the
+same diff cheap.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable
+
+from app.diff_model import FileDiff, Hunk, ParsedDiff, parse_diff
+
+
+# No single file gets more than this share of the hunk budget while other
+# files still want room; budget left over after the fair pass is reassigned.
+FILE_CAP_FRACTION = 0.4
+MIN_PARTIAL_HUNK_CHARS = 200
+
+
+@dataclass(frozen=True)
+class TruncatedDiff:
+    text: str
+    was_truncated: bool
+    elided_hunks: int = 0
+    collapsed_files: int = 0
+
+
+def truncate_diff(diff_text: str, budget: int, measure: Callable[[str], int] = len) -> TruncatedDiff:
+    """Fit ``diff_text`` into ``budget`` while keeping every file and hunk header.
+
+    When even the headers do not fit, the files with the most hunks are
+    collapsed to their ``diff --git`` line first. Text that is not a git diff
+    is cut at a line boundary.
+    """
+    clean = diff_text.strip()
+    if measure is len and len(clean) <= budget:
+        return TruncatedDiff(text=clean, was_truncated=False)
+
+    parsed = parse_diff(clean)
+    if not parsed.files:
+        if measure(clean) <= budget:
+            return TruncatedDiff(text=clean, was_truncated=False)
+        return TruncatedDiff(text=_cut_at_line(clean, budget, measure), was_truncated=True)
+    if measure is not len and _total_size(parsed, measure) <= budget:
+        return TruncatedDiff(text=clean, was_truncated=False)
+
+    fitted = _fit_hunks(parsed, budget, measure)
+    if measure(fitted.text) <= budget:
+        return fitted
+    return TruncatedDiff(
+        text=_cut_at_line(fitted.text, budget, measure),
+        was_truncated=True,
+        elided_hunks=fitted.elided_hunks,
+        collapsed_files=fitted.collapsed_files,
+    )
+
+
+def _total_size(parsed: ParsedDiff, measure: Callable[[str], int]) -> int:
+    text = parsed.text
+    total = sum(measure(text[section.start:section.preamble_end]) for section in parsed.sections)
+    for file in parsed.files:
+        total += measure(text[file.start:file.header_end])
+        total += sum(measure(text[hunk.start:hunk.end]) for hunk in file.hunks)
+    return total
+
+
+def truncate_text(text: str, budget: int, measure: Callable[[str], int] = len) -> tuple[str, bool]:
+    """Cut plain text to ``budget`` at a line boundary; returns the text and whether it was cut."""
+    clean = text.strip()
+    if measure(clean) <= budget:
+        return clean, False
+    return _cut_at_line(clean, budget, measure), True
+
+
+def _fit_hunks(parsed: ParsedDiff, budget: int, measure: Callable[[str], int]) -> TruncatedDiff:
+    text = parsed.text
+    files = parsed.files
+    markers = {hunk: _elided_marker(hunk) for file in files for hunk in file.hunks}
+    collapsed = _files_to_collapse(parsed, markers, budget, measure)
+    hunks = [hunk for file in files if file not in collapsed for hunk in file.hunks]
+
+    available = budget - sum(measure(text[section.start:section.preamble_end]) for section in parsed.sections)
+    available -= sum(_skeleton_size(text, file, markers, measure) for file in files if file not in collapsed)
+    available -= sum(measure(_collapsed_file(text, file)) for file in collapsed)
+
+    # Extra size each hunk costs over its elision marker.
+    extra = {hunk: measure(text[hunk.body_start:hunk.end]) - measure(markers[hunk]) for hunk in hunks}
+    included: set[Hunk] = set()
+    for hunk in hunks:
+        if extra[hunk] <= 0:
+            included.add(hunk)
+            available -= extra[hunk]
+
+    kept_files = [file for file in files if file not in collapsed]
+    demands = [sum(extra[hunk] for hunk in file.hunks if hunk not in included) for file in kept_files]
+    allocations = _fair_shares(demands, max(available, 0), cap=int(max(available, 0) * FILE_CAP_FRACTION))
+    for file, allocation in zip(kept_files, allocations):
+        remaining = allocation
+        for hunk in file.hunks:
+            cost = extra[hunk]
+            if hunk not in included and cost <= remaining:
+                included.add(hunk)
+                remaining -= cost
+                available -= cost
+
+    # Second pass: budget a capped or packed file could not use goes to any
+    # remaining hunk that fits whole, then to one hunk cut at a line boundary.
+    for hunk in hunks:
+        if hunk not in included and extra[hunk] <= available:
+            included.add(hunk)
+            available -= extra[hunk]
+
+    partial: dict[Hunk, str] = {}
+    for hunk in hunks:
+        if hunk in included:
+            continue
+        cut = _partial_body(text, hunk, available + measure(markers[hunk]), measure)
+        if cut is not None:
+            partial[hunk] = cut
+        break
+
+    spans: list[tuple[int, int] | str] = []
+    for section in parsed.sections:
+        spans.append((section.start, section.preamble_end))
+        for file in section.files:
+            if file in collapsed:
+                spans.append(_collapsed_file(text, file))
+                continue
+            spans.append((file.start, file.header_end))
+            for hunk in file.hunks:
+                spans.append((hunk.start, hunk.body_start))
+                if hunk in included:
+                    spans.append((hunk.body_start, hunk.end))
+                elif hunk in partial:
+                    spans.append(partial[hunk])
+                else:
+                    spans.append(_after_newline(text, hunk.body_start, markers[hunk]))
+
+    total_hunks = sum(len(file.hunks) for file in files)
+    return TruncatedDiff(
+        text=parsed.render(spans).strip(),
+        was_truncated=True,
+        elided_hunks=total_hunks - len(included),
+        collapsed_files=len(collapsed),
+    )
+
+
+def _files_to_collapse(
+    parsed: ParsedDiff,
+    markers: dict[Hunk, str],
+    budget: int,
+    measure: Callable[[str], int],
+) -> set[FileDiff]:
+    """Files to reduce to one header line so the remaining headers fit, biggest savings first."""
+    text = parsed.text
+    skeleton = sum(measure(text[section.start:section.preamble_end]) for section in parsed.sections)
+    savings: list[tuple[int, int, FileDiff]] = []
+    for position, file in enumerate(parsed.files):
+        full = _skeleton_size(text, file, markers, measure)
+        skeleton += full
+        savings.append((full - measure(_collapsed_file(text, file)), -position, file))
+
+    collapsed: set[FileDiff] = set()
+    for saving, _position, file in sorted(savings, key=lambda item: item[:2], reverse=True):
+        if skeleton <= budget or saving <= 0:
+            break
+        collapsed.add(file)
+        skeleton -= saving
+    return collapsed
+
+
+def _skeleton_size(text: str, file: FileDiff, markers: dict[Hunk, str], measure: Callable[[str], int]) -> int:
+    """Size of a file with all of its hunk bodies elided."""
+    return measure(text[file.start:file.header_end]) + sum(
+        measure(text[hunk.start:hunk.body_start]) + measure(markers[hunk]) for hunk in file.hunks
+    )
+
+
+def _collapsed_file(text: str, file: FileDiff) -> str:
+    newline = text.find("\n", file.start, file.header_end)
+    header = text[file.start:file.header_end] + "\n" if newline < 0 else text[file.start:newline + 1]
+    if not file.hunks:
+        return header
+    count = len(file.hunks)
+    return f"{header}... ({count} {'hunk' if count == 1 else 'hunks'} elided)\n"
+
+
+def _fair_shares(demands: list[int], available: int, cap: int) -> list[int]:
+    """Max-min fair split of ``available``: small demands are met in full first."""
+    allocations = [0] * len(demands)
+    order = sorted(range(len(demands)), key=demands.__getitem__)
+    remaining = available
+    for position, index in enumerate(order):
+        share = min(cap, remaining // (len(order) - position))
+        allocations[index] = min(demands[index], max(share, 0))
+        remaining -= allocations[index]
+    return allocations
+
+
+def _partial_body(text: str, hunk: Hunk, room: int, measure: Callable[[str], int]) -> str | None:
+    """Leading whole lines of ``hunk`` plus a marker, if they fit in ``room``."""
+    # The marker for the whole hunk is at least as long as the final one.
+    room -= measure(_elided_marker(hunk, more=True))
+    body = text[hunk.body_start:hunk.end]
+    chars = _chars_for(body, room, measure)
+    if chars < MIN_PARTIAL_HUNK_CHARS:
+        return None
+    body_end = text.rfind("\n", hunk.body_start, hunk.body_start + chars) + 1
+    while body_end > hunk.body_start and measure(text[hunk.body_start:body_end]) > room:
+        body_end = text.rfind("\n", hunk.body_start, hunk.body_start + (body_end - hunk.body_start) * 3 // 4) + 1
+    if body_end <= hunk.body_start:
+        return None
+    added = hunk.added - text.count("\n+", hunk.body_start - 1, body_end - 1)
+    deleted = hunk.deleted - text.count("\n-", hunk.body_start - 1, body_end - 1)
+    return text[hunk.body_start:body_end] + f"... (+{added} -{deleted} more lines elided)\n"
+
+
+def _elided_marker(hunk: Hunk, more: bool = False) -> str:
+    lines = "more lines" if more else "lines"
+    return f"... (+{hunk.added} -{hunk.deleted} {lines} elided)\n"
+
+
+def _after_newline(text: str, position: int, piece: str) -> str:
+    if position > 0 and text[position - 1] != "\n":
+        return "\n" + piece
+    return piece
+
+
+def _cut_at_line(text: str, budget: int, measure: Callable[[str], int]) -> str:
+    limit = _chars_for(text, budget, measure)
+    while True:
+        cut = text[:limit]
+        newline = cut.rfind("\n")
+        if newline > limit // 2:
+            cut = cut[:newline]
+        cut = cut.rstrip()
+        if not cut or measure(cut) <= budget:
+            return cut
+        limit = limit * 3 // 4
+
+
+def _chars_for(text: str, size: int, measure: Callable[[str], int]) -> int:
+    """Characters of ``text`` expected to take ``size`` units, at its own density."""
+    if size <= 0:
+        return 0
+    if measure is len:
+        return min(size, len(text))
+    total = measure(text)
+    if total <= size:
+        return len(text)
+    return len(text) * size // total
@@ -3,6 +3,11 @@
 
 from __future__ import annotations
 
+from pathlib import Path
+import asyncio
+import json
+import sys
+
 import typer
 
 try:
@@ -11,14 +16,30 @@ except ImportError:  # pragma: no cover - optional in local environments
     def load_dotenv() -> None:
         return None
 
+from app.bulk import BulkItem, BulkTarget, run_bulk
+from app.diff_exclusions import DiffExclusions
 from app.git_diff_getter import (
-    DEFAULT_MAX_DIFF_CHARS,
+    DiffResult,
     EmptyDiffError,
     GitDiffError,
     InvalidRepoPathError,
     get_repo_diff,
+    record_diff_snapshot,
+)
+from app.llm.batch import BatchError
+from app.llm.budget import BudgetError, PromptBudget
+from app.llm.pool import close_client_registry_async
+from app.llm.client import (
+    LLMClient,
+    LLMClientError,
+    LLMConfig,
+    MissingAPIKeyError,
+    plan_analysis_budgets,
+    plan_request_budget,
 )
-from app.llm.client import LLMClient, LLMClientError, MissingAPIKeyError
+
+SUGGEST_HEADING = "# Suggested Next Prompt"
+REFINE_HEADING = "# Refined Prompt"
 
 app = typer.Typer(
     name="spec-prompt",
@@ -27,43 +48,187 @@ app = typer.Typer(
 )
 
 
-def _run_mode(*, repo: str, max_diff_chars: int, mode: str, last_prompt: str | None = None) -> None:
+def _run_mode(
+    *,
+    repo: str,
+    max_diff_chars: int | None,
+    mode: str,
+    last_prompt: str | None = None,
+    exclude: list[str] | None = None,
+    default_excludes: bool = True,
+    since_last: bool = False,
+    stream: bool = False,
+    use_cache: bool = True,
+) -> None:
     load_dotenv()
     try:
-        diff_result = get_repo_diff(repo_path=repo, max_diff_chars=max_diff_chars)
-        if diff_result.warning:
-            typer.echo(diff_result.warning, err=True)
+        config = LLMConfig.from_env()
+        if mode == "both":
+            # One diff read serves both prompts; each trims it to its own budget.
+            budget, refine_budget = plan_analysis_budgets(config, last_prompt or "")
+            read_chars = max(budget.diff_chars, refine_budget.diff_chars)
+        else:
+            budget = plan_request_budget(config, mode, last_prompt or "")
+            read_chars = budget.diff_chars
+        exclusions = DiffExclusions.build(exclude or [], use_defaults=default_excludes)
+        diff_result = get_repo_diff(
+            repo_path=repo,
+            max_diff_chars=min(max_diff_chars or read_chars, read_chars),
+            exclusions=exclusions,
+            since_last=since_last,
+        )
 
-        client = LLMClient()
+        client = LLMClient(config=config, use_cache=use_cache)
 
-        if mode == "suggest":
-            result = client.suggest_from_diff(diff_result.diff_text)
+        if mode == "both":
+            asyncio.run(_echo_analysis(client, diff_result, last_prompt or "", budget, refine_budget, stream))
+            result = ""
+        elif stream:
+            _echo_stream(client, mode, diff_result, budget, last_prompt or "")
+            result = ""
+        elif mode == "suggest":
+            result = client.suggest_from_diff(
+                diff_result.diff_text,
+                budget=budget,
+                diff_truncated=diff_result.was_truncated,
+            )
         else:
             result = client.refine_from_diff(
                 diff_text=diff_result.diff_text,
                 last_prompt=last_prompt or "",
+                budget=budget,
+                diff_truncated=diff_result.was_truncated,
             )
-    except (InvalidRepoPathError, EmptyDiffError, MissingAPIKeyError) as exc:
+        if diff_result.snapshot:
+            record_diff_snapshot(repo, diff_result.snapshot)
+    except (InvalidRepoPathError, EmptyDiffError, MissingAPIKeyError, BudgetError) as exc:
         typer.echo(f"Error: {exc}", err=True)
         raise typer.Exit(code=2)
     except (GitDiffError, LLMClientError) as exc:
         typer.echo(f"Error: {exc}", err=True)
         raise typer.Exit(code=1)
 
-    typer.echo(result.rstrip())
+    if result:
+        typer.echo(result.rstrip())
+
+
+def _echo_stream(client: LLMClient, mode: str, diff_result: DiffResult, budget: PromptBudget, last_prompt: str) -> None:
+    """Print the completion as it is generated."""
+    if mode == "suggest":
+        pieces = client.stream_suggest_from_diff(
+            diff_result.diff_text,
+            budget=budget,
+            diff_truncated=diff_result.was_truncated,
+        )
+    else:
+        pieces = client.stream_refine_from_diff(
+            diff_text=diff_result.diff_text,
+            last_prompt=last_prompt,
+            budget=budget,
+            diff_truncated=diff_result.was_truncated,
+        )
+    ended_with_newline = True
+    for piece in pieces:
+        sys.stdout.write(piece)
+        sys.stdout.flush()
+        ended_with_newline = piece.endswith("\n")
+    if not ended_with_newline:
+        typer.echo()
+
+
+async def _echo_analysis(
+    client: LLMClient,
+    diff_result: DiffResult,
+    last_prompt: str,
+    suggest_budget: PromptBudget,
+    refine_budget: PromptBudget,
+    stream: bool,
+) -> None:
+    """Print the suggestion, then the refinement, generating both concurrently.
+
+    With ``stream`` the suggestion is printed as it is generated; the
+    refinement is held until then.
+    """
+    args = dict(
+        diff_text=diff_result.diff_text,
+        last_prompt=last_prompt,
+        suggest_budget=suggest_budget,
+        refine_budget=refine_budget,
+        diff_truncated=diff_result.was_truncated,
+    )
+    try:
+        if not stream:
+            analysis = await client.analyze_from_diff_async(**args)
+            if analysis.warning:
+                typer.echo(f"{analysis.warning}\n")
+            typer.echo(f"{SUGGEST_HEADING}\n\n{analysis.suggest.rstrip()}\n")
+            typer.echo(f"{REFINE_HEADING}\n\n{analysis.refine.rstrip()}")
+            return
+
+        held: list[str] = []
+        started = False
+        async for mode, piece in client.stream_analyze_from_diff_async(**args):
+            if mode == "refine":
+                held.append(piece)
+                continue
+            if mode == "warning":
+                piece = f"{piece}\n\n"
+            elif not started:
+                started = True
+                piece = f"{SUGGEST_HEADING}\n\n{piece}"
+            sys.stdout.write(piece)
+            sys.stdout.flush()
+        typer.echo(f"\n{REFINE_HEADING}\n\n{''.join(held).rstrip()}")
+    finally:
+        # The async pool belongs to this event loop, which ends with the command.
+        await close_client_registry_async()
 
 
 @app.command("suggest")
 def suggest(
     repo: str = typer.Option(..., "--repo", help="Path to a git repository to inspect."),
-    max_diff_chars: int = typer.Option(
-        DEFAULT_MAX_DIFF_CHARS,
+    max_diff_chars: int | None = typer.Option(
+        None,
         "--max-diff-chars",
-        help=f"Maximum diff size to send to the model (default: {DEFAULT_MAX_DIFF_CHARS}).",
+        help="Maximum diff characters to read from git (default: derived from the model's token budget).",
+    ),
+    exclude: list[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Extra gitignore-style path pattern to leave out of the diff (repeatable).",
+    ),
+    default_excludes: bool = typer.Option(
+        True,
+        "--default-excludes/--no-default-excludes",
+        help="Leave vendored, lockfile, minified, binary and generated paths out of the diff.",
+    ),
+    since_last: bool = typer.Option(
+        False,
+        "--since-last",
+        help="Only send changes made since the last --since-last run on this repo.",
+    ),
+    stream: bool = typer.Option(
+        True,
+        "--stream/--no-stream",
+        help="Print the output as the model generates it.",
+    ),
+    use_cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse a cached response for an identical prompt.",
     ),
 ) -> None:
     """Generate a recommended next prompt from current git changes."""
-    _run_mode(repo=repo, max_diff_chars=max_diff_chars, mode="suggest")
+    _run_mode(
+        repo=repo,
+        max_diff_chars=max_diff_chars,
+        mode="suggest",
+        exclude=exclude,
+        default_excludes=default_excludes,
+        since_last=since_last,
+        stream=stream,
+        use_cache=use_cache,
+    )
 
 
 @app.command("refine")
@@ -74,14 +239,219 @@ def refine(
         "--last-prompt",
         help="The previous prompt to critique and rewrite.",
     ),
-    max_diff_chars: int = typer.Option(
-        DEFAULT_MAX_DIFF_CHARS,
+    max_diff_chars: int | None = typer.Option(
+        None,
         "--max-diff-chars",
-        help=f"Maximum diff size to send to the model (default: {DEFAULT_MAX_DIFF_CHARS}).",
+        help="Maximum diff characters to read from git (default: derived from the model's token budget).",
+    ),
+    exclude: list[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Extra gitignore-style path pattern to leave out of the diff (repeatable).",
+    ),
+    default_excludes: bool = typer.Option(
+        True,
+        "--default-excludes/--no-default-excludes",
+        help="Leave vendored, lockfile, minified, binary and generated paths out of the diff.",
+    ),
+    since_last: bool = typer.Option(
+        False,
+        "--since-last",
+        help="Only send changes made since the last --since-last run on this repo.",
+    ),
+    stream: bool = typer.Option(
+        True,
+        "--stream/--no-stream",
+        help="Print the output as the model generates it.",
+    ),
+    use_cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse a cached response for an identical prompt.",
     ),
 ) -> None:
     """Rewrite a previous prompt using current git changes."""
-    _run_mode(repo=repo, max_diff_chars=max_diff_chars, mode="refine", last_prompt=last_prompt)
+    _run_mode(
+        repo=repo,
+        max_diff_chars=max_diff_chars,
+        mode="refine",
+        last_prompt=last_prompt,
+        exclude=exclude,
+        default_excludes=default_excludes,
+        since_last=since_last,
+        stream=stream,
+        use_cache=use_cache,
+    )
+
+
+@app.command("both")
+def both(
+    repo: str = typer.Option(..., "--repo", help="Path to a git repository to inspect."),
+    last_prompt: str = typer.Option(
+        ...,
+        "--last-prompt",
+        help="The previous prompt to critique and rewrite.",
+    ),
+    max_diff_chars: int | None = typer.Option(
+        None,
+        "--max-diff-chars",
+        help="Maximum diff characters to read from git (default: derived from the model's token budget).",
+    ),
+    exclude: list[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Extra gitignore-style path pattern to leave out of the diff (repeatable).",
+    ),
+    default_excludes: bool = typer.Option(
+        True,
+        "--default-excludes/--no-default-excludes",
+        help="Leave vendored, lockfile, minified, binary and generated paths out of the diff.",
+    ),
+    since_last: bool = typer.Option(
+        False,
+        "--since-last",
+        help="Only send changes made since the last --since-last run on this repo.",
+    ),
+    stream: bool = typer.Option(
+        True,
+        "--stream/--no-stream",
+        help="Print the suggestion as the model generates it.",
+    ),
+    use_cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse cached responses for identical prompts.",
+    ),
+) -> None:
+    """Suggest a next prompt and rewrite a previous one from a single read of the git changes."""
+    _run_mode(
+        repo=repo,
+        max_diff_chars=max_diff_chars,
+        mode="both",
+        last_prompt=last_prompt,
+        exclude=exclude,
+        default_excludes=default_excludes,
+        since_last=since_last,
+        stream=stream,
+        use_cache=use_cache,
+    )
+
+
+@app.command("batch")
+def batch(
+    targets: list[str] = typer.Argument(
+        None,
+        help="Repositories to report on: PATH for the working tree, PATH@REF for the commits on REF.",
+    ),
+    targets_file: Path | None = typer.Option(
+        None,
+        "--targets-file",
+        help="File with one PATH or PATH@REF per line ('#' starts a comment).",
+    ),
+    mode: str = typer.Option("suggest", "--mode", help="suggest or refine."),
+    last_prompt: str | None = typer.Option(None, "--last-prompt", help="Previous prompt, for --mode refine."),
+    base: str = typer.Option("HEAD", "--base", help="Ref that PATH@REF targets are compared against."),
+    exclude: list[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Extra gitignore-style path pattern to leave out of the diff (repeatable).",
+    ),
+    default_excludes: bool = typer.Option(
+        True,
+        "--default-excludes/--no-default-excludes",
+        help="Leave vendored, lockfile, minified, binary and generated paths out of the diff.",
+    ),
+    local: bool = typer.Option(
+        False,
+        "--local",
+        help="Send the requests directly instead of through the OpenAI Batch API.",
+    ),
+    concurrency: int = typer.Option(8, "--concurrency", help="Parallel git processes (and requests with --local)."),
+    poll_seconds: float = typer.Option(30.0, "--poll-seconds", help="Seconds between Batch API status checks."),
+    requests_file: Path | None = typer.Option(
+        None,
+        "--requests-file",
+        help="Keep the Batch API request file here (default: a temporary file).",
+    ),
+    output: Path | None = typer.Option(
+        None,
+        "--output",
+        help="Write one JSON result per line to this file (default: stdout).",
+    ),
+    use_cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse cached responses instead of resending identical prompts.",
+    ),
+) -> None:
+    """Suggest or refine prompts for many repositories and refs in one Batch API job."""
+    load_dotenv()
+    specs = list(targets or [])
+    if targets_file is not None:
+        lines = targets_file.read_text(encoding="utf-8").splitlines()
+        specs.extend(line.split("#", 1)[0].strip() for line in lines)
+    bulk_targets = [BulkTarget.parse(spec) for spec in specs if spec.strip()]
+    if not bulk_targets:
+        typer.echo("Error: no targets given.", err=True)
+        raise typer.Exit(code=2)
+    if mode not in {"suggest", "refine"}:
+        typer.echo("Error: --mode must be 'suggest' or 'refine'.", err=True)
+        raise typer.Exit(code=2)
+    if mode == "refine" and not (last_prompt or "").strip():
+        typer.echo("Error: --mode refine requires a non-empty --last-prompt.", err=True)
+        raise typer.Exit(code=2)
+
+    def report(item: BulkItem) -> None:
+        detail = item.error or "; ".join(item.issues)
+        typer.echo(f"[{item.status}] {item.target.label}" + (f": {detail}" if detail else ""), err=True)
+
+    try:
+        config = LLMConfig.from_env()
+        budget = plan_request_budget(config, mode, last_prompt or "")
+        client = LLMClient(config=config, use_cache=use_cache)
+        items = asyncio.run(
+            _run_bulk(
+                bulk_targets,
+                client,
+                budget,
+                mode=mode,
+                last_prompt=last_prompt or "",
+                base=base,
+                exclusions=DiffExclusions.build(exclude or [], use_defaults=default_excludes),
+                local=local,
+                concurrency=concurrency,
+                poll_seconds=poll_seconds,
+                requests_path=requests_file,
+                report=report,
+                progress=lambda message: typer.echo(message, err=True),
+            )
+        )
+    except (MissingAPIKeyError, BudgetError) as exc:
+        typer.echo(f"Error: {exc}", err=True)
+        raise typer.Exit(code=2)
+    except (BatchError, LLMClientError) as exc:
+        typer.echo(f"Error: {exc}", err=True)
+        raise typer.Exit(code=1)
+
+    lines = "".join(json.dumps(item.to_json(), ensure_ascii=False) + "\n" for item in items)
+    if output is None:
+        sys.stdout.write(lines)
+    else:
+        output.write_text(lines, encoding="utf-8")
+    counts: dict[str, int] = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    typer.echo(", ".join(f"{count} {status}" for status, count in sorted(counts.items())), err=True)
+    if any(item.status in {"error", "failed"} for item in items):
+        raise typer.Exit(code=1)
+
+
+async def _run_bulk(*args, **kwargs) -> list[BulkItem]:
+    try:
+        return await run_bulk(*args, **kwargs)
+    finally:
+        # The async pool belongs to this event loop, which ends with the command.
+        await close_client_registry_async()
 
 
 if __name__ == "__main__":
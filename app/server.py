@@ -2,11 +2,15 @@
 
 from __future__ import annotations
 
-from typing import Callable
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+import asyncio
+import json
+import math
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, constr
 
 try:
@@ -15,9 +19,44 @@ except ImportError:  # pragma: no cover - optional in local environments
     def load_dotenv() -> None:
         return None
 
-from app.git_diff_getter import EmptyDiffError, GitDiffError, InvalidRepoPathError, get_repo_diff
-from app.llm.client import LLMClient, LLMClientError, MissingAPIKeyError
-
+from app.deadlines import (
+    DEADLINE_HEADER,
+    ClientDisconnectedError,
+    RequestDeadline,
+    RequestTimeoutError,
+    cancellation_metrics,
+)
+from app.diff_exclusions import DiffExclusions
+from app.git_diff_getter import (
+    DEFAULT_GIT_TIMEOUT_SECONDS,
+    DiffResult,
+    EmptyDiffError,
+    GitDiffError,
+    GitTimeoutError,
+    InvalidRepoPathError,
+    WorktreeCache,
+    get_repo_diff_async,
+    record_diff_snapshot_async,
+)
+from app.llm.client import (
+    LLMClient,
+    LLMClientError,
+    LLMConfig,
+    MissingAPIKeyError,
+    RateLimitedError,
+    UpstreamTimeoutError,
+    plan_analysis_budgets,
+    plan_request_budget,
+)
+from app.llm.cascade import cascade_metrics
+from app.llm.pool import close_client_registry_async, get_client_registry
+from app.llm.rate_limit import get_rate_limiter
+from app.llm.resilience import upstream_metrics
+from app.llm.response_cache import get_response_cache
+from app.llm.similarity_cache import get_similarity_cache
+from app.llm.single_flight import request_flights
+
+T = TypeVar("T")
 NonEmptyStr = constr(strip_whitespace=True, min_length=1)
 
 
@@ -25,6 +64,10 @@ class SuggestRequest(BaseModel):
     repo_path: NonEmptyStr | None = None
     diff_text: NonEmptyStr | None = None
     diff: NonEmptyStr | None = None
+    exclude: list[NonEmptyStr] | None = None
+    use_default_excludes: bool = True
+    since_last: bool = False
+    use_cache: bool = True
 
 
 class RefineRequest(BaseModel):
@@ -33,10 +76,37 @@ class RefineRequest(BaseModel):
     diff: NonEmptyStr | None = None
     last_prompt: NonEmptyStr | None = None
     prompt: NonEmptyStr | None = None
+    exclude: list[NonEmptyStr] | None = None
+    use_default_excludes: bool = True
+    since_last: bool = False
+    use_cache: bool = True
+
+
+class AnalyzeRequest(BaseModel):
+    repo_path: NonEmptyStr | None = None
+    diff_text: NonEmptyStr | None = None
+    diff: NonEmptyStr | None = None
+    last_prompt: NonEmptyStr | None = None
+    prompt: NonEmptyStr | None = None
+    exclude: list[NonEmptyStr] | None = None
+    use_default_excludes: bool = True
+    since_last: bool = False
+    use_cache: bool = True
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    # One pooled OpenAI HTTP client per process, shared by every request.
+    get_client_registry()
+    try:
+        yield
+    finally:
+        await close_client_registry_async()
 
 
 load_dotenv()
-app = FastAPI(title="SpecPrompt API", version="0.1.0")
+worktree_cache = WorktreeCache()
+app = FastAPI(title="SpecPrompt API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -51,74 +121,547 @@ async def health_check() -> str:
     return "ok"
 
 
+@app.get("/api/stats")
+async def stats() -> dict:
+    cache = get_response_cache()
+    similar = get_similarity_cache()
+    limiter = get_rate_limiter()
+    return {
+        "openai_pool": get_client_registry().stats(),
+        "response_cache": cache.stats() if cache is not None else None,
+        "similarity_cache": similar.stats() if similar is not None else None,
+        "single_flight": request_flights.stats(),
+        "upstream": upstream_metrics.stats(),
+        "rate_limit": limiter.stats() if limiter is not None else None,
+        "cascade": cascade_metrics.stats(),
+        "cancellation": cancellation_metrics.stats(),
+    }
+
+
 @app.post("/api/suggest", response_class=PlainTextResponse)
-async def suggest(payload: SuggestRequest) -> PlainTextResponse:
-    text = _run_with_error_mapping(
-        lambda: _suggest_text(
-            repo_path=payload.repo_path,
-            diff_text=payload.diff_text,
-            legacy_diff=payload.diff,
+async def suggest(payload: SuggestRequest, request: Request) -> PlainTextResponse:
+    deadline = _request_deadline(request)
+    text = await _run_with_error_mapping(
+        lambda: _until_deadline(
+            request,
+            deadline,
+            _suggest_text(
+                repo_path=payload.repo_path,
+                diff_text=payload.diff_text,
+                legacy_diff=payload.diff,
+                exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+                since_last=payload.since_last,
+                use_cache=payload.use_cache,
+                deadline=deadline,
+            ),
         ),
     )
     return PlainTextResponse(content=text, media_type="text/plain")
 
 
 @app.post("/api/refine", response_class=PlainTextResponse)
-async def refine(payload: RefineRequest) -> PlainTextResponse:
-    text = _run_with_error_mapping(
-        lambda: _refine_text(
-            repo_path=payload.repo_path,
-            diff_text=payload.diff_text,
-            legacy_diff=payload.diff,
-            last_prompt=payload.last_prompt,
-            legacy_prompt=payload.prompt,
+async def refine(payload: RefineRequest, request: Request) -> PlainTextResponse:
+    deadline = _request_deadline(request)
+    text = await _run_with_error_mapping(
+        lambda: _until_deadline(
+            request,
+            deadline,
+            _refine_text(
+                repo_path=payload.repo_path,
+                diff_text=payload.diff_text,
+                legacy_diff=payload.diff,
+                last_prompt=payload.last_prompt,
+                legacy_prompt=payload.prompt,
+                exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+                since_last=payload.since_last,
+                use_cache=payload.use_cache,
+                deadline=deadline,
+            ),
         ),
     )
     return PlainTextResponse(content=text, media_type="text/plain")
 
 
-def _suggest_text(repo_path: str | None, diff_text: str | None, legacy_diff: str | None) -> str:
-    warning, resolved_diff_text = _resolve_diff_input(
+@app.post("/api/suggest/stream")
+async def suggest_stream(payload: SuggestRequest, request: Request) -> StreamingResponse:
+    deadline = _request_deadline(request)
+    chunks = _suggest_chunks(
+        repo_path=payload.repo_path,
+        diff_text=payload.diff_text,
+        legacy_diff=payload.diff,
+        exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+        since_last=payload.since_last,
+        use_cache=payload.use_cache,
+        deadline=deadline,
+    )
+    return await _streaming_response(request, deadline, chunks)
+
+
+@app.post("/api/refine/stream")
+async def refine_stream(payload: RefineRequest, request: Request) -> StreamingResponse:
+    deadline = _request_deadline(request)
+    chunks = _refine_chunks(
+        repo_path=payload.repo_path,
+        diff_text=payload.diff_text,
+        legacy_diff=payload.diff,
+        last_prompt=payload.last_prompt,
+        legacy_prompt=payload.prompt,
+        exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+        since_last=payload.since_last,
+        use_cache=payload.use_cache,
+        deadline=deadline,
+    )
+    return await _streaming_response(request, deadline, chunks)
+
+
+@app.post("/api/analyze")
+async def analyze(payload: AnalyzeRequest, request: Request) -> dict:
+    """Suggest and refine from one diff read, with both completions running concurrently."""
+    deadline = _request_deadline(request)
+    return await _run_with_error_mapping(
+        lambda: _until_deadline(
+            request,
+            deadline,
+            _analyze_result(
+                repo_path=payload.repo_path,
+                diff_text=payload.diff_text,
+                legacy_diff=payload.diff,
+                last_prompt=payload.last_prompt,
+                legacy_prompt=payload.prompt,
+                exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+                since_last=payload.since_last,
+                use_cache=payload.use_cache,
+                deadline=deadline,
+            ),
+        ),
+    )
+
+
+@app.post("/api/analyze/stream")
+async def analyze_stream(payload: AnalyzeRequest, request: Request) -> StreamingResponse:
+    """Newline-delimited JSON events ``{"mode": ..., "text": ...}``, interleaved as both modes generate.
+
+    ``mode`` is ``warning`` (first, when the diff was truncated), ``suggest``,
+    ``refine``, or ``error`` when generation fails after the response started.
+    """
+    deadline = _request_deadline(request)
+    chunks = _analyze_chunks(
+        repo_path=payload.repo_path,
+        diff_text=payload.diff_text,
+        legacy_diff=payload.diff,
+        last_prompt=payload.last_prompt,
+        legacy_prompt=payload.prompt,
+        exclusions=DiffExclusions.build(payload.exclude or [], payload.use_default_excludes),
+        since_last=payload.since_last,
+        use_cache=payload.use_cache,
+        deadline=deadline,
+    )
+    return await _streaming_response(
+        request,
+        deadline,
+        chunks,
+        media_type="application/x-ndjson",
+        error_chunk=_analyze_error_chunk,
+    )
+
+
+async def _suggest_text(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
+) -> str:
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("suggest", config, exclusions)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        return cached
+
+    budget = plan_request_budget(config, "suggest")
+    diff_result = await _resolve_diff_input(
         repo_path=repo_path,
         diff_text=diff_text,
         legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=budget.diff_chars,
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
+    )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    text = await client.suggest_from_diff_async(
+        diff_result.diff_text,
+        budget=budget,
+        diff_truncated=diff_result.was_truncated,
     )
-    client = LLMClient()
-    result = client.suggest_from_diff(resolved_diff_text)
-    return _with_optional_warning(warning, result)
+    await _remember_repo_output(repo_path, cache_key, diff_result, text)
+    return text
 
 
-def _refine_text(
+async def _refine_text(
     repo_path: str | None,
     diff_text: str | None,
     legacy_diff: str | None,
     last_prompt: str | None,
     legacy_prompt: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
 ) -> str:
-    warning, resolved_diff_text = _resolve_diff_input(
+    resolved_last_prompt = _resolve_last_prompt(last_prompt=last_prompt, legacy_prompt=legacy_prompt)
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("refine", config, exclusions, resolved_last_prompt)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        return cached
+
+    budget = plan_request_budget(config, "refine", resolved_last_prompt)
+    diff_result = await _resolve_diff_input(
+        repo_path=repo_path,
+        diff_text=diff_text,
+        legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=budget.diff_chars,
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
+    )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    text = await client.refine_from_diff_async(
+        diff_text=diff_result.diff_text,
+        last_prompt=resolved_last_prompt,
+        budget=budget,
+        diff_truncated=diff_result.was_truncated,
+    )
+    await _remember_repo_output(repo_path, cache_key, diff_result, text)
+    return text
+
+
+async def _suggest_chunks(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
+) -> AsyncIterator[str]:
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("suggest", config, exclusions)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    budget = plan_request_budget(config, "suggest")
+    diff_result = await _resolve_diff_input(
         repo_path=repo_path,
         diff_text=diff_text,
         legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=budget.diff_chars,
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
     )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    parts: list[str] = []
+    async for piece in client.stream_suggest_from_diff_async(
+        diff_result.diff_text,
+        budget=budget,
+        diff_truncated=diff_result.was_truncated,
+    ):
+        parts.append(piece)
+        yield piece
+    await _remember_repo_output(repo_path, cache_key, diff_result, "".join(parts))
+
+
+async def _refine_chunks(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    last_prompt: str | None,
+    legacy_prompt: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
+) -> AsyncIterator[str]:
     resolved_last_prompt = _resolve_last_prompt(last_prompt=last_prompt, legacy_prompt=legacy_prompt)
-    client = LLMClient()
-    result = client.refine_from_diff(diff_text=resolved_diff_text, last_prompt=resolved_last_prompt)
-    return _with_optional_warning(warning, result)
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("refine", config, exclusions, resolved_last_prompt)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    budget = plan_request_budget(config, "refine", resolved_last_prompt)
+    diff_result = await _resolve_diff_input(
+        repo_path=repo_path,
+        diff_text=diff_text,
+        legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=budget.diff_chars,
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
+    )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    parts: list[str] = []
+    async for piece in client.stream_refine_from_diff_async(
+        diff_text=diff_result.diff_text,
+        last_prompt=resolved_last_prompt,
+        budget=budget,
+        diff_truncated=diff_result.was_truncated,
+    ):
+        parts.append(piece)
+        yield piece
+    await _remember_repo_output(repo_path, cache_key, diff_result, "".join(parts))
+
+
+async def _analyze_result(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    last_prompt: str | None,
+    legacy_prompt: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
+) -> dict:
+    resolved_last_prompt = _resolve_last_prompt(last_prompt=last_prompt, legacy_prompt=legacy_prompt)
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("analyze", config, exclusions, resolved_last_prompt)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    suggest_budget, refine_budget = plan_analysis_budgets(config, resolved_last_prompt)
+    diff_result = await _resolve_diff_input(
+        repo_path=repo_path,
+        diff_text=diff_text,
+        legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=max(suggest_budget.diff_chars, refine_budget.diff_chars),
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
+    )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    analysis = await client.analyze_from_diff_async(
+        diff_text=diff_result.diff_text,
+        last_prompt=resolved_last_prompt,
+        suggest_budget=suggest_budget,
+        refine_budget=refine_budget,
+        diff_truncated=diff_result.was_truncated,
+    )
+    result = analysis.to_json()
+    await _remember_repo_output(repo_path, cache_key, diff_result, json.dumps(result))
+    return result
+
+
+async def _analyze_chunks(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    last_prompt: str | None,
+    legacy_prompt: str | None,
+    exclusions: DiffExclusions,
+    since_last: bool = False,
+    use_cache: bool = True,
+    deadline: RequestDeadline | None = None,
+) -> AsyncIterator[str]:
+    resolved_last_prompt = _resolve_last_prompt(last_prompt=last_prompt, legacy_prompt=legacy_prompt)
+    deadline = deadline or RequestDeadline.from_header(None)
+    config = LLMConfig.from_env()
+    cache_key = ("analyze", config, exclusions, resolved_last_prompt)
+    cached = None if since_last or not use_cache else _cached_repo_output(repo_path, diff_text or legacy_diff, cache_key)
+    if cached is not None:
+        result = json.loads(cached)
+        for mode in ("warning", "suggest", "refine"):
+            if result[mode]:
+                yield _analyze_event(mode, result[mode])
+        return
+
+    suggest_budget, refine_budget = plan_analysis_budgets(config, resolved_last_prompt)
+    diff_result = await _resolve_diff_input(
+        repo_path=repo_path,
+        diff_text=diff_text,
+        legacy_diff=legacy_diff,
+        exclusions=exclusions,
+        max_diff_chars=max(suggest_budget.diff_chars, refine_budget.diff_chars),
+        since_last=since_last,
+        timeout_seconds=deadline.bound(DEFAULT_GIT_TIMEOUT_SECONDS),
+    )
+    client = LLMClient(config=config, use_cache=use_cache, deadline=deadline.expires_at)
+    parts: dict[str, list[str]] = {"warning": [], "suggest": [], "refine": []}
+    async for mode, piece in client.stream_analyze_from_diff_async(
+        diff_text=diff_result.diff_text,
+        last_prompt=resolved_last_prompt,
+        suggest_budget=suggest_budget,
+        refine_budget=refine_budget,
+        diff_truncated=diff_result.was_truncated,
+    ):
+        parts[mode].append(piece)
+        yield _analyze_event(mode, piece)
+    result = {mode: "".join(pieces) for mode, pieces in parts.items()}
+    await _remember_repo_output(repo_path, cache_key, diff_result, json.dumps(result))
+
+
+def _analyze_event(mode: str, text: str) -> str:
+    return json.dumps({"mode": mode, "text": text}) + "\n"
+
+
+def _analyze_error_chunk(exc: Exception) -> str:
+    return _analyze_event("error", str(exc))
+
+
+def _plain_error_chunk(exc: Exception) -> str:
+    return f"\n\nError: {exc}\n"
+
+
+async def _streaming_response(
+    request: Request,
+    deadline: RequestDeadline,
+    chunks: AsyncIterator[str],
+    media_type: str = "text/plain; charset=utf-8",
+    error_chunk: Callable[[Exception], str] = _plain_error_chunk,
+) -> StreamingResponse:
+    """Start ``chunks`` and stream the rest; failures before the first chunk map to HTTP errors."""
+    first = await _run_with_error_mapping(lambda: _until_deadline(request, deadline, anext(chunks, "")))
+    return StreamingResponse(
+        _continue_stream(first, chunks, error_chunk, deadline),
+        media_type=media_type,
+        # Ask reverse proxies not to buffer the response.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _continue_stream(
+    first: str,
+    chunks: AsyncIterator[str],
+    error_chunk: Callable[[Exception], str],
+    deadline: RequestDeadline,
+) -> AsyncIterator[str]:
+    yield first
+    try:
+        while (piece := await _next_chunk(chunks, deadline)) is not None:
+            yield piece
+    except (LLMClientError, GitDiffError, RequestTimeoutError) as exc:
+        # Headers are already sent, so the error can only be reported in the body.
+        yield error_chunk(exc)
+    except (asyncio.CancelledError, GeneratorExit):
+        # Starlette stops the response when the client disconnects.
+        cancellation_metrics.add("client_disconnects")
+        raise
+    finally:
+        # Closes the upstream stream if generation is still running.
+        await chunks.aclose()
+
+
+async def _next_chunk(chunks: AsyncIterator[str], deadline: RequestDeadline) -> str | None:
+    try:
+        return await asyncio.wait_for(anext(chunks, None), deadline.remaining())
+    except asyncio.TimeoutError as exc:
+        # ``wait_for`` has cancelled ``chunks``, which ends its git or upstream work.
+        cancellation_metrics.add("deadline_exceeded")
+        raise RequestTimeoutError(f"Request did not finish within {deadline.timeout_seconds:g} seconds.") from exc
 
 
-def _resolve_diff_input(repo_path: str | None, diff_text: str | None, legacy_diff: str | None) -> tuple[str, str]:
+def _request_deadline(request: Request) -> RequestDeadline:
+    try:
+        return RequestDeadline.from_header(request.headers.get(DEADLINE_HEADER))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+async def _until_deadline(request: Request, deadline: RequestDeadline, work: Awaitable[T]) -> T:
+    """Await ``work``; cancel it when the deadline passes or the client disconnects first."""
+    task = asyncio.ensure_future(work)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _pending = await asyncio.wait(
+            {task, disconnect},
+            timeout=deadline.remaining(),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    finally:
+        disconnect.cancel()
+        task.cancel()
+    if task in done:
+        return task.result()
+    # Let the cancelled work kill its git processes and close upstream calls before answering.
+    await asyncio.wait({task})
+    if disconnect in done:
+        cancellation_metrics.add("client_disconnects")
+        raise ClientDisconnectedError("Client disconnected before the request finished.")
+    cancellation_metrics.add("deadline_exceeded")
+    raise RequestTimeoutError(f"Request did not finish within {deadline.timeout_seconds:g} seconds.")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has been read already, so the next message is the disconnect.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _resolve_diff_input(
+    repo_path: str | None,
+    diff_text: str | None,
+    legacy_diff: str | None,
+    exclusions: DiffExclusions,
+    max_diff_chars: int,
+    since_last: bool = False,
+    timeout_seconds: float | None = DEFAULT_GIT_TIMEOUT_SECONDS,
+) -> DiffResult:
     manual_diff = (diff_text or legacy_diff or "").strip()
     if manual_diff:
-        return "", manual_diff
+        return DiffResult(diff_text=manual_diff, was_truncated=False, warning="")
 
     resolved_repo = (repo_path or "").strip()
+    if resolved_repo and since_last:
+        # The delta depends on the recorded snapshot, not only on the tree.
+        return await get_repo_diff_async(
+            resolved_repo,
+            max_diff_chars,
+            timeout_seconds,
+            exclusions=exclusions,
+            since_last=True,
+        )
     if resolved_repo:
-        diff_result = get_repo_diff(repo_path=resolved_repo)
-        return diff_result.warning, diff_result.diff_text
+        return await worktree_cache.get_diff_async(
+            repo_path=resolved_repo,
+            max_diff_chars=max_diff_chars,
+            timeout_seconds=timeout_seconds,
+            exclusions=exclusions,
+        )
 
     raise ValueError("Provide either 'repo_path' or 'diff_text' in the request body.")
 
 
+def _cached_repo_output(repo_path: str | None, manual_diff: str | None, key: tuple) -> str | None:
+    """Return the stored output for an unchanged repo, skipping git and the LLM."""
+    resolved_repo = (repo_path or "").strip()
+    if (manual_diff or "").strip() or not resolved_repo:
+        return None
+    return worktree_cache.get_output(resolved_repo, key)
+
+
+async def _remember_repo_output(repo_path: str | None, key: tuple, diff_result: DiffResult, text: str) -> None:
+    resolved_repo = (repo_path or "").strip()
+    if not resolved_repo:
+        return
+    if diff_result.snapshot:
+        await record_diff_snapshot_async(resolved_repo, diff_result.snapshot)
+        return
+    worktree_cache.put_output(resolved_repo, key, diff_result, text)
+
+
 def _resolve_last_prompt(last_prompt: str | None, legacy_prompt: str | None) -> str:
     resolved = (last_prompt or legacy_prompt or "").strip()
     if resolved:
@@ -126,15 +669,9 @@ def _resolve_last_prompt(last_prompt: str | None, legacy_prompt: str | None) ->
     raise ValueError("Refine mode requires 'last_prompt' (or legacy 'prompt').")
 
 
-def _with_optional_warning(warning: str, body: str) -> str:
-    if not warning:
-        return body
-    return f"{warning}\n\n{body}"
-
-
-def _run_with_error_mapping(fn: Callable[[], str]) -> str:
+async def _run_with_error_mapping(fn: Callable[[], Awaitable[T]]) -> T:
     try:
-        return fn()
+        return await fn()
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except InvalidRepoPathError as exc:
@@ -143,7 +680,22 @@ def _run_with_error_mapping(fn: Callable[[], str]) -> str:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except MissingAPIKeyError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    except RateLimitedError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        ) from exc
+    except UpstreamTimeoutError as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from exc
     except LLMClientError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
+    except GitTimeoutError as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from exc
+    except RequestTimeoutError as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from exc
+    except ClientDisconnectedError as exc:
+        # Nobody reads this; 499 keeps disconnects apart from failures in access logs.
+        raise HTTPException(status_code=499, detail=str(exc)) from exc
     except GitDiffError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
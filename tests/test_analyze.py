@@ -0,0 +1,72 @@
+import json
+import subprocess
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import git_diff_getter, server
+from app.llm import client as llm_client
+from app.llm.backends import LocalBackend
+
+DIFF = "diff --git a/x b/x\n+x\n"
+LAST_PROMPT = "Add a retry to the upload step."
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: LocalBackend(latency_seconds=0.3))
+    return TestClient(server.app)
+
+
+def test_analyze_matches_the_single_mode_endpoints(api):
+    body = {"diff_text": DIFF, "last_prompt": LAST_PROMPT, "use_cache": False}
+    started = time.monotonic()
+    result = api.post("/api/analyze", json=body).json()
+    # Both completions run at once: one latency, not two.
+    assert time.monotonic() - started < 0.55
+
+    assert result["warning"] == ""
+    assert result["suggest"] == api.post("/api/suggest", json=body).text
+    assert result["refine"] == api.post("/api/refine", json=body).text
+
+
+def test_analyze_reads_the_repo_diff_once(api, monkeypatch, tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "-C", str(repo), "init", "-q"], check=True)
+    (repo / "notes.txt").write_text("todo\n")
+    subprocess.run(["git", "-C", str(repo), "add", "."], check=True)
+    reads = []
+    read_diff = git_diff_getter.get_repo_diff_async
+
+    async def counting_read(*args, **kwargs):
+        reads.append(args)
+        return await read_diff(*args, **kwargs)
+
+    monkeypatch.setattr(git_diff_getter, "get_repo_diff_async", counting_read)
+    response = api.post("/api/analyze", json={"repo_path": str(repo), "last_prompt": LAST_PROMPT, "use_cache": False})
+    assert response.status_code == 200
+    assert response.json()["suggest"] and response.json()["refine"]
+    assert len(reads) == 1
+
+
+def test_analyze_stream_interleaves_both_modes(api):
+    body = {"diff_text": DIFF, "last_prompt": LAST_PROMPT, "use_cache": False}
+    with api.stream("POST", "/api/analyze/stream", json=body) as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        events = [json.loads(line) for line in response.iter_lines() if line]
+
+    modes = [event["mode"] for event in events]
+    assert set(modes) == {"suggest", "refine"}
+    assert modes.index("refine") < len(modes) - modes[::-1].index("suggest") - 1
+    result = api.post("/api/analyze", json=body).json()
+    for mode in ("suggest", "refine"):
+        assert "".join(event["text"] for event in events if event["mode"] == mode) == result[mode]
+
+
+def test_analyze_requires_a_last_prompt(api):
+    response = api.post("/api/analyze", json={"diff_text": DIFF})
+    assert response.status_code == 400
+    assert "last_prompt" in response.json()["detail"]
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app import server
+from app.llm import client as llm_client
+from app.llm.backends import LocalBackend
+from app.llm.client import LLMClient
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class AsyncOnlyBackend(LocalBackend):
+    def complete(self, args: dict, timeout: float) -> str:
+        raise AssertionError("the server must not block the event loop on a sync completion")
+
+
+def test_async_results_match_sync(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    client = LLMClient(backend=LocalBackend())
+    assert asyncio.run(client.suggest_from_diff_async(DIFF)) == client.suggest_from_diff(DIFF)
+    assert asyncio.run(client.refine_from_diff_async(DIFF, "Add tests.")) == client.refine_from_diff(
+        DIFF, "Add tests."
+    )
+
+
+def test_concurrent_completions_overlap(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    client = LLMClient(backend=LocalBackend(latency_seconds=0.3))
+
+    async def run():
+        return await asyncio.gather(*(client.suggest_from_diff_async(f"{DIFF}+{index}\n") for index in range(5)))
+
+    started = time.monotonic()
+    results = asyncio.run(run())
+    assert time.monotonic() - started < 1.0
+    assert len(results) == 5 and all(results)
+
+
+def test_server_awaits_the_async_backend(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: AsyncOnlyBackend())
+    api = TestClient(server.app)
+    suggest = api.post("/api/suggest", json={"diff_text": DIFF, "use_cache": False})
+    refine = api.post("/api/refine", json={"diff_text": DIFF, "last_prompt": "Add tests.", "use_cache": False})
+    assert suggest.status_code == refine.status_code == 200
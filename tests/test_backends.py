@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+
+from app.llm.backends import LocalBackend, OpenAIBackend
+from app.llm.client import LLMClient, LLMClientError, _client_error
+
+ARGS = {
+    "model": "local-test",
+    "max_tokens": 40,
+    "messages": [
+        {"role": "system", "content": "1) Project Understanding\n2) Recommended Next Prompt"},
+        {"role": "user", "content": "diff --git a/x b/x"},
+    ],
+}
+
+
+def test_local_stream_may_outlast_the_attempt_timeout():
+    backend = LocalBackend(tokens_per_second=400)
+    started = time.monotonic()
+    pieces = list(backend.open_stream(ARGS, timeout=0.05))
+    assert len(pieces) == 40
+    assert time.monotonic() - started > 0.05
+
+
+def test_local_async_stream_may_outlast_the_attempt_timeout():
+    async def run():
+        stream = await LocalBackend(tokens_per_second=400).open_stream_async(ARGS, timeout=0.05)
+        return [piece async for piece in stream]
+
+    assert "".join(asyncio.run(run())) == "".join(LocalBackend().open_stream(ARGS, timeout=1.0))
+
+
+def test_local_stream_too_slow_for_one_token_fails_before_output():
+    with pytest.raises(TimeoutError):
+        LocalBackend(tokens_per_second=1).open_stream(ARGS, timeout=0.1)
+
+
+def test_errors_name_the_backend():
+    assert str(_client_error(RuntimeError("boom"), LocalBackend.label)) == "The local backend request failed: boom"
+    assert OpenAIBackend("key", 30.0).label == "OpenAI"
+    assert OpenAIBackend("key", 30.0, "https://gateway.internal/v1").label == "The API at gateway.internal"
+
+
+def test_empty_completion_names_the_backend(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    client = LLMClient(backend=LocalBackend())
+    prepared = client.prepare_request("suggest", "diff --git a/x b/x\n+x\n")
+    with pytest.raises(LLMClientError, match="^The local backend returned an empty completion"):
+        client.finish_prepared(prepared, "  ")
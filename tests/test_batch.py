@@ -0,0 +1,101 @@
+import asyncio
+import json
+import subprocess
+
+from typer.testing import CliRunner
+
+from app import main
+from app.llm.batch import BATCH_ENDPOINT, BatchResult, LocalBatchRunner, read_results, write_requests
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t", *args], check=True)
+
+
+def _repo(path):
+    path.mkdir()
+    _git(path, "init", "-q", "-b", "main")
+    (path / "app.py").write_text("x = 1\n")
+    _git(path, "add", ".")
+    _git(path, "commit", "-qm", "init")
+    return path
+
+
+def _output_line(custom_id, status_code=200, body=None, error=None):
+    response = None if error else {"status_code": status_code, "body": body or {}}
+    return json.dumps({"custom_id": custom_id, "response": response, "error": error})
+
+
+def test_requests_are_written_in_batch_input_format(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "naïve"}]}
+    assert write_requests(path, [("item-0", body), ("item-1", body)]) == 2
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"custom_id": f"item-{index}", "method": "POST", "url": BATCH_ENDPOINT, "body": body} for index in range(2)
+    ]
+    assert "naïve" in lines[0]
+
+
+def test_results_are_read_from_output_and_error_lines():
+    choice = {"choices": [{"message": {"role": "assistant", "content": "answer"}}]}
+    lines = [
+        _output_line("ok", body=choice),
+        "",
+        _output_line("rejected", status_code=400, body={"error": {"message": "bad request"}}),
+        _output_line("server", status_code=500),
+        _output_line("empty", body={"choices": []}),
+        _output_line("expired", error={"code": "batch_expired", "message": "The batch expired."}),
+    ]
+    assert read_results(lines) == {
+        "ok": BatchResult("ok", text="answer"),
+        "rejected": BatchResult("rejected", error="bad request"),
+        "server": BatchResult("server", error="HTTP 500"),
+        "empty": BatchResult("empty", error="OpenAI returned no completion choices."),
+        "expired": BatchResult("expired", error="The batch expired."),
+    }
+
+
+def test_local_runner_writes_an_output_file(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    write_requests(path, [("good", {"content": "hi"}), ("bad", {"content": "fail"})])
+
+    async def send(body):
+        if body["content"] == "fail":
+            raise RuntimeError("upstream failed")
+        return {"choices": [{"message": {"content": body["content"].upper()}}]}
+
+    results = asyncio.run(LocalBatchRunner(send, concurrency=1).run(path, lambda message: None))
+    assert results == {"good": BatchResult("good", text="HI"), "bad": BatchResult("bad", error="upstream failed")}
+    output = (tmp_path / "requests.output.jsonl").read_text(encoding="utf-8").splitlines()
+    assert read_results(output) == results
+
+
+def test_batch_command_reports_every_target(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_LLM_BACKEND", "local")
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    dirty = _repo(tmp_path / "dirty")
+    (dirty / "app.py").write_text("x = 2\n")
+    branched = _repo(tmp_path / "branched")
+    _git(branched, "checkout", "-qb", "feature")
+    (branched / "feature.py").write_text("y = 1\n")
+    _git(branched, "add", ".")
+    _git(branched, "commit", "-qm", "feature")
+    clean = _repo(tmp_path / "clean")
+    requests_file = tmp_path / "requests.jsonl"
+    output = tmp_path / "results.jsonl"
+
+    targets = [str(dirty), f"{branched}@feature", str(clean), str(tmp_path / "missing")]
+    options = ["--base", "main", "--local", "--requests-file", str(requests_file), "--output", str(output)]
+    result = CliRunner().invoke(main.app, ["batch", *targets, *options])
+    assert result.exit_code == 1
+    items = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [(item["repo"], item["ref"], item["status"]) for item in items] == [
+        (str(dirty), None, "ok"),
+        (str(branched), "feature", "ok"),
+        (str(clean), None, "empty"),
+        (str(tmp_path / "missing"), None, "error"),
+    ]
+    assert all(item["output"] for item in items[:2])
+    assert len(requests_file.read_text(encoding="utf-8").splitlines()) == 2
+    assert "1 empty, 1 error, 2 ok" in result.output
@@ -0,0 +1,85 @@
+import pytest
+
+from app.llm.backends import LocalBackend
+from app.llm.budget import (
+    DEFAULT_MODEL_LIMITS,
+    LAST_PROMPT_SHARE,
+    MODEL_LIMITS,
+    PROMPT_SLACK_TOKENS,
+    BudgetError,
+    adaptive_output_tokens,
+    model_limits,
+    plan_budget,
+)
+from app.llm.client import LLMClient, LLMConfig, plan_request_budget
+from app.llm.tokens import get_token_counter
+
+
+class RecordingBackend(LocalBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests: list[dict] = []
+
+    def complete(self, args: dict, timeout: float) -> str:
+        self.requests.append(args)
+        return super().complete(args, timeout)
+
+
+def test_model_limits_match_the_longest_prefix():
+    assert model_limits("gpt-4-32k-0613") == MODEL_LIMITS["gpt-4-32k"]
+    assert model_limits(" GPT-4o-mini ") == MODEL_LIMITS["gpt-4o"]
+    assert model_limits("gpt-4-0613") == MODEL_LIMITS["gpt-4"]
+    assert model_limits("my-local-model") == DEFAULT_MODEL_LIMITS
+
+
+def test_small_window_splits_between_diff_last_prompt_and_output():
+    budget = plan_budget(
+        "gpt-4", max_output_tokens=1_000, max_diff_tokens=100_000, overhead_tokens=300, last_prompt_tokens=50_000
+    )
+    room = 8_192 - 1_000 - 300 - PROMPT_SLACK_TOKENS
+    assert budget.output_tokens == 1_000
+    assert budget.last_prompt_tokens == int(room * LAST_PROMPT_SHARE)
+    assert budget.diff_tokens == room - budget.last_prompt_tokens
+    assert budget.diff_chars > budget.diff_tokens
+
+
+def test_last_prompt_takes_what_the_capped_diff_leaves():
+    budget = plan_budget(
+        "gpt-4", max_output_tokens=1_000, max_diff_tokens=500, overhead_tokens=300, last_prompt_tokens=5_000
+    )
+    assert (budget.diff_tokens, budget.last_prompt_tokens) == (500, 5_000)
+
+
+def test_output_is_capped_by_the_model_and_a_full_template_is_rejected():
+    assert plan_budget("gpt-4", max_output_tokens=50_000, max_diff_tokens=1, overhead_tokens=0).output_tokens == 4_096
+    with pytest.raises(BudgetError, match="8192-token context window"):
+        plan_budget("gpt-4", max_output_tokens=4_096, max_diff_tokens=1_000, overhead_tokens=4_100)
+
+
+def test_adaptive_output_tokens_grow_with_the_request():
+    assert adaptive_output_tokens("suggest", 500, 4_096) < adaptive_output_tokens("suggest", 10_000, 4_096)
+    assert adaptive_output_tokens("refine", 500, 4_096) > adaptive_output_tokens("suggest", 500, 4_096)
+    assert adaptive_output_tokens("suggest", 10_000, 900) == 900
+    assert adaptive_output_tokens("unknown", 10, 900) == 900
+
+
+def test_cascade_uses_the_tightest_tier():
+    config = LLMConfig(model="gpt-4o", cascade=("gpt-4o", "gpt-4"), max_diff_tokens=100_000)
+    budget = plan_request_budget(config, "suggest")
+    assert budget.model == "gpt-4"
+
+
+def test_prompt_sent_to_a_small_model_fits_its_window(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    backend = RecordingBackend()
+    config = LLMConfig(model="gpt-4", max_tokens=2_000, max_diff_tokens=100_000)
+    diff = "diff --git a/big.py b/big.py\n@@ -1,4000 +1,4000 @@\n" + "".join(
+        f"+value_{index} = compute({index}, factor={index * 7})\n" for index in range(4_000)
+    )
+    budget = plan_request_budget(config, "refine", "previous prompt " * 5_000)
+
+    output = LLMClient(config=config, backend=backend).refine_from_diff(diff, "previous prompt " * 5_000, budget)
+    assert output.startswith("Warning: git diff exceeded")
+    (args,) = backend.requests
+    system, user = (message["content"] for message in args["messages"])
+    assert get_token_counter("gpt-4").count_chat(system, user) + args["max_tokens"] <= 8_192
@@ -0,0 +1,23 @@
+from app.bulk import BulkTarget
+
+
+def test_parse_working_tree_and_ref(tmp_path):
+    assert BulkTarget.parse(f" {tmp_path} ") == BulkTarget(repo=str(tmp_path))
+    assert BulkTarget.parse(f"{tmp_path}@feature-x") == BulkTarget(repo=str(tmp_path), ref="feature-x")
+
+
+def test_parse_keeps_at_signs_inside_the_ref(tmp_path):
+    assert BulkTarget.parse(f"{tmp_path}@HEAD@{{1}}") == BulkTarget(repo=str(tmp_path), ref="HEAD@{1}")
+    assert BulkTarget.parse(f"{tmp_path}@main@{{upstream}}").ref == "main@{upstream}"
+
+
+def test_parse_directory_names_with_at_signs(tmp_path):
+    repo = tmp_path / "team@2"
+    repo.mkdir()
+    assert BulkTarget.parse(str(repo)) == BulkTarget(repo=str(repo))
+    assert BulkTarget.parse(f"{repo}@v1.0") == BulkTarget(repo=str(repo), ref="v1.0")
+
+
+def test_parse_missing_path_splits_at_first_at_sign(tmp_path):
+    target = BulkTarget.parse(f"{tmp_path}/missing@HEAD@{{2}}")
+    assert target == BulkTarget(repo=f"{tmp_path}/missing", ref="HEAD@{2}")
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from app.llm.backends import LocalBackend
+from app.llm.cascade import cascade_metrics
+from app.llm.client import LLMClient, LLMClientError, LLMConfig
+from app.llm.resilience import RetryPolicy
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class FailingBackend(LocalBackend):
+    """Local answers, except that listed models fail after ``delay`` seconds."""
+
+    def __init__(self, failing: set[str], delay: float = 0.0) -> None:
+        super().__init__()
+        self.failing = failing
+        self.delay = delay
+        self.timeouts: dict[str, float] = {}
+
+    def complete(self, args: dict, timeout: float) -> str:
+        self.timeouts[args["model"]] = timeout
+        if args["model"] in self.failing:
+            time.sleep(self.delay)
+            raise RuntimeError(f"{args['model']} is down")
+        return super().complete(args, timeout)
+
+    def open_stream(self, args: dict, timeout: float):
+        self.timeouts[args["model"]] = timeout
+        if args["model"] in self.failing:
+            raise RuntimeError(f"{args['model']} is down")
+        return super().open_stream(args, timeout)
+
+
+def _client(monkeypatch, backend: FailingBackend, *models: str, deadline_seconds: float = 60.0) -> LLMClient:
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    config = LLMConfig(model=models[0], cascade=models, retry=RetryPolicy(deadline_seconds=deadline_seconds))
+    return LLMClient(config=config, backend=backend)
+
+
+def _errors(model: str) -> int:
+    return cascade_metrics.stats().get(model, {}).get("errors", 0)
+
+
+def test_final_tier_failure_is_recorded(monkeypatch):
+    client = _client(monkeypatch, FailingBackend({"final-a", "final-b"}), "final-a", "final-b")
+    with pytest.raises(LLMClientError, match="final-b is down"):
+        client.suggest_from_diff(DIFF)
+    assert (_errors("final-a"), _errors("final-b")) == (1, 1)
+
+
+def test_final_stream_tier_failure_is_recorded(monkeypatch):
+    client = _client(monkeypatch, FailingBackend({"stream-a", "stream-b"}), "stream-a", "stream-b")
+    with pytest.raises(LLMClientError, match="stream-b is down"):
+        "".join(client.stream_suggest_from_diff(DIFF))
+    assert (_errors("stream-a"), _errors("stream-b")) == (1, 1)
+
+
+def test_tiers_share_one_retry_deadline(monkeypatch):
+    backend = FailingBackend({"shared-a"}, delay=0.3)
+    client = _client(monkeypatch, backend, "shared-a", "shared-b", deadline_seconds=0.5)
+    assert client.suggest_from_diff(DIFF)
+    assert backend.timeouts["shared-a"] > 0.45
+    assert backend.timeouts["shared-b"] < 0.25
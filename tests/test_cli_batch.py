@@ -0,0 +1,13 @@
+from typer.testing import CliRunner
+
+from app import main
+
+
+def test_refine_batch_without_last_prompt_fails_before_git(monkeypatch, tmp_path):
+    def no_git_work(*args, **kwargs):
+        raise AssertionError("diffs were collected")
+
+    monkeypatch.setattr(main, "_run_bulk", no_git_work)
+    result = CliRunner().invoke(main.app, ["batch", str(tmp_path), "--mode", "refine", "--last-prompt", "  "])
+    assert result.exit_code == 2
+    assert "--mode refine requires a non-empty --last-prompt" in result.output
@@ -0,0 +1,111 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import server
+from app.deadlines import (
+    DEADLINE_HEADER,
+    DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    ClientDisconnectedError,
+    RequestDeadline,
+    cancellation_metrics,
+)
+from app.llm import client as llm_client
+from app.llm.backends import LocalBackend
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class DisconnectingRequest:
+    """Stands in for a Starlette request whose client goes away after ``delay`` seconds."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    async def receive(self) -> dict:
+        await asyncio.sleep(self.delay)
+        return {"type": "http.disconnect"}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    return TestClient(server.app)
+
+
+def _use_backend(monkeypatch, backend):
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: backend)
+
+
+def test_header_may_shorten_but_not_extend_the_server_timeout(monkeypatch):
+    assert RequestDeadline.from_header(None).timeout_seconds == DEFAULT_REQUEST_TIMEOUT_SECONDS
+    assert RequestDeadline.from_header(" 5 ").timeout_seconds == 5.0
+    assert RequestDeadline.from_header("1e9").timeout_seconds == DEFAULT_REQUEST_TIMEOUT_SECONDS
+    monkeypatch.setenv("SPEC_PROMPT_REQUEST_TIMEOUT_SECONDS", "30")
+    assert RequestDeadline.from_header("").timeout_seconds == 30.0
+    for value in ("abc", "0", "-1", "nan", "inf"):
+        with pytest.raises(ValueError, match=DEADLINE_HEADER):
+            RequestDeadline.from_header(value)
+
+
+def test_invalid_header_is_a_bad_request(api):
+    response = api.post("/api/suggest", json={"diff_text": DIFF}, headers={DEADLINE_HEADER: "soon"})
+    assert response.status_code == 400
+
+
+def test_slow_completion_times_out_at_the_deadline(api, monkeypatch):
+    _use_backend(monkeypatch, LocalBackend(latency_seconds=5.0))
+    exceeded = cancellation_metrics.stats()["deadline_exceeded"]
+    started = time.monotonic()
+    response = api.post("/api/suggest", json={"diff_text": DIFF}, headers={DEADLINE_HEADER: "0.3"})
+    assert response.status_code == 504
+    assert time.monotonic() - started < 2.0
+    assert cancellation_metrics.stats()["deadline_exceeded"] > exceeded
+
+
+def test_stream_past_the_deadline_ends_with_an_error(api, monkeypatch):
+    _use_backend(monkeypatch, LocalBackend(tokens_per_second=20))
+    started = time.monotonic()
+    response = api.post("/api/suggest/stream", json={"diff_text": DIFF}, headers={DEADLINE_HEADER: "0.5"})
+    assert response.status_code == 200
+    assert time.monotonic() - started < 2.0
+    assert response.text.rstrip().endswith("Error: Request did not finish within 0.5 seconds.")
+
+
+def test_deadline_kills_slow_git(api, monkeypatch, tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "-C", str(repo), "init", "-q"], check=True)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "git").write_text("#!/bin/sh\nexec sleep 30\n")
+    (bin_dir / "git").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:/usr/bin:/bin")
+    killed = cancellation_metrics.stats()["git_processes_killed"]
+
+    started = time.monotonic()
+    response = api.post("/api/suggest", json={"repo_path": str(repo)}, headers={DEADLINE_HEADER: "0.3"})
+    assert response.status_code == 504
+    assert time.monotonic() - started < 2.0
+    assert cancellation_metrics.stats()["git_processes_killed"] > killed
+
+
+def test_client_disconnect_cancels_the_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    disconnects = cancellation_metrics.stats()["client_disconnects"]
+    deadline = RequestDeadline.start(10)
+    with pytest.raises(ClientDisconnectedError):
+        asyncio.run(server._until_deadline(DisconnectingRequest(0.05), deadline, work()))
+    assert cancelled == [1]
+    assert cancellation_metrics.stats()["client_disconnects"] == disconnects + 1
@@ -0,0 +1,24 @@
+from app.diff_exclusions import DEFAULT_EXCLUDE_PATTERNS, EXCLUDES_ENV_VAR, NO_EXCLUSIONS, DiffExclusions
+
+
+def test_default_constructor_reads_env_patterns(monkeypatch):
+    monkeypatch.setenv(EXCLUDES_ENV_VAR, "fixtures/, *.snap")
+    exclusions = DiffExclusions()
+    assert exclusions.patterns == DEFAULT_EXCLUDE_PATTERNS
+    assert ":(exclude,top,glob)**/fixtures/**" in exclusions.pathspecs()
+    assert ":(exclude,top,glob)**/*.snap" in exclusions.pathspecs()
+    assert exclusions == DiffExclusions.build()
+
+
+def test_turning_defaults_off_keeps_env_patterns(monkeypatch):
+    monkeypatch.setenv(EXCLUDES_ENV_VAR, "fixtures/")
+    exclusions = DiffExclusions.build(["/docs"], use_defaults=False)
+    assert exclusions.pathspecs() == [
+        ":(exclude,top,glob)docs",
+        ":(exclude,top,glob)**/fixtures/**",
+    ]
+
+
+def test_no_exclusions_ignores_env(monkeypatch):
+    monkeypatch.setenv(EXCLUDES_ENV_VAR, "fixtures/")
+    assert NO_EXCLUSIONS.pathspecs() == []
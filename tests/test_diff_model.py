@@ -0,0 +1,97 @@
+import subprocess
+
+from app.diff_model import (
+    STATUS_ADDED,
+    STATUS_DELETED,
+    STATUS_MODE_CHANGED,
+    STATUS_MODIFIED,
+    STATUS_RENAMED,
+    parse_diff,
+)
+
+
+SAMPLE = """### UNSTAGED CHANGES
+diff --git a/app.py b/app.py
+index 1111111..2222222 100644
+--- a/app.py
++++ b/app.py
+@@ -1,3 +1,4 @@
+ import os
+-x = 1
++x = 2
++y = 3
+@@ -10 +11 @@ def main():
+-    return x
++    return y
+
+### STAGED CHANGES
+Omitted to fit the diff budget (1 file): poetry.lock (+900 -0)
+diff --git a/logo.png b/logo.png
+new file mode 100644
+index 0000000..3333333
+Binary files /dev/null and b/logo.png differ
+diff --git a/old name.txt b/new name.txt
+similarity index 100%
+rename from old name.txt
+rename to new name.txt
+"""
+
+
+def _git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+def test_sections_files_and_hunks_are_indexed():
+    parsed = parse_diff(SAMPLE)
+    assert [section.title for section in parsed.sections] == ["UNSTAGED CHANGES", "STAGED CHANGES"]
+
+    app, logo, renamed = parsed.files
+    assert (app.path, app.status, app.added, app.deleted) == ("app.py", STATUS_MODIFIED, 3, 2)
+    assert [(hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count) for hunk in app.hunks] == [
+        (1, 3, 1, 4),
+        (10, 1, 11, 1),
+    ]
+    assert (logo.old_path, logo.new_path, logo.status, logo.is_binary) == (None, "logo.png", STATUS_ADDED, True)
+    assert (renamed.old_path, renamed.new_path, renamed.status) == ("old name.txt", "new name.txt", STATUS_RENAMED)
+
+    staged = parsed.sections[1]
+    assert parsed.span(staged.body_start, staged.preamble_end).startswith("Omitted to fit the diff budget")
+
+
+def test_spans_cover_the_text_without_copies():
+    parsed = parse_diff(SAMPLE)
+    section = parsed.sections[0]
+    spans = [(section.start, section.preamble_end), *((file.start, file.end) for file in section.files)]
+    assert parsed.render(spans) == SAMPLE[:section.end]
+    assert parsed.file_text(parsed.files[0]).startswith("diff --git a/app.py")
+    assert parsed.render([(0, 3), "!", (4, 6)]) == "###!UN"
+
+
+def test_select_drops_sections_left_empty():
+    parsed = parse_diff(SAMPLE)
+    selected = parsed.select(lambda file: file.path == "app.py")
+    assert selected.startswith("### UNSTAGED CHANGES")
+    assert "### STAGED CHANGES" not in selected
+    assert "logo.png" not in selected
+
+
+def test_real_git_output_with_quoted_and_deleted_paths(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    (repo / "gone.txt").write_text("bye\n")
+    (repo / "naïve file.txt").write_text("one\n")
+    (repo / "run.sh").write_text("echo hi\n")
+    _git(repo, "add", ".")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    (repo / "gone.txt").unlink()
+    (repo / "naïve file.txt").write_text("two\n")
+    (repo / "run.sh").chmod(0o755)
+
+    files = {file.path: file for file in parse_diff(_git(repo, "diff")).files}
+    assert files["gone.txt"].status == STATUS_DELETED
+    assert files["gone.txt"].new_path is None
+    assert files["naïve file.txt"].status == STATUS_MODIFIED
+    assert (files["naïve file.txt"].added, files["naïve file.txt"].deleted) == (1, 1)
+    assert files["run.sh"].status == STATUS_MODE_CHANGED
+    assert files["run.sh"].hunks == []
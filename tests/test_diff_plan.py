@@ -0,0 +1,114 @@
+import asyncio
+import subprocess
+
+from app.diff_plan import (
+    MAX_PATHSPECS,
+    PARTIAL_DIFF_MARKER,
+    NumstatEntry,
+    SectionPlan,
+    compose_section,
+    parse_numstat,
+    plan_sections,
+    rescaled_plan,
+)
+from app.git_diff_getter import get_repo_diff, get_repo_diff_async
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def _repo_with_small_changes(path, count=30):
+    path.mkdir()
+    _git(path, "init", "-q")
+    for index in range(count):
+        (path / f"module_{index:02}.py").write_text("".join(f"value_{line} = {line}\n" for line in range(10)))
+    _git(path, "add", ".")
+    _git(path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    for index in range(count):
+        (path / f"module_{index:02}.py").write_text("".join(f"value_{line} = {line * 2}\n" for line in range(10)))
+    return path
+
+
+def test_parse_numstat_reads_binary_and_renames():
+    output = "3\t1\tsrc/a.py\0-\t-\tlogo.png\0" "0\t0\t\0old.txt\0new.txt\0"
+    assert parse_numstat(output) == [
+        NumstatEntry(("src/a.py",), 3, 1),
+        NumstatEntry(("logo.png",), None, None),
+        NumstatEntry(("old.txt", "new.txt"), 0, 0),
+    ]
+
+
+def test_plan_keeps_small_files_and_summarizes_large_ones():
+    small = [NumstatEntry((f"f{index}.py",), 2, 2) for index in range(3)]
+    fixture = NumstatEntry(("fixture.json",), 3_000, 0)
+    lockfile = NumstatEntry(("poetry.lock",), 5_000, 4_000)
+    plan = plan_sections([[lockfile, *small, fixture], []], budget=4_000, overhead=40)
+    section = plan.sections[0]
+    assert section.included == tuple(small)
+    assert section.partial == fixture
+    assert section.omitted == (lockfile,)
+    assert "poetry.lock (+5000 -4000)" in section.summary_line()
+
+
+def test_patch_pathspecs_use_the_shorter_form():
+    entries = [NumstatEntry((f"f{index}.py",), 1, 1) for index in range(4)]
+    assert SectionPlan(tuple(entries), None, ()).patch_pathspecs() == []
+    assert SectionPlan(tuple(entries[:1]), None, tuple(entries[1:])).patch_pathspecs() == [":(top,literal)f0.py"]
+    assert SectionPlan(tuple(entries[:3]), None, tuple(entries[3:])).patch_pathspecs() == [
+        ":(exclude,top,literal)f3.py"
+    ]
+
+
+def test_plan_gives_up_when_pathspecs_would_overflow():
+    entries = [NumstatEntry((f"f{index:05}.py",), 1, 1) for index in range(2 * MAX_PATHSPECS + 10)]
+    budget = entries[0].estimated_chars * (MAX_PATHSPECS + 5) + 1_000
+    assert plan_sections([entries], budget=budget, overhead=0) is None
+
+
+def test_compose_section_puts_the_summary_first_and_marks_cut_partials():
+    lockfile = NumstatEntry(("poetry.lock",), 900, 0)
+    plan = SectionPlan((), NumstatEntry(("big.py",), 50, 0), (lockfile,))
+    composed = compose_section(plan, "", "x" * 1_000, partial_limit=100)
+    summary, partial, marker = composed.split("\n")
+    assert summary == plan.summary_line()
+    assert partial == "x" * 100
+    assert marker == PARTIAL_DIFF_MARKER
+
+
+def test_rescaled_plan_only_adds_files():
+    entries = [[NumstatEntry((f"f{index}.py",), 10, 10) for index in range(30)]]
+    plan = plan_sections(entries, budget=4_000, overhead=40)
+    estimated = sum(entry.estimated_chars for entry in plan.included)
+    rescaled = rescaled_plan(entries, plan, 4_000, 40, patch_chars=estimated // 2)
+    assert set(plan.included) < set(rescaled.included)
+    assert rescaled_plan(entries, plan, 4_000, 40, patch_chars=estimated) is None
+
+
+def test_planned_diff_fills_the_budget_after_fetching(tmp_path):
+    repo = _repo_with_small_changes(tmp_path / "repo")
+    result = get_repo_diff(str(repo), max_diff_chars=4_000)
+    assert result.was_truncated
+    assert 3_000 < len(result.diff_text) <= 4_000
+    assert len(result.omitted_paths) < 25
+    assert f"({len(result.omitted_paths)} files)" in result.diff_text
+    assert asyncio.run(get_repo_diff_async(str(repo), max_diff_chars=4_000)) == result
+
+
+def test_partial_file_is_cut_with_a_marker(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    (repo / "small.py").write_text("a = 1\n")
+    (repo / "large.py").write_text("".join(f"line_{index} = {index}\n" for index in range(400)))
+    _git(repo, "add", ".")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    (repo / "small.py").write_text("a = 2\n")
+    (repo / "large.py").write_text("".join(f"line_{index} = {-index}\n" for index in range(400)))
+
+    result = get_repo_diff(str(repo), max_diff_chars=3_000)
+    assert result.was_truncated
+    assert result.omitted_paths == ()
+    assert "+a = 2" in result.diff_text
+    assert result.diff_text.endswith(PARTIAL_DIFF_MARKER)
+    assert len(result.diff_text) <= 3_000
@@ -0,0 +1,74 @@
+import subprocess
+
+import pytest
+
+from app.git_diff_getter import (
+    READ_CHUNK_CHARS,
+    STAGED_HEADER,
+    UNSTAGED_HEADER,
+    EmptyDiffError,
+    InvalidRepoPathError,
+    _read_git_bounded,
+    get_repo_diff,
+)
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def _repo(path):
+    path.mkdir()
+    _git(path, "init", "-q")
+    (path / "notes.txt").write_text("first\n")
+    (path / "big.txt").write_text("".join(f"line {index}\n" for index in range(20_000)))
+    _git(path, "add", ".")
+    _git(path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    return path
+
+
+def test_small_diff_is_returned_whole(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "notes.txt").write_text("second\n")
+    (repo / "staged.txt").write_text("new\n")
+    _git(repo, "add", "staged.txt")
+
+    result = get_repo_diff(str(repo))
+    assert not result.was_truncated
+    assert result.warning == ""
+    assert result.diff_text.startswith(UNSTAGED_HEADER)
+    assert "+second" in result.diff_text
+    assert STAGED_HEADER in result.diff_text and "+new" in result.diff_text
+
+
+def test_large_diff_is_cut_at_the_budget(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "big.txt").write_text("".join(f"changed {index}\n" for index in range(20_000)))
+
+    result = get_repo_diff(str(repo), max_diff_chars=2_000, plan=False)
+    assert result.was_truncated
+    assert "2000 characters" in result.warning
+    assert len(result.diff_text) <= 2_000
+    assert result.diff_text.startswith(UNSTAGED_HEADER + "diff --git a/big.txt b/big.txt")
+
+
+def test_bounded_reader_stops_soon_after_the_limit(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "big.txt").write_text("".join(f"changed {index}\n" for index in range(20_000)))
+    full = subprocess.run(["git", "-C", str(repo), "diff"], check=True, capture_output=True, text=True).stdout
+
+    partial = _read_git_bounded(repo, ["diff"], limit=100)
+    assert 100 < len(partial) <= READ_CHUNK_CHARS < len(full)
+    assert full.startswith(partial)
+    assert _read_git_bounded(repo, ["diff"], limit=len(full)) == full.strip()
+
+
+def test_invalid_paths_and_clean_trees_are_rejected(tmp_path):
+    with pytest.raises(InvalidRepoPathError):
+        get_repo_diff(str(tmp_path / "missing"))
+    plain = tmp_path / "plain"
+    plain.mkdir()
+    with pytest.raises(InvalidRepoPathError):
+        get_repo_diff(str(plain))
+    with pytest.raises(EmptyDiffError):
+        get_repo_diff(str(_repo(tmp_path / "repo")))
@@ -0,0 +1,56 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+from app.deadlines import cancellation_metrics
+from app.git_diff_getter import EmptyDiffError, GitTimeoutError, get_repo_diff, get_repo_diff_async
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def _repo(path):
+    path.mkdir()
+    _git(path, "init", "-q")
+    (path / "big.txt").write_text("".join(f"line {index}\n" for index in range(5_000)))
+    (path / "small.txt").write_text("a\n")
+    _git(path, "add", ".")
+    _git(path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    return path
+
+
+@pytest.mark.parametrize("max_diff_chars", [120_000, 1_500])
+def test_async_diff_matches_sync(tmp_path, max_diff_chars):
+    repo = _repo(tmp_path / "repo")
+    (repo / "big.txt").write_text("".join(f"changed {index}\n" for index in range(5_000)))
+    (repo / "small.txt").write_text("b\n")
+    _git(repo, "add", "small.txt")
+
+    for plan in (True, False):
+        expected = get_repo_diff(str(repo), max_diff_chars=max_diff_chars, plan=plan)
+        assert asyncio.run(get_repo_diff_async(str(repo), max_diff_chars=max_diff_chars, plan=plan)) == expected
+
+
+def test_async_diff_raises_on_a_clean_tree(tmp_path):
+    with pytest.raises(EmptyDiffError):
+        asyncio.run(get_repo_diff_async(str(_repo(tmp_path / "repo"))))
+
+
+def test_timeout_kills_git(tmp_path, monkeypatch):
+    repo = _repo(tmp_path / "repo")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_git = bin_dir / "git"
+    fake_git.write_text("#!/bin/sh\nexec sleep 30\n")
+    fake_git.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:/usr/bin:/bin")
+    killed = cancellation_metrics.stats()["git_processes_killed"]
+
+    started = time.monotonic()
+    with pytest.raises(GitTimeoutError, match="0.2 seconds"):
+        asyncio.run(get_repo_diff_async(str(repo), timeout_seconds=0.2))
+    assert time.monotonic() - started < 5
+    assert cancellation_metrics.stats()["git_processes_killed"] == killed + 2
@@ -0,0 +1,95 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.llm.backends import OpenAIBackend
+from app.llm.pool import ClientRegistry, PoolConfig
+import app.llm.pool as pool
+
+ARGS = {"model": "gpt-4o-mini", "max_tokens": 20, "messages": [{"role": "user", "content": "hi"}]}
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers: set = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.peers.add(self.client_address)
+        body = json.dumps(
+            {
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": ARGS["model"],
+                "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "pong"}}
+                ],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    CompletionHandler.peers = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ClientRegistry(PoolConfig())
+    monkeypatch.setattr(pool, "_registry", registry)
+    yield registry
+    registry.close()
+
+
+def test_clients_are_shared_per_key_timeout_and_base_url(registry):
+    client = registry.get("key", 30.0)
+    assert registry.get("key", 30.0) is client
+    assert registry.get("key", 60.0) is not client
+    assert registry.get("key", 30.0, "http://gateway/v1") is not client
+    assert registry.stats()["clients"] == 3
+
+
+def test_sequential_requests_reuse_one_connection(registry, base_url):
+    backend = OpenAIBackend("key", 30.0, base_url)
+    for _ in range(3):
+        assert backend.complete(ARGS, timeout=5.0) == "pong"
+    assert OpenAIBackend("key", 30.0, base_url).complete(ARGS, timeout=5.0) == "pong"
+
+    stats = registry.stats()
+    assert stats["requests"] == 4
+    assert stats["connections"] == stats["idle_connections"] == 1
+    assert len(CompletionHandler.peers) == 1
+
+
+def test_async_clients_are_pooled_per_event_loop(registry, base_url):
+    backend = OpenAIBackend("key", 30.0, base_url)
+
+    async def run():
+        first = registry.get_async("key", 30.0, base_url)
+        assert registry.get_async("key", 30.0, base_url) is first
+        results = [await backend.complete_async(ARGS, timeout=5.0) for _ in range(3)]
+        await registry.aclose()
+        return results, first
+
+    results, first = asyncio.run(run())
+    assert results == ["pong"] * 3
+    assert len(CompletionHandler.peers) == 1
+    assert asyncio.run(run())[1] is not first
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import server
+from app.llm import client as llm_client
+from app.llm import rate_limit
+from app.llm.backends import LocalBackend
+from app.llm.rate_limit import RateLimiter, RateLimitWaitError
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+def _headers(limit_requests, remaining_requests, limit_tokens=None, remaining_tokens=None):
+    headers = {
+        "x-ratelimit-limit-requests": str(limit_requests),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+    }
+    if limit_tokens is not None:
+        headers["x-ratelimit-limit-tokens"] = str(limit_tokens)
+        headers["x-ratelimit-remaining-tokens"] = str(remaining_tokens)
+    return headers
+
+
+def test_unknown_limits_never_wait():
+    limiter = RateLimiter()
+    assert all(limiter.reserve(10_000) == 0.0 for _ in range(100))
+
+
+def test_callers_queue_behind_reservations():
+    limiter = RateLimiter(requests_per_minute=60, max_wait_seconds=10)
+    assert [round(limiter.reserve(1), 1) for _ in range(62)][-3:] == [0.0, 1.0, 2.0]
+    assert limiter.stats()["delayed"] == 2
+
+
+def test_waits_past_the_limit_are_rejected_without_claiming():
+    limiter = RateLimiter(tokens_per_minute=600, max_wait_seconds=1)
+    limiter.reserve(600)
+    with pytest.raises(RateLimitWaitError) as raised:
+        limiter.reserve(60)
+    assert raised.value.retry_after == pytest.approx(6.0, abs=0.1)
+    assert limiter.reserve(5) <= 1.0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_cancelled_waits_return_their_reservation():
+    limiter = RateLimiter(requests_per_minute=60, max_wait_seconds=10)
+    for _ in range(60):
+        limiter.reserve(1)
+
+    async def run():
+        task = asyncio.ensure_future(limiter.acquire_async(1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert limiter.reserve(1) < 1.5
+
+
+def test_limits_adapt_to_response_headers():
+    limiter = RateLimiter()
+    limiter.observe(200, _headers(100, 90, 10_000, 9_000))
+    stats = limiter.stats()
+    assert stats["requests"]["reported_limit"] == 100
+    assert stats["tokens"]["available"] == 9_000
+
+    limiter.observe(429, _headers(100, 0))
+    assert limiter.stats()["requests"]["rate_per_minute"] == 50
+    assert limiter.stats()["throttled"] == 1
+
+    for _ in range(20):
+        limiter.observe(200, _headers(100, 50))
+    assert limiter.stats()["requests"]["rate_per_minute"] == 100
+
+    limiter.observe(200, _headers(100, 5))
+    assert limiter.stats()["requests"]["rate_per_minute"] == 80
+    assert limiter.stats()["requests"]["available"] <= 5
+
+
+def test_exhausted_capacity_is_a_429_with_retry_after(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setattr(rate_limit, "_limiter", RateLimiter(requests_per_minute=1, max_wait_seconds=0.5))
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: LocalBackend())
+    api = TestClient(server.app)
+
+    assert api.post("/api/suggest", json={"diff_text": DIFF, "use_cache": False}).status_code == 200
+    started = time.monotonic()
+    response = api.post("/api/suggest", json={"diff_text": DIFF + "+y\n", "use_cache": False})
+    assert time.monotonic() - started < 0.5
+    assert response.status_code == 429
+    assert 55 <= int(response.headers["retry-after"]) <= 60
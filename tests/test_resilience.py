@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.llm.resilience import (
+    DeadlineExceededError,
+    RetryPolicy,
+    UpstreamMetrics,
+    call_with_retries,
+    call_with_retries_async,
+    is_retryable,
+    retry_after,
+)
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def _status_error(status: int, headers: dict | None = None, code: str | None = None) -> openai.APIStatusError:
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    # The SDK passes the ``error`` object of the response body.
+    body = {"code": code} if code else None
+    return openai.APIStatusError(f"status {status}", response=response, body=body)
+
+
+def _flaky(*failures):
+    """An attempt that raises ``failures`` in order, then returns ``"ok"``."""
+    remaining = list(failures)
+    calls = []
+
+    def attempt(seconds_left):
+        calls.append(seconds_left)
+        if remaining:
+            raise remaining.pop(0)
+        return "ok"
+
+    return attempt, calls
+
+
+def test_transient_failures_are_retryable():
+    assert is_retryable(openai.APIConnectionError(request=REQUEST))
+    assert is_retryable(openai.APITimeoutError(request=REQUEST))
+    assert all(is_retryable(_status_error(status)) for status in (408, 409, 429, 500, 503))
+    assert not is_retryable(_status_error(400))
+    assert not is_retryable(_status_error(429, code="insufficient_quota"))
+    assert not is_retryable(RuntimeError("bug"))
+
+
+def test_retry_after_headers():
+    assert retry_after(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(_status_error(429, {"retry-after": "3"})) == 3.0
+    assert retry_after(_status_error(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after(_status_error(429, {"retry-after": "soon"})) is None
+    assert retry_after(_status_error(429)) is None
+    assert retry_after(RuntimeError("no response")) is None
+
+
+def test_retries_until_success_and_honours_retry_after():
+    metrics = UpstreamMetrics()
+    attempt, calls = _flaky(_status_error(503), _status_error(429, {"retry-after-ms": "100"}))
+    started = time.monotonic()
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+    assert call_with_retries(attempt, policy, metrics) == "ok"
+    assert time.monotonic() - started >= 0.1
+    assert len(calls) == 3
+    stats = metrics.stats()
+    assert (stats["attempts"], stats["retries"], stats["retry_after_waits"]) == (3, 2, 1)
+
+
+def test_permanent_errors_and_exhausted_attempts_are_raised():
+    policy = RetryPolicy(max_attempts=2, base_delay=0.001)
+    attempt, calls = _flaky(_status_error(400))
+    with pytest.raises(openai.APIStatusError, match="status 400"):
+        call_with_retries(attempt, policy, UpstreamMetrics())
+    assert len(calls) == 1
+
+    attempt, calls = _flaky(_status_error(500), _status_error(502), _status_error(503))
+    with pytest.raises(openai.APIStatusError, match="status 502"):
+        call_with_retries(attempt, policy, UpstreamMetrics())
+    assert len(calls) == 2
+
+
+def test_a_wait_past_the_deadline_fails_fast():
+    metrics = UpstreamMetrics()
+    attempt, calls = _flaky(_status_error(429, {"retry-after": "30"}))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        call_with_retries(attempt, RetryPolicy(deadline_seconds=1.0), metrics)
+    assert time.monotonic() - started < 0.5
+    assert calls[0] <= 1.0
+    assert metrics.stats()["deadline_exceeded"] == 1
+
+
+def test_async_retries_share_the_deadline():
+    attempt, calls = _flaky(openai.APIConnectionError(request=REQUEST))
+
+    async def run(seconds_left):
+        return attempt(seconds_left)
+
+    policy = RetryPolicy(base_delay=0.001, max_delay=0.001, deadline_seconds=5.0)
+    assert asyncio.run(call_with_retries_async(run, policy, metrics=UpstreamMetrics())) == "ok"
+    assert calls[1] < calls[0] <= 5.0
+
+
+def test_slow_attempts_are_hedged():
+    metrics = UpstreamMetrics()
+    for _ in range(20):
+        metrics.latencies("model").record(0.05)
+    delays = [1.0, 0.01]
+
+    async def attempt(_seconds_left):
+        await asyncio.sleep(delays.pop(0))
+        return "ok"
+
+    policy = RetryPolicy(hedge_percentile=95)
+    started = time.monotonic()
+    assert asyncio.run(call_with_retries_async(attempt, policy, "model", metrics)) == "ok"
+    assert time.monotonic() - started < 0.5
+    stats = metrics.stats()
+    assert (stats["attempts"], stats["hedges"], stats["hedge_wins"]) == (2, 1, 1)
+
+
+def test_no_hedge_without_enough_samples():
+    metrics = UpstreamMetrics()
+    metrics.latencies("model").record(0.001)
+
+    async def attempt(_seconds_left):
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert asyncio.run(call_with_retries_async(attempt, RetryPolicy(hedge_percentile=95), "model", metrics)) == "ok"
+    assert metrics.stats()["hedges"] == 0
@@ -0,0 +1,54 @@
+import asyncio
+
+from app.llm.response_cache import SWEEP_EVERY_PUTS, ResponseCache
+
+
+def test_disk_entries_survive_a_new_process(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+    ResponseCache(path).put("key", "value")
+    cache = ResponseCache(path)
+    assert cache.get("key") == "value"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_async_paths_share_the_tiers(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+
+    async def run():
+        await ResponseCache(path).put_async("key", "value")
+        cache = ResponseCache(path)
+        assert await cache.get_async("key") == "value"
+        assert await cache.get_async("key") == "value"
+        assert await cache.get_async("missing") is None
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", memory_entries=0, max_disk_bytes=250)
+    for index in range(5):
+        cache.put(f"key{index}", "x" * 100)
+    assert cache.get("key0") is None
+    assert cache.get("key4") == "x" * 100
+    assert cache.stats()["evictions"] == 3
+
+
+def test_sweep_recounts_writes_from_other_processes(tmp_path):
+    path = tmp_path / "responses.sqlite3"
+    cache = ResponseCache(path, memory_entries=0, max_disk_bytes=1_000)
+    cache.put("mine", "x" * 100)
+    other = ResponseCache(path, memory_entries=0, max_disk_bytes=10_000)
+    for index in range(5):
+        other.put(f"theirs{index}", "y" * 200)
+    for index in range(SWEEP_EVERY_PUTS - 1):
+        cache.put("mine", "x" * 100)
+    assert cache.get("mine") == "x" * 100
+    assert sum(cache.get(f"theirs{index}") is not None for index in range(5)) == 4
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl_seconds=-1)
+    cache.put("key", "value")
+    assert cache.get("key") is None
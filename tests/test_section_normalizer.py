@@ -0,0 +1,153 @@
+import random
+
+import pytest
+
+from app.llm.prompt_builder import (
+    REFINE_SECTION_ALIASES,
+    REFINE_SECTION_ORDER,
+    SECTION_CUT_MARKER,
+    SUGGEST_SECTION_ALIASES,
+    SUGGEST_SECTION_ORDER,
+    SectionNormalizer,
+    normalize_refine_output,
+    normalize_suggest_output,
+    refine_output_normalizer,
+    suggest_output_normalizer,
+)
+
+
+SUGGEST_CASES = {
+    "in_order": (
+        "## Project Understanding\nThe repo does Y.\n\n## Recommended Next Prompt\nDo X.\n\n"
+        "## Alternate Prompt Options\n- A\n- B\n\n## Edge-Case Checklist\n- empty input\n"
+    ),
+    "out_of_order": (
+        "## Recommended Next Prompt\nDo X.\n\n## Project Understanding\nThe repo does Y.\n\n"
+        "## Edge-Case Checklist\n- empty input\n\n## Alternate Prompt Options\n- A\n"
+    ),
+    "duplicated_held_section": (
+        "## Project Understanding\nY.\n## Edge-Case Checklist\n- one\n## Edge-Case Checklist\n- two\n"
+        "## Recommended Next Prompt\nDo X.\n"
+    ),
+    "duplicated_live_section": (
+        "## Project Understanding\nY.\n## Project Understanding\nMore Y.\n## Recommended Next Prompt\nDo X.\n"
+    ),
+    "missing_sections": "## Recommended Next Prompt\nDo X.\n",
+    "no_headings": "Just some text\n\n  with a second paragraph\n",
+    "aliases_and_numbering": (
+        "1) Context summary:\nY.\n2) next prompt\nDo X.\n### Alternates\n- A\n**Edge cases**\n- one\n"
+    ),
+    "preamble": "Here is my answer.\n\n## Project Understanding\nY.\n## Recommended Next Prompt\nDo X.\n",
+    "sub_headings": "## Edge-Case Checklist\n### Auth\n- expired tokens\n### Storage\n- disk full\n",
+    "crlf": "## Project Understanding\r\nY.\r\n\r\n## Recommended Next Prompt\r\nDo X.\r\n",
+    "empty": "",
+}
+
+
+def _stream(normalizer: SectionNormalizer, text: str, sizes: list[int]) -> str:
+    out, position = [], 0
+    while position < len(text):
+        size = sizes[len(out) % len(sizes)]
+        out.append(normalizer.feed(text[position : position + size]))
+        position += size
+    out.append(normalizer.finish())
+    return "".join(out)
+
+
+@pytest.mark.parametrize("name", sorted(SUGGEST_CASES))
+@pytest.mark.parametrize("sizes", [[1], [3, 7, 2], [10_000]], ids=["chars", "mixed", "whole"])
+def test_stream_matches_batch(name, sizes):
+    text = SUGGEST_CASES[name]
+    normalizer = SectionNormalizer(SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES)
+    streamed = _stream(normalizer, text, sizes)
+    assert streamed == normalize_suggest_output(text)
+    assert normalizer.text == streamed
+    assert not normalizer.diverged
+
+
+def test_batch_reorders_sections():
+    normalized = normalize_suggest_output(SUGGEST_CASES["out_of_order"])
+    assert normalized.startswith("## Project Understanding\nThe repo does Y.\n\n## Recommended Next Prompt\nDo X.\n")
+    assert normalized.endswith("## Alternate Prompt Options\n- A\n\n## Edge-Case Checklist\n- empty input\n")
+
+
+def test_in_order_output_passes_through():
+    normalizer = SectionNormalizer(SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES)
+    emitted = normalizer.feed("## Project Understanding\nThe repo does Y.\n## Recommended Next Prompt\nDo")
+    assert emitted == "## Project Understanding\nThe repo does Y.\n\n## Recommended Next Prompt\nDo"
+
+
+def test_out_of_order_sections_are_held_until_placed():
+    normalizer = SectionNormalizer(SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES)
+    assert normalizer.feed("## Recommended Next Prompt\nDo X.\n") == "## Project Understanding\n"
+    emitted = normalizer.feed("## Project Understanding\nY.\n## Alternate Prompt Options\n")
+    assert emitted == "Y.\n\n## Recommended Next Prompt\nDo X.\n\n## Alternate Prompt Options\n"
+
+
+def test_reopened_section_keeps_content_and_batch_text():
+    text = "## Project Understanding\nY.\n## Recommended Next Prompt\nDo X.\n## Project Understanding\nLate Y.\n"
+    normalizer = SectionNormalizer(SUGGEST_SECTION_ORDER, SUGGEST_SECTION_ALIASES)
+    streamed = _stream(normalizer, text, [5])
+    assert normalizer.diverged
+    assert "Late Y." in streamed
+    assert normalizer.text == normalize_suggest_output(text)
+
+
+def test_random_refine_output_matches_batch():
+    rnd = random.Random(0)
+    lines = ["", "  ", "- item", "  indented", "#tag", "### sub", "1. step", "prose line"]
+    for _ in range(300):
+        names = REFINE_SECTION_ORDER[:]
+        rnd.shuffle(names)
+        if rnd.random() < 0.3:
+            names.pop()
+        parts = []
+        for name in names:
+            parts.append(rnd.choice(["## ", "", "1) ", "**"]) + rnd.choice([name, *REFINE_SECTION_ALIASES[name]]))
+            parts.extend(rnd.choice(lines) for _ in range(rnd.randint(0, 4)))
+        text = "\n".join(parts)
+        normalizer = SectionNormalizer(REFINE_SECTION_ORDER, REFINE_SECTION_ALIASES)
+        assert _stream(normalizer, text, [rnd.randint(1, 9)]) == normalize_refine_output(text)
+
+
+ANSWER_HEAD = (
+    "## Project Understanding\nY.\n## Recommended Next Prompt\nDo X.\n## Alternate Prompt Options\n- A\n"
+    "## Edge-Case Checklist\n"
+)
+
+
+def test_sub_headings_do_not_end_last_section():
+    text = ANSWER_HEAD + "### Auth\n- expired tokens\n### Storage\n- disk full\n"
+    normalizer = suggest_output_normalizer()
+    streamed = _stream(normalizer, text, [4])
+    assert not normalizer.complete
+    assert streamed == normalize_suggest_output(text)
+    assert streamed.endswith("### Auth\n- expired tokens\n### Storage\n- disk full\n")
+
+
+def test_top_level_heading_ends_stream_but_not_batch():
+    text = ANSWER_HEAD + "- one\n## Notes\nSign-off.\n"
+    normalizer = suggest_output_normalizer()
+    streamed = _stream(normalizer, text, [4])
+    assert normalizer.complete
+    assert streamed == normalize_suggest_output(ANSWER_HEAD + "- one\n")
+    assert normalize_suggest_output(text).endswith("- one\n## Notes\nSign-off.\n")
+
+
+def test_soft_cap_stops_stream_with_marker():
+    checklist = "".join(f"- edge case number {index} with some detail\n" for index in range(100))
+    text = ANSWER_HEAD + checklist
+    normalizer = suggest_output_normalizer()
+    streamed = _stream(normalizer, text, [16])
+    assert normalizer.complete
+    assert streamed.endswith(f"\n{SECTION_CUT_MARKER}\n")
+    assert normalizer.text == streamed
+    assert normalize_suggest_output(text).endswith("number 99 with some detail\n")
+
+
+def test_batch_keeps_long_sections():
+    rewritten = "\n".join(f"{index}. Requirement {index}:" + " detail" * 12 for index in range(60))
+    text = f"## Why Previous Prompt Is Underspecified\nGaps.\n## Rewritten Spec-Driven Prompt\n{rewritten}\n"
+    assert rewritten in normalize_refine_output(text)
+    normalizer = refine_output_normalizer()
+    assert _stream(normalizer, text, [50]) == normalize_refine_output(text)
@@ -0,0 +1,40 @@
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+from app import server
+from app.llm import client as llm_client
+from app.llm.backends import LocalBackend
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class TimingOutBackend(LocalBackend):
+    async def complete_async(self, args: dict, timeout: float) -> str:
+        raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+class FailingBackend(LocalBackend):
+    async def complete_async(self, args: dict, timeout: float) -> str:
+        raise RuntimeError("upstream exploded")
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setenv("SPEC_PROMPT_RETRY_ATTEMPTS", "1")
+    return TestClient(server.app)
+
+
+def test_sdk_timeout_after_retries_is_a_gateway_timeout(api, monkeypatch):
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: TimingOutBackend())
+    response = api.post("/api/suggest", json={"diff_text": DIFF, "use_cache": False})
+    assert response.status_code == 504
+    assert "timed out" in response.json()["detail"]
+
+
+def test_other_upstream_failures_are_bad_gateway(api, monkeypatch):
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: FailingBackend())
+    response = api.post("/api/suggest", json={"diff_text": DIFF, "use_cache": False})
+    assert response.status_code == 502
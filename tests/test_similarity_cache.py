@@ -0,0 +1,90 @@
+import pytest
+
+from app.llm import similarity_cache
+from app.llm.backends import LocalBackend
+from app.llm.client import LLMClient
+from app.llm.similarity_cache import NUM_PERMUTATIONS, SimilarityCache, diff_shingles, minhash
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def complete(self, args: dict, timeout: float) -> str:
+        self.calls += 1
+        return super().complete(args, timeout)
+
+
+def _diff(lines, path="app.py", changed=None):
+    values = [changed or 0, *range(1, lines)]
+    body = "".join(f"+value_{index} = {value}\n" for index, value in enumerate(values))
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,{lines} @@\n{body}"
+
+
+def _similarity(first, second):
+    return sum(1 for x, y in zip(minhash(first), minhash(second)) if x == y) / NUM_PERMUTATIONS
+
+
+def test_shingles_ignore_context_and_whitespace():
+    diff = "diff --git a/a.py b/a.py\n@@ -1,3 +1,3 @@\n context\n-x  =  1\n+x = 2\n+   \n"
+    assert diff_shingles(diff) == diff_shingles(diff.replace("x  =  1", "x = 1"))
+    assert len(diff_shingles(diff)) == 2
+    assert diff_shingles(diff) != diff_shingles(diff.replace("a.py", "b.py"))
+
+
+def _hashes(start, stop):
+    return {similarity_cache._hash(str(index)) for index in range(start, stop)}
+
+
+def test_minhash_estimates_jaccard():
+    base = _hashes(1_000, 2_000)
+    assert _similarity(base, base) == 1.0
+    # Jaccard 950 / 1050 ~ 0.9.
+    assert 0.8 <= _similarity(base, _hashes(1_050, 2_050)) <= 1.0
+    assert _similarity(base, _hashes(5_000, 6_000)) < 0.1
+
+
+def test_near_duplicates_hit_and_other_diffs_miss():
+    cache = SimilarityCache(threshold=0.9)
+    cache.put("scope", cache.sketch(_diff(200)), "answer")
+
+    match = cache.get("scope", cache.sketch(_diff(200, changed="changed")))
+    assert match is not None and match.value == "answer" and match.similarity >= 0.9
+    assert cache.get("other-scope", cache.sketch(_diff(200))) is None
+    assert cache.get("scope", cache.sketch(_diff(200, path="other.py"))) is None
+    assert cache.sketch(_diff(5)) is None
+    assert cache.get("scope", None) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "stores": 1, "skipped": 1, "entries": 1, "threshold": 0.9}
+
+
+def test_old_entries_expire_and_the_oldest_is_evicted(monkeypatch):
+    clock = [1_000.0]
+    monkeypatch.setattr(similarity_cache.time, "time", lambda: clock[0])
+    cache = SimilarityCache(max_entries=2, ttl_seconds=60)
+    for path in ("a.py", "b.py", "c.py"):
+        cache.put("scope", cache.sketch(_diff(50, path=path)), path)
+    assert cache.get("scope", cache.sketch(_diff(50, path="a.py"))) is None
+    assert cache.get("scope", cache.sketch(_diff(50, path="c.py"))).value == "c.py"
+    clock[0] += 61
+    assert cache.get("scope", cache.sketch(_diff(50, path="c.py"))) is None
+    assert cache.stats()["entries"] == 2
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setenv("SPEC_PROMPT_SIMILARITY_CACHE", "on")
+    monkeypatch.setattr(similarity_cache, "_cache", None)
+
+
+def test_client_reuses_the_answer_to_a_near_identical_diff(fresh_cache):
+    backend = CountingBackend()
+    first = LLMClient(backend=backend).suggest_from_diff(_diff(200))
+    second = LLMClient(backend=backend).suggest_from_diff(_diff(200, changed="changed"))
+    assert backend.calls == 1
+    assert second.startswith("Note: reused the response to a near-identical earlier diff")
+    assert second.endswith(first)
+
+    LLMClient(backend=backend, use_cache=False).suggest_from_diff(_diff(200, changed="changed"))
+    assert backend.calls == 2
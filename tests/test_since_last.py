@@ -0,0 +1,96 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from app.git_diff_getter import (
+    SINCE_LAST_HEADER,
+    UNSTAGED_HEADER,
+    EmptyDiffError,
+    get_repo_diff,
+    get_repo_diff_async,
+    record_diff_snapshot,
+    record_diff_snapshot_async,
+)
+
+
+def _git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+def _repo(path):
+    path.mkdir()
+    _git(path, "init", "-q")
+    (path / "a.txt").write_text("one\n")
+    (path / "b.txt").write_text("one\n")
+    _git(path, "add", ".")
+    _git(path, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    return path
+
+
+def test_first_diff_is_the_full_diff(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "a.txt").write_text("two\n")
+    result = get_repo_diff(str(repo), since_last=True)
+    assert result.diff_text.startswith(UNSTAGED_HEADER)
+    assert result.snapshot
+
+
+def test_next_diff_only_shows_changes_since_the_snapshot(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "a.txt").write_text("two\n")
+    record_diff_snapshot(str(repo), get_repo_diff(str(repo), since_last=True).snapshot)
+    index_before = _git(repo, "diff", "--cached", "--name-only")
+
+    with pytest.raises(EmptyDiffError, match="since the last prompt"):
+        get_repo_diff(str(repo), since_last=True)
+
+    (repo / "b.txt").write_text("two\n")
+    result = get_repo_diff(str(repo), since_last=True)
+    assert result.diff_text.startswith(SINCE_LAST_HEADER)
+    assert "b.txt" in result.diff_text
+    assert "a.txt" not in result.diff_text
+    # The snapshot is built on a copy of the index; nothing is staged.
+    assert _git(repo, "diff", "--cached", "--name-only") == index_before
+
+
+def test_snapshot_sees_edits_made_in_the_same_second_as_the_index(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    _git(repo, "config", "core.trustctime", "false")
+    stamp = int(time.time()) - 100
+    (repo / "a.txt").write_text("one\n")
+    os.utime(repo / "a.txt", (stamp, stamp))
+    _git(repo, "add", ".")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+    os.utime(repo / ".git" / "index", (stamp, stamp))
+    # Same size and mtime as the index entry: only git's racy-clean content check finds the edit.
+    (repo / "a.txt").write_text("two\n")
+    os.utime(repo / "a.txt", (stamp, stamp))
+
+    snapshot = get_repo_diff(str(repo), since_last=True).snapshot
+    assert snapshot != _git(repo, "rev-parse", "HEAD^{tree}").strip()
+
+
+def test_truncated_delta_records_no_snapshot(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "a.txt").write_text("".join(f"line {index}\n" for index in range(500)))
+    result = get_repo_diff(str(repo), max_diff_chars=500, plan=False, since_last=True)
+    assert result.was_truncated
+    assert result.snapshot == ""
+
+
+def test_async_snapshots_match_sync(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    (repo / "a.txt").write_text("two\n")
+    result = get_repo_diff(str(repo), since_last=True)
+    assert asyncio.run(get_repo_diff_async(str(repo), since_last=True)) == result
+
+    asyncio.run(record_diff_snapshot_async(str(repo), result.snapshot))
+    (repo / "b.txt").write_text("two\n")
+    delta = asyncio.run(get_repo_diff_async(str(repo), since_last=True))
+    assert delta == get_repo_diff(str(repo), since_last=True)
+    assert delta.diff_text.startswith(SINCE_LAST_HEADER)
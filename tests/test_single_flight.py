@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from app.llm.backends import LocalBackend
+from app.llm.client import LLMClient
+from app.llm.single_flight import SingleFlight
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self) -> None:
+        super().__init__(latency_seconds=0.1)
+        self.calls = 0
+
+    async def complete_async(self, args: dict, timeout: float) -> str:
+        self.calls += 1
+        return await super().complete_async(args, timeout)
+
+    async def open_stream_async(self, args: dict, timeout: float):
+        self.calls += 1
+        return await super().open_stream_async(args, timeout)
+
+
+def _producer(pieces, started, release, cancelled=None, error=None):
+    async def produce():
+        started.append(1)
+        try:
+            for piece in pieces:
+                await release.wait()
+                yield piece
+            if error is not None:
+                raise error
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(1)
+            raise
+
+    return produce
+
+
+def test_late_subscribers_get_every_piece():
+    flights = SingleFlight()
+    started = []
+
+    async def run():
+        first_sent, release = asyncio.Event(), asyncio.Event()
+
+        async def produce():
+            started.append(1)
+            yield "a"
+            first_sent.set()
+            await release.wait()
+            yield "b"
+            yield "c"
+
+        async def collect():
+            return [piece async for piece in flights.stream("key", produce)]
+
+        first = asyncio.create_task(collect())
+        await first_sent.wait()
+        second = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert len(started) == 1
+    assert flights.stats() == {"started": 1, "joined": 1, "cancelled": 0, "in_flight": 0}
+
+
+def test_upstream_is_cancelled_only_when_the_last_subscriber_leaves():
+    flights = SingleFlight()
+    started, cancelled = [], []
+
+    async def run():
+        release = asyncio.Event()
+        produce = _producer(["a"], started, release, cancelled)
+
+        async def collect():
+            return [piece async for piece in flights.stream("key", produce)]
+
+        first = asyncio.create_task(collect())
+        second = asyncio.create_task(collect())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled == []
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert (len(started), len(cancelled)) == (1, 1)
+    assert flights.stats()["cancelled"] == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_producer_errors_reach_every_subscriber():
+    flights = SingleFlight()
+
+    async def run():
+        release = asyncio.Event()
+        release.set()
+        produce = _producer(["a"], [], release, error=RuntimeError("upstream failed"))
+
+        async def collect():
+            return [piece async for piece in flights.stream("key", produce)]
+
+        return await asyncio.gather(collect(), collect(), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["upstream failed", "upstream failed"]
+
+
+def test_identical_concurrent_requests_make_one_upstream_call(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    backend = CountingBackend()
+
+    async def run():
+        client = LLMClient(backend=backend)
+        same = [client.suggest_from_diff_async(DIFF) for _ in range(4)]
+        other = client.suggest_from_diff_async(DIFF + "+y\n")
+        return await asyncio.gather(*same, other)
+
+    *same, other = asyncio.run(run())
+    assert backend.calls == 2
+    assert len(set(same)) == 1 and same[0]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sequential_requests_are_not_coalesced(monkeypatch, stream):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    backend = CountingBackend()
+    client = LLMClient(backend=backend)
+
+    async def run():
+        if stream:
+            return [piece async for piece in client.stream_suggest_from_diff_async(DIFF)]
+        return await client.suggest_from_diff_async(DIFF)
+
+    assert asyncio.run(run()) and asyncio.run(run())
+    assert backend.calls == 2
@@ -0,0 +1,101 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from typer.testing import CliRunner
+
+from app import main, server
+from app.llm import client as llm_client
+from app.llm.backends import LocalBackend
+from app.llm.client import LLMClient
+
+DIFF = "diff --git a/x b/x\n+x\n"
+
+
+class BrokenStreamBackend(LocalBackend):
+    """Streams a few tokens, then fails."""
+
+    async def open_stream_async(self, args: dict, timeout: float):
+        pieces = await super().open_stream_async(args, timeout)
+
+        async def broken():
+            count = 0
+            async for piece in pieces:
+                yield piece
+                count += 1
+                if count == 5:
+                    raise RuntimeError("connection reset")
+
+        return broken()
+
+
+class DownBackend(LocalBackend):
+    async def open_stream_async(self, args: dict, timeout: float):
+        raise RuntimeError("upstream is down")
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setenv("SPEC_PROMPT_RESPONSE_CACHE", "off")
+    monkeypatch.setenv("SPEC_PROMPT_RETRY_ATTEMPTS", "1")
+
+
+def test_stream_joins_to_the_full_answer():
+    client = LLMClient(backend=LocalBackend())
+    pieces = list(client.stream_suggest_from_diff(DIFF))
+    assert len(pieces) > 10
+    assert "".join(pieces) == client.suggest_from_diff(DIFF)
+    assert "".join(client.stream_refine_from_diff(DIFF, "Add tests.")) == client.refine_from_diff(DIFF, "Add tests.")
+
+
+def test_async_stream_yields_before_generation_ends():
+    client = LLMClient(backend=LocalBackend(tokens_per_second=200))
+
+    async def run():
+        started = time.monotonic()
+        arrivals = []
+        async for piece in client.stream_suggest_from_diff_async(DIFF):
+            arrivals.append((time.monotonic() - started, piece))
+        return arrivals
+
+    arrivals = asyncio.run(run())
+    assert arrivals[0][0] < arrivals[-1][0] / 4
+    assert "".join(piece for _at, piece in arrivals) == LLMClient(backend=LocalBackend()).suggest_from_diff(DIFF)
+
+
+def test_server_stream_matches_the_plain_endpoint(monkeypatch):
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: LocalBackend())
+    api = TestClient(server.app)
+    with api.stream("POST", "/api/suggest/stream", json={"diff_text": DIFF}) as response:
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "no-cache"
+        chunks = list(response.iter_text())
+    assert "".join(chunks) == api.post("/api/suggest", json={"diff_text": DIFF}).text
+
+
+def test_server_stream_errors_before_and_after_the_first_chunk(monkeypatch):
+    api = TestClient(server.app)
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: DownBackend())
+    assert api.post("/api/suggest/stream", json={"diff_text": DIFF}).status_code == 502
+
+    monkeypatch.setattr(llm_client, "_create_backend", lambda config, api_key: BrokenStreamBackend())
+    response = api.post("/api/suggest/stream", json={"diff_text": DIFF})
+    assert response.status_code == 200
+    assert response.text.rstrip().endswith("Error: The local backend request failed: connection reset")
+
+
+def test_cli_stream_prints_the_same_text(monkeypatch, tmp_path):
+    monkeypatch.setenv("SPEC_PROMPT_LLM_BACKEND", "local")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "-C", str(repo), "init", "-q"], check=True)
+    (repo / "notes.txt").write_text("todo\n")
+    subprocess.run(["git", "-C", str(repo), "add", "."], check=True)
+
+    streamed = CliRunner().invoke(main.app, ["suggest", "--repo", str(repo), "--stream"])
+    whole = CliRunner().invoke(main.app, ["suggest", "--repo", str(repo), "--no-stream"])
+    assert streamed.exit_code == whole.exit_code == 0
+    assert streamed.output.strip()
+    assert streamed.output.strip() == whole.output.strip()
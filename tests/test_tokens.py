@@ -0,0 +1,37 @@
+import base64
+import hashlib
+
+from app.llm import tokens
+
+
+def _counter(monkeypatch, directory):
+    if directory is None:
+        monkeypatch.delenv(tokens.TOKENIZER_DIR_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(tokens.TOKENIZER_DIR_ENV_VAR, str(directory))
+    return tokens.TokenCounter(tokens._load_encoding(tokens.DEFAULT_ENCODING))
+
+
+def test_counts_are_estimates_without_tokenizer_dir(monkeypatch):
+    counter = _counter(monkeypatch, None)
+    assert not counter.is_exact
+    assert counter.name == "estimate"
+    assert counter.count("def main():\n    return 1\n") == tokens.estimate_tokens("def main():\n    return 1\n")
+
+
+def test_rank_file_with_wrong_checksum_is_ignored(monkeypatch, tmp_path):
+    (tmp_path / f"{tokens.DEFAULT_ENCODING}.tiktoken").write_bytes(b"IQ== 0\nIg== 1\n")
+    assert not _counter(monkeypatch, tmp_path).is_exact
+
+
+def test_estimate_charges_dense_text_by_its_breaks():
+    encoded = base64.b64encode(bytes(range(256)) * 12).decode()
+    digests = "".join(hashlib.sha256(str(index).encode()).hexdigest() + "\n" for index in range(50))
+    # BPE spends about a token per two to three characters on these.
+    assert tokens.estimate_tokens(encoded) >= len(encoded) / 2.5
+    assert tokens.estimate_tokens(digests) >= len(digests) / 2.5
+
+
+def test_estimate_splits_identifiers_into_words():
+    assert tokens.estimate_tokens("getHTTPResponseCode") > tokens.estimate_tokens("gethttpresponsecode")
+    assert tokens.estimate_tokens("日本語") >= 3
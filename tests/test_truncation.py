@@ -0,0 +1,70 @@
+from app.diff_model import parse_diff
+from app.llm.truncation import truncate_diff, truncate_text
+
+
+def _file(path, lines, hunks=1):
+    parts = [f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"]
+    for hunk in range(hunks):
+        start = hunk * 1_000 + 1
+        parts.append(f"@@ -{start},{lines} +{start},{lines} @@\n")
+        parts.extend(f"-old {path} {hunk} {line}\n+new {path} {hunk} {line}\n" for line in range(lines))
+    return "".join(parts)
+
+
+def _words(text):
+    return len(text.split())
+
+
+def test_diff_within_budget_is_unchanged():
+    diff = _file("a.py", 3)
+    assert truncate_diff(diff, budget=10_000) == truncate_diff(diff, budget=10_000, measure=_words)
+    assert truncate_diff(diff, budget=10_000).text == diff.strip()
+    assert not truncate_diff(diff, budget=10_000).was_truncated
+
+
+def test_large_file_does_not_crowd_out_later_files():
+    diff = "### UNSTAGED CHANGES\n" + _file("huge.py", 400) + _file("small.py", 2)
+    result = truncate_diff(diff, budget=3_000)
+    assert result.was_truncated
+    assert len(result.text) <= 3_000
+    assert result.text.startswith("### UNSTAGED CHANGES")
+    assert "+new small.py 0 1" in result.text
+    assert "diff --git a/huge.py b/huge.py" in result.text
+    assert "@@ -1,400 +1,400 @@" in result.text
+    assert "more lines elided)" in result.text
+
+
+def test_every_hunk_header_is_kept_and_bodies_elided():
+    diff = _file("a.py", 50, hunks=6)
+    result = truncate_diff(diff, budget=1_000)
+    assert len(result.text) <= 1_000
+    assert result.elided_hunks >= 5
+    assert result.text.count("@@ -") == 6
+    assert "... (+50 -50 lines elided)" in result.text
+
+
+def test_files_are_collapsed_when_headers_do_not_fit():
+    diff = "".join(_file(f"f{index}.py", 20, hunks=5) for index in range(10))
+    result = truncate_diff(diff, budget=1_500)
+    assert result.collapsed_files > 0
+    assert len(result.text) <= 1_500
+    assert "hunks elided)" in result.text
+    assert {file.path for file in parse_diff(result.text).files} <= {f"f{index}.py" for index in range(10)}
+
+
+def test_custom_measure_is_respected():
+    diff = _file("a.py", 200) + _file("b.py", 200)
+    result = truncate_diff(diff, budget=500, measure=_words)
+    assert result.was_truncated
+    assert _words(result.text) <= 500
+    assert "diff --git a/b.py b/b.py" in result.text
+
+
+def test_plain_text_is_cut_at_a_line_boundary():
+    text = "".join(f"line number {index}\n" for index in range(100))
+    cut, was_cut = truncate_text(text, budget=100)
+    assert was_cut
+    assert len(cut) <= 100
+    assert text.startswith(cut + "\n")
+    assert truncate_diff(text, budget=100).text == cut
+    assert truncate_text("short\n", budget=100) == ("short", False)
@@ -0,0 +1,52 @@
+import os
+import subprocess
+
+from app.git_diff_getter import MAX_CACHED_PATHS_PER_REPO, WorktreeCache
+
+
+def _repo(path):
+    path.mkdir()
+    subprocess.run(["git", "init", "-q", str(path)], check=True)
+    (path / "file.txt").write_text("one\n")
+    (path / "clean.txt").write_text("clean\n")
+    subprocess.run(["git", "-C", str(path), "add", "file.txt", "clean.txt"], check=True)
+    subprocess.run(
+        ["git", "-C", str(path), "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init"],
+        check=True,
+    )
+    (path / "file.txt").write_text("two\n")
+    # Files written within the fingerprint's timestamp granularity are never cached.
+    for name in ("file.txt", "clean.txt"):
+        os.utime(path / name, (0, 0))
+    subprocess.run(["git", "-C", str(path), "update-index", "-q", "--refresh"], check=False)
+    os.utime(path / ".git" / "index", (0, 0))
+    return path
+
+
+def test_path_map_is_bounded_lru(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    cache = WorktreeCache(max_repos=1)
+    spellings = [str(repo)] + [f"{repo}/{'./' * count}" for count in range(1, MAX_CACHED_PATHS_PER_REPO + 2)]
+    first = cache.get_diff(spellings[0])
+    for spelling in spellings[1:]:
+        assert cache.get_diff(spelling) is first
+    assert len(cache._dirs_by_path) == MAX_CACHED_PATHS_PER_REPO
+    assert spellings[0] not in cache._dirs_by_path
+    cache.put_output(spellings[-1], "key", first, "output")
+    assert cache.get_output(spellings[-1], "key") == "output"
+    assert cache.get_output(spellings[0], "key") is None
+
+
+def test_edit_to_a_clean_file_drops_the_entry(tmp_path):
+    repo = _repo(tmp_path / "repo")
+    cache = WorktreeCache()
+    first = cache.get_diff(str(repo))
+    assert cache.get_diff(str(repo)) is first
+    cache.put_output(str(repo), "key", first, "output")
+    assert cache.get_output(str(repo), "key") == "output"
+
+    (repo / "clean.txt").write_text("edited\n")
+    assert cache.get_output(str(repo), "key") is None
+    second = cache.get_diff(str(repo))
+    assert "+edited" in second.diff_text
+    assert "+edited" not in first.diff_text